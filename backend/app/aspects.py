@@ -0,0 +1,88 @@
+"""Vectorized aspect engine.
+
+Aspects are found from the full pairwise angular-distance matrix of a set of
+bodies, computed in one NumPy operation instead of a Python loop over pairs
+and aspect angles. The same function serves natal charts (one set of bodies
+against itself) and synastry/transits (one set against another).
+
+Orbs are configurable per aspect and, optionally, per planet. With planet
+orbs, a pair may deviate from the exact aspect by the mean of the two
+planets' orbs, capped by the aspect's own orb.
+"""
+from typing import Dict, List, Mapping, NamedTuple, Optional
+import numpy as np
+
+# Major aspects and their exact angles, in report order
+MAJOR_ASPECTS: Dict[float, str] = {
+    0: 'Conjunction',
+    60: 'Sextile',
+    90: 'Square',
+    120: 'Trine',
+    180: 'Opposition'
+}
+
+# Default orb (degrees) for each aspect angle
+DEFAULT_ASPECT_ORBS: Dict[float, float] = {angle: 6.0 for angle in MAJOR_ASPECTS}
+
+
+class Aspect(NamedTuple):
+    """One aspect between two bodies."""
+    body1: str
+    body2: str
+    aspect: str
+    angle: float       # exact aspect angle
+    separation: float  # shortest angular distance between the bodies
+    orb: float         # |separation - angle|
+
+
+def angular_distances(lons1: np.ndarray, lons2: np.ndarray) -> np.ndarray:
+    """Shortest angular distance (0-180°) between every pair of longitudes."""
+    diff = np.abs(lons1[:, None] - lons2[None, :]) % 360.0
+    return np.minimum(diff, 360.0 - diff)
+
+
+def find_aspects(
+    positions: Mapping[str, float],
+    other: Optional[Mapping[str, float]] = None,
+    aspects: Mapping[float, str] = MAJOR_ASPECTS,
+    aspect_orbs: Mapping[float, float] = DEFAULT_ASPECT_ORBS,
+    planet_orbs: Optional[Mapping[str, float]] = None
+) -> List[Aspect]:
+    """Find aspects between bodies given by absolute ecliptic longitude.
+
+    Without ``other``, every unordered pair within ``positions`` is checked.
+    With ``other``, each body in ``positions`` is checked against each body
+    in ``other`` (synastry, transits). Records are ordered by body1, body2
+    and then aspect angle.
+    """
+    names1 = list(positions)
+    names2 = names1 if other is None else list(other)
+    lons1 = np.fromiter(positions.values(), dtype=float, count=len(names1))
+    lons2 = lons1 if other is None else np.fromiter(other.values(), dtype=float, count=len(names2))
+
+    angles = np.fromiter(aspects, dtype=float, count=len(aspects))
+    names = list(aspects.values())
+    orbs = np.array([aspect_orbs[a] for a in aspects], dtype=float)
+
+    separation = angular_distances(lons1, lons2)
+    deviation = np.abs(separation[:, :, None] - angles[None, None, :])
+
+    allowed = np.broadcast_to(orbs, deviation.shape)
+    if planet_orbs is not None:
+        po1 = np.array([planet_orbs[n] for n in names1], dtype=float)
+        po2 = po1 if other is None else np.array([planet_orbs[n] for n in names2], dtype=float)
+        pair_orbs = (po1[:, None] + po2[None, :]) / 2
+        allowed = np.minimum(allowed, pair_orbs[:, :, None])
+
+    mask = deviation <= allowed
+    if other is None:
+        # Each unordered pair once, never a body with itself
+        mask &= np.triu(np.ones((len(names1), len(names1)), dtype=bool), k=1)[:, :, None]
+
+    return [
+        Aspect(
+            names1[i], names2[j], names[k], float(angles[k]),
+            float(separation[i, j]), float(deviation[i, j, k])
+        )
+        for i, j, k in zip(*np.nonzero(mask))
+    ]
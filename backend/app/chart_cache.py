@@ -0,0 +1,114 @@
+"""LRU + TTL memoization cache for computed charts.
+
+Charts only depend on the UTC minute, the place and the house options, so
+repeated requests for the same birth data (returning users, couples, family
+members born in the same city) can skip swisseph entirely.
+
+``interpretation_cache`` uses the same class for premium interpretations,
+keyed by language and ``charts.premium_fingerprint``. Those never go
+stale, so it has no expiry, only a size bound.
+
+Configuration (environment variables):
+
+- ``CHART_CACHE_SIZE``: maximum cached charts, ``0`` disables the cache
+  (default: 10000).
+- ``CHART_CACHE_TTL``: seconds a cached chart stays valid (default: 3600).
+- ``CHART_CACHE_PRECISION``: decimal places latitude/longitude are rounded
+  to when building keys (default: 4, roughly 11 m).
+- ``INTERPRETATION_CACHE_SIZE``: maximum cached premium interpretations,
+  ``0`` disables the cache (default: 10000).
+"""
+from typing import Any, Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime
+import math
+import os
+import threading
+import time
+
+
+class ChartCache:
+    """Thread-safe LRU cache with per-entry expiry and hit/miss counters."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600, precision: int = 4):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.precision = precision
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls) -> "ChartCache":
+        return cls(
+            max_entries=int(os.environ.get("CHART_CACHE_SIZE", "10000")),
+            ttl=float(os.environ.get("CHART_CACHE_TTL", "3600")),
+            precision=int(os.environ.get("CHART_CACHE_PRECISION", "4"))
+        )
+
+    def key(self, utc_dt: datetime, latitude: float, longitude: float, *options: Hashable) -> Tuple:
+        """Build a normalized key: UTC minute, rounded coordinates, options."""
+        return (
+            utc_dt.strftime("%Y-%m-%dT%H:%M"),
+            round(latitude, self.precision),
+            round(longitude, self.precision),
+        ) + options
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether ``key`` holds a live entry; not counted as a lookup."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": None if math.isinf(self.ttl) else self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+chart_cache = ChartCache.from_env()
+interpretation_cache = ChartCache(
+    max_entries=int(os.environ.get("INTERPRETATION_CACHE_SIZE", "10000")),
+    ttl=float("inf")
+)
@@ -0,0 +1,349 @@
+"""Chart computation helpers.
+
+Everything in this module is plain flatlib/swisseph work with no FastAPI
+dependency, so it can be imported and executed inside the chart worker
+processes (see ``app.compute``). Results are returned as plain, picklable
+values.
+
+A computed chart is a flat ``array('d')`` of positions (see the layout
+constants below) rather than a flatlib ``Chart``: it pickles cheaply between
+processes, stays small when stored, and is all the interpretation and the
+API response need.
+"""
+from typing import Dict, Iterator, Optional, Any, Sequence, Tuple
+from array import array
+from datetime import datetime, timedelta
+import math
+import threading
+import swisseph
+import flatlib
+from flatlib.datetime import Datetime
+from flatlib.geopos import GeoPos
+from flatlib.chart import Chart
+from flatlib import const
+from flatlib.ephem import swe
+
+from app.aspects import find_aspects
+from app.ephemeris_table import EphemerisTable, julian_day
+from app.interpretations import ASCENDANT, DEFAULT_LANGUAGE, catalog
+from app.solar_time import equation_of_time, offsets_from_eot
+
+# Classical planets reported in charts and interpretations
+CLASSICAL_PLANETS = ['Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn']
+SIGNS = const.LIST_SIGNS
+
+# House systems supported by the Swiss Ephemeris bindings
+HOUSE_SYSTEMS = list(swe.SWE_HOUSESYS)
+DEFAULT_HOUSE_SYSTEM = const.HOUSES_DEFAULT
+
+# House timing modes accepted by ``compute_chart``
+HOUSE_TIME_STANDARD = "standard"
+HOUSE_TIME_SOLAR = "solar"
+
+# Layout of the positions array produced by ``compute_chart``
+POS_UTC_SECONDS = 0    # UTC time of day, in seconds
+POS_SOLAR_OFFSET = 1   # true solar time minus UTC, in seconds
+POS_EOT_MINUTES = 2    # equation of time, in minutes
+POS_LON = 3            # 7 planet longitudes, CLASSICAL_PLANETS order
+POS_SPEED = 10         # 7 planet longitude speeds (degrees/day)
+POS_CUSPS = 17         # 12 house cusps
+POS_ASC = 29
+POS_MC = 30
+POSITIONS_SIZE = 31
+
+# flatlib starts a house 5° before its cusp (House._OFFSET)
+HOUSE_CUSP_OFFSET = -5.0
+
+# Swiss Ephemeris data files shipped with flatlib. flatlib sets this path
+# when imported, but swisseph keeps it per thread; other threads silently
+# fall back to the slower, less accurate Moshier ephemeris.
+EPHEMERIS_PATH = flatlib.PATH_RES + 'swefiles'
+_thread_state = threading.local()
+
+# Precomputed ephemeris used instead of swisseph for planets when set
+# (per process, see ``use_ephemeris_table``)
+_ephemeris_table: Optional[EphemerisTable] = None
+
+
+class ChartError(Exception):
+    """Chart computation failure that maps onto an HTTP error response.
+
+    ``HTTPException`` cannot be pickled, so worker processes raise this
+    instead and the engine translates it back into an ``HTTPException``.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def true_solar_offset(longitude: float, sun_lon: float) -> tuple[float, float]:
+    """Return (true solar time - UTC in seconds, equation of time in minutes)."""
+    eot_minutes = float(equation_of_time(sun_lon))
+    return float(offsets_from_eot(longitude, eot_minutes)), eot_minutes
+
+def solar_time_interpretation(solar_time: str, total_offset: float, eot_minutes: float) -> str:
+    return (
+        f"True Solar Time is {solar_time} "
+        f"({abs(total_offset / 60):.1f} minutes "
+        f"{'ahead of' if total_offset > 0 else 'behind'} standard time). "
+        f"Equation of time correction: {eot_minutes:.1f} minutes."
+    )
+
+def _format_seconds(seconds: float) -> str:
+    """Format seconds since midnight as HH:MM:SS (wrapping, truncating)."""
+    seconds = int(math.floor(seconds)) % 86400
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def solar_time_fields(positions: array) -> Dict[str, str]:
+    """Standard time, solar time and solar interpretation of a chart."""
+    utc_seconds = positions[POS_UTC_SECONDS]
+    total_offset = positions[POS_SOLAR_OFFSET]
+    solar_time = _format_seconds(utc_seconds + total_offset)
+    return {
+        "standard_time": _format_seconds(utc_seconds),
+        "solar_time": solar_time,
+        "solar_interpretation": solar_time_interpretation(
+            solar_time, total_offset, positions[POS_EOT_MINUTES]
+        )
+    }
+
+def _sign(lon: float) -> str:
+    return SIGNS[int(lon / 30)]
+
+def interpret_chart(
+    positions: array,
+    is_premium: bool = False,
+    language: str = DEFAULT_LANGUAGE
+) -> Dict[str, Optional[str]]:
+    """Generate chart interpretation in ``language`` (see ``app.interpretations``)."""
+    text = catalog(language)
+    placements = text.placements
+
+    # Basic interpretation - Sun, Moon, Ascendant
+    sun, moon, asc = positions[POS_LON], positions[POS_LON + 1], positions[POS_ASC]
+    basic = "\n".join((
+        placements[0][int(sun / 30)] % (sun % 30),
+        placements[1][int(moon / 30)] % (moon % 30),
+        placements[ASCENDANT][int(asc / 30)] % (asc % 30)
+    ))
+    if not is_premium:
+        return {"basic": basic, "premium": None}
+
+    # Premium interpretation - Classical planets only
+    lons = positions[POS_LON:POS_SPEED]
+    premium = [placements[body][int(lon / 30)] % (lon % 30) for body, lon in enumerate(lons)]
+
+    # Aspects between classical planets by absolute ecliptic longitude
+    aspects = text.aspects
+    for aspect in find_aspects(dict(zip(CLASSICAL_PLANETS, lons))):
+        premium.append(aspects[aspect.body1][aspect.body2][aspect.aspect] % aspect.orb)
+
+    return {"basic": basic, "premium": "\n".join(premium)}
+
+def premium_fingerprint(positions: array) -> bytes:
+    """Key for a chart's premium interpretation.
+
+    The premium text reads only the classical planets' longitudes, so
+    charts that agree on those share one interpretation whatever their
+    place, houses or time of day.
+    """
+    return positions[POS_LON:POS_SPEED].tobytes()
+
+def _flatlib_datetime(dt: datetime) -> Datetime:
+    """Convert a (UTC) datetime into a Flatlib date, to the minute."""
+    return Datetime(
+        f"{dt.year}/{dt.month:02d}/{dt.day:02d}",
+        f"{dt.hour:02d}:{dt.minute:02d}"
+    )
+
+def build_chart(
+    dt: datetime,
+    latitude: float,
+    longitude: float,
+    house_system: str = DEFAULT_HOUSE_SYSTEM
+) -> Chart:
+    """Compute one chart for the classical planets only."""
+    return Chart(
+        _flatlib_datetime(dt),
+        GeoPos(latitude, longitude),
+        hsys=house_system,
+        IDs=CLASSICAL_PLANETS
+    )
+
+def ensure_ephemeris_path() -> None:
+    """Point swisseph at ``EPHEMERIS_PATH`` once in the calling thread."""
+    if not getattr(_thread_state, "ephemeris_path_set", False):
+        swisseph.set_ephe_path(EPHEMERIS_PATH)
+        _thread_state.ephemeris_path_set = True
+
+def use_ephemeris_table(table: Optional[EphemerisTable]) -> None:
+    """Serve planet positions from ``table`` where it covers the date."""
+    global _ephemeris_table
+    _ephemeris_table = table
+
+def planet_positions(jd: float) -> Tuple[Sequence[float], Sequence[float]]:
+    """Longitudes and speeds of the classical planets at Julian day ``jd``."""
+    table = _ephemeris_table
+    if table is not None and table.covers(jd):
+        return table.lookup(jd)
+    ensure_ephemeris_path()
+    lons, speeds = [], []
+    for planet in CLASSICAL_PLANETS:
+        values, _ = swisseph.calc_ut(jd, swe.SWE_OBJECTS[planet])
+        lons.append(values[0])
+        speeds.append(values[3])
+    return lons, speeds
+
+def ephemeris_series(
+    start: datetime,
+    step: timedelta,
+    count: int
+) -> Iterator[Tuple[datetime, Sequence[float], Sequence[float]]]:
+    """Yield ``(utc_dt, longitudes, speeds)`` for ``count`` steps from ``start``.
+
+    A generator, so callers can stream arbitrarily long ranges without
+    holding the series in memory.
+    """
+    start_jd = julian_day(start)
+    step_days = step / timedelta(days=1)
+    for n in range(count):
+        # Offsets from the start, so rounding does not accumulate
+        lons, speeds = planet_positions(start_jd + n * step_days)
+        yield start + n * step, lons, speeds
+
+def ephemeris_positions(
+    dt: datetime,
+    latitude: float,
+    longitude: float,
+    house_system: str = DEFAULT_HOUSE_SYSTEM
+) -> Tuple[Sequence[float], Sequence[float], Sequence[float], float, float]:
+    """Planet longitudes and speeds, house cusps, Asc and MC at ``dt``.
+
+    Planets come from the precomputed ephemeris table when one is loaded
+    and covers the date; houses only need sidereal time, so they are taken
+    straight from swisseph without building a flatlib ``Chart``.
+    """
+    ensure_ephemeris_path()
+    table = _ephemeris_table
+    if table is not None:
+        # Same minute resolution as the flatlib chart below
+        jd = julian_day(dt.replace(second=0, microsecond=0))
+        if table.covers(jd):
+            lons, speeds = table.lookup(jd)
+            cusps, ascmc = swisseph.houses(
+                jd, latitude, longitude, swe.SWE_HOUSESYS[house_system]
+            )
+            return lons, speeds, cusps[:12], ascmc[0], ascmc[1]
+
+    chart = build_chart(dt, latitude, longitude, house_system)
+    objects = [chart.get(planet) for planet in CLASSICAL_PLANETS]
+    return (
+        [obj.lon for obj in objects],
+        [obj.lonspeed for obj in objects],
+        [house.lon for house in chart.houses],
+        chart.get(const.ASC).lon,
+        chart.get(const.MC).lon
+    )
+
+def house_positions(
+    dt: datetime,
+    latitude: float,
+    longitude: float,
+    house_system: str = DEFAULT_HOUSE_SYSTEM
+) -> Tuple[Sequence[float], float, float]:
+    """House cusps, Asc and MC for the sidereal time at ``dt`` (UTC)."""
+    ensure_ephemeris_path()
+    cusps, ascmc = swisseph.houses(
+        julian_day(dt), latitude, longitude, swe.SWE_HOUSESYS[house_system]
+    )
+    return cusps[:12], ascmc[0], ascmc[1]
+
+def house_of(positions: array, lon: float) -> int:
+    """House number (1-12) containing a longitude, as flatlib assigns it."""
+    cusps = positions[POS_CUSPS:POS_CUSPS + 12]
+    for i in range(12):
+        size = (cusps[(i + 1) % 12] - cusps[i]) % 360
+        if (lon - (cusps[i] + HOUSE_CUSP_OFFSET)) % 360 < size:
+            return i + 1
+    return 1  # Default to house 1
+
+def planets_data(positions: array) -> Dict[str, Dict[str, Any]]:
+    """Planet data for the API response."""
+    planets = {}
+    for i, planet in enumerate(CLASSICAL_PLANETS):
+        lon = positions[POS_LON + i]
+        planets[planet] = {
+            "sign": _sign(lon),
+            "position": lon % 30,
+            "house": house_of(positions, lon)
+        }
+    return planets
+
+def houses_data(positions: array) -> Dict[str, Dict[str, Any]]:
+    """House data for the API response."""
+    houses = {}
+    for i in range(12):
+        lon = positions[POS_CUSPS + i]
+        houses[str(i + 1)] = {
+            "sign": _sign(lon),
+            "position": lon
+        }
+    return houses
+
+def compute_chart(
+    utc_dt: datetime,
+    latitude: float,
+    longitude: float,
+    house_time: str = HOUSE_TIME_STANDARD,
+    house_system: str = DEFAULT_HOUSE_SYSTEM
+) -> array:
+    """Compute a chart's positions array.
+
+    Runs inside a chart worker; ``utc_dt`` must already be converted to UTC.
+    The pipeline has three stages, and each chart is computed at most once:
+
+    1. planets and houses for the UTC instant;
+    2. true solar time correction, from the Sun longitude of stage 1;
+    3. solar houses, only when ``house_time`` is ``"solar"``.
+
+    Solar houses keep the planets of stage 1 and are cast as if the local
+    sundial time were clock time: the sidereal time is advanced by the
+    equation of time, so the angles move by about a degree for every four
+    minutes of it. Longitude is already part of the house calculation and
+    is not applied again.
+    """
+    # Stage 1: chart for the UTC instant
+    lons, speeds, cusps, asc, mc = ephemeris_positions(utc_dt, latitude, longitude, house_system)
+
+    # Stage 2: true solar time from the UTC chart's Sun
+    try:
+        total_offset, eot_minutes = true_solar_offset(longitude, float(lons[0]))
+    except Exception as e:
+        raise ChartError(
+            status_code=500,
+            detail=f"Failed to calculate true solar time: {str(e)}"
+        )
+
+    # Stage 3: houses for apparent rather than mean solar time, if requested
+    if house_time == HOUSE_TIME_SOLAR:
+        cusps, asc, mc = house_positions(
+            utc_dt + timedelta(minutes=eot_minutes), latitude, longitude, house_system
+        )
+
+    positions = array('d', bytes(8 * POSITIONS_SIZE))
+    positions[POS_UTC_SECONDS] = utc_dt.hour * 3600 + utc_dt.minute * 60 + utc_dt.second
+    positions[POS_SOLAR_OFFSET] = total_offset
+    positions[POS_EOT_MINUTES] = eot_minutes
+    positions[POS_LON:POS_LON + 7] = array('d', lons)
+    positions[POS_SPEED:POS_SPEED + 7] = array('d', speeds)
+    positions[POS_CUSPS:POS_CUSPS + 12] = array('d', cusps)
+    positions[POS_ASC] = asc
+    positions[POS_MC] = mc
+    return positions
+
+def warm_up() -> None:
+    """Load the ephemeris files by computing a throwaway chart."""
+    build_chart(datetime(2000, 1, 1, 12), 0, 0)
+    compute_chart(datetime(2000, 1, 1, 12), 0, 0)
@@ -0,0 +1,193 @@
+"""Process-pool compute engine for chart work.
+
+flatlib/swisseph calls are CPU bound and hold the GIL, so running them
+directly inside an ``async def`` handler stalls the whole event loop. The
+``ChartEngine`` ships them to a pool of warm worker processes instead and
+bounds how much work may be queued at once.
+
+Configuration (environment variables):
+
+- ``CHART_WORKERS``: number of worker processes (default: CPU count).
+  ``0`` runs chart work on a single background thread instead.
+- ``CHART_MAX_PENDING``: maximum queued + running jobs before new requests
+  are rejected with 503 (default: ``4 * workers``).
+- ``CHART_TIMEOUT``: seconds to wait for a single job before answering
+  504 (default: 10).
+- ``CHART_MP_CONTEXT``: multiprocessing start method (default: spawn).
+"""
+from typing import Any, Callable, List, Optional, Sequence
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+from fastapi import HTTPException
+
+from app import charts, ephemeris_table
+from app.metrics import metrics
+
+
+def _init_worker() -> None:
+    """Worker initializer: load the ephemeris before the first request."""
+    charts.use_ephemeris_table(ephemeris_table.load_from_env())
+    charts.warm_up()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _run_chunk(fn: Callable[..., Any], arg_list: Sequence[tuple]) -> List[Any]:
+    """Apply ``fn`` to each argument tuple, capturing failures per item."""
+    results = []
+    for args in arg_list:
+        try:
+            results.append(fn(*args))
+        except charts.ChartError as e:
+            results.append(e)
+        except Exception as e:
+            results.append(charts.ChartError(status_code=500, detail=str(e)))
+    return results
+
+
+class ChartEngine:
+    """Runs chart computations on a bounded, warm process pool."""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        timeout: float = 10.0,
+        mp_context: str = "spawn"
+    ):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending or 4 * max(self.workers, 1)
+        self.timeout = timeout
+        self.mp_context = mp_context
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @classmethod
+    def from_env(cls) -> "ChartEngine":
+        workers = os.environ.get("CHART_WORKERS")
+        max_pending = os.environ.get("CHART_MAX_PENDING")
+        return cls(
+            workers=int(workers) if workers else None,
+            max_pending=int(max_pending) if max_pending else None,
+            timeout=float(os.environ.get("CHART_TIMEOUT", "10")),
+            mp_context=os.environ.get("CHART_MP_CONTEXT", "spawn")
+        )
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        """Create the pool and wait until every worker is warm."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            if self.workers == 0:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=1,
+                    initializer=_init_worker
+                )
+            else:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.mp_context),
+                    initializer=_init_worker
+                )
+            executor = self._executor
+        # Workers are spawned lazily; one ping per worker forces them all up
+        # (and through the initializer) before real traffic arrives.
+        pings = [executor.submit(_ping) for _ in range(max(self.workers, 1))]
+        concurrent.futures.wait(pings)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)`` on the pool and return its result.
+
+        ``fn`` and its arguments must be picklable. Raises 503 when the
+        queue is full and 504 when the job exceeds the timeout.
+        """
+        if self._executor is None:
+            await asyncio.to_thread(self.start)
+
+        # Metrics name batches after the function they run
+        name, items = (args[0].__name__, len(args[1])) if fn is _run_chunk else (fn.__name__, 1)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.observe_job(name, None, items, "rejected")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Chart engine is busy, please retry",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+
+        # The slot is released when the job really finishes, not when the
+        # caller gives up, so timed-out jobs still count against the queue.
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        began = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            future.cancel()
+            raise HTTPException(status_code=504, detail="Chart computation timed out")
+        except charts.ChartError as e:
+            outcome = "error"
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            metrics.observe_job(name, time.perf_counter() - began, items, outcome)
+
+    async def map(self, fn: Callable[..., Any], arg_list: Sequence[tuple]) -> List[Any]:
+        """Run ``fn`` over many argument tuples, spread across the workers.
+
+        Returns one entry per argument tuple, in order: either the result or
+        a ``ChartError`` describing why that item failed. Each chunk takes a
+        single queue slot and is subject to the usual timeout.
+        """
+        if not arg_list:
+            return []
+        chunk_count = min(len(arg_list), max(self.workers, 1))
+        chunk_size = -(-len(arg_list) // chunk_count)
+        chunks = [arg_list[i:i + chunk_size] for i in range(0, len(arg_list), chunk_size)]
+        outcomes = await asyncio.gather(
+            *(self.run(_run_chunk, fn, chunk) for chunk in chunks),
+            return_exceptions=True
+        )
+        results: List[Any] = []
+        for chunk, outcome in zip(chunks, outcomes):
+            if isinstance(outcome, HTTPException):
+                error = charts.ChartError(status_code=outcome.status_code, detail=outcome.detail)
+                results.extend(error for _ in chunk)
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                results.extend(outcome)
+        return results
+
+    def _release(self, future: Optional[concurrent.futures.Future]) -> None:
+        with self._lock:
+            self._pending -= 1
+
+
+chart_engine = ChartEngine.from_env()
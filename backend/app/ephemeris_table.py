@@ -0,0 +1,183 @@
+"""Precomputed, memory-mapped ephemeris table for the classical planets.
+
+An offline build step samples the Swiss Ephemeris for the Sun through
+Saturn over a date range and writes the longitudes and longitude speeds
+into a ``.npy`` array, plus a small ``.json`` sidecar with the range, step
+and measured interpolation error::
+
+    python -m app.ephemeris_table build --out data/ephemeris.npy \\
+        --start 1900-01-01 --end 2100-01-01 --step-hours 24
+
+At runtime the table is opened with ``mmap_mode='r'``, so every chart
+worker maps the same file and shares it through the OS page cache instead
+of holding its own copy. Positions between samples come from cubic Hermite
+interpolation on (longitude, speed), which stays far below an arc-second
+for the Moon at a one-day step.
+"""
+from typing import List, Optional, Tuple
+from datetime import datetime, timezone
+import argparse
+import json
+import logging
+import os
+import numpy as np
+import swisseph
+from flatlib.ephem import swe  # importing flatlib.ephem sets the swisseph file path
+
+logger = logging.getLogger(__name__)
+
+# Bodies stored in the table, in CLASSICAL_PLANETS order
+TABLE_BODIES = ['Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn']
+
+# Default accuracy (degrees) a table must reach to replace swisseph
+DEFAULT_TOLERANCE = 0.001
+
+
+def julian_day(dt: datetime) -> float:
+    """Julian day (UT) of a UTC datetime."""
+    hour = dt.hour + dt.minute / 60 + dt.second / 3600 + dt.microsecond / 3.6e9
+    return swisseph.julday(dt.year, dt.month, dt.day, hour)
+
+
+def sample(jd: float) -> np.ndarray:
+    """Exact (longitude, speed) rows for every table body at ``jd``."""
+    rows = np.empty((len(TABLE_BODIES), 2))
+    for i, body in enumerate(TABLE_BODIES):
+        values, _ = swisseph.calc_ut(jd, swe.SWE_OBJECTS[body])
+        rows[i] = values[0], values[3]
+    return rows
+
+
+class EphemerisTable:
+    """Read-only view over a built table, with interpolating lookups."""
+
+    def __init__(self, data: np.ndarray, start_jd: float, step: float, max_error: float):
+        self.data = data  # shape (samples, bodies, 2): longitude, speed
+        self._rows = data.view(np.ndarray)  # memmap indexing is slow
+        self.start_jd = start_jd
+        self.step = step  # days between samples
+        self.max_error = max_error  # degrees, measured at build time
+        self.end_jd = start_jd + step * (len(data) - 1)
+
+    @classmethod
+    def load(cls, path: str) -> "EphemerisTable":
+        with open(_meta_path(path)) as f:
+            meta = json.load(f)
+        if meta["bodies"] != TABLE_BODIES:
+            raise ValueError(f"Ephemeris table {path} has unexpected bodies {meta['bodies']}")
+        data = np.load(path, mmap_mode='r')
+        return cls(data, meta["start_jd"], meta["step"], meta["max_error"])
+
+    def covers(self, jd: float) -> bool:
+        return self.start_jd <= jd < self.end_jd
+
+    def lookup(self, jd: float) -> Tuple[List[float], List[float]]:
+        """Interpolated (longitudes, speeds) of all bodies at ``jd``."""
+        step = self.step
+        x = (jd - self.start_jd) / step
+        i = int(x)
+        t = x - i
+        # Seven bodies are too few for NumPy to pay off; plain floats are
+        # several times faster than array arithmetic here
+        before, after = self._rows[i:i + 2].tolist()
+
+        # Cubic Hermite basis and its derivative
+        t2, t3 = t * t, t * t * t
+        h00, h10, h01, h11 = 2 * t3 - 3 * t2 + 1, t3 - 2 * t2 + t, -2 * t3 + 3 * t2, t3 - t2
+        d00, d10, d01, d11 = 6 * t2 - 6 * t, 3 * t2 - 4 * t + 1, -6 * t2 + 6 * t, 3 * t2 - 2 * t
+
+        lons, speeds = [], []
+        for (p0, v0), (p1, v1) in zip(before, after):
+            # Unwrap across 0° Aries; no body moves 180° within one step
+            p1 = p0 + (p1 - p0 + 180.0) % 360.0 - 180.0
+            m0, m1 = v0 * step, v1 * step
+            lon = (h00 * p0 + h10 * m0 + h01 * p1 + h11 * m1) % 360.0
+            # A hair below 0° wraps to exactly 360.0 after rounding
+            lons.append(lon - 360.0 if lon >= 360.0 else lon)
+            speeds.append((d00 * p0 + d10 * m0 + d01 * p1 + d11 * m1) / step)
+        return lons, speeds
+
+
+def build(path: str, start: datetime, end: datetime, step_hours: float = 24.0) -> EphemerisTable:
+    """Sample swisseph over ``[start, end]`` and write the table to ``path``."""
+    step = step_hours / 24.0
+    start_jd = julian_day(start)
+    count = int((julian_day(end) - start_jd) / step) + 2
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    data = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64,
+                                     shape=(count, len(TABLE_BODIES), 2))
+    for n in range(count):
+        data[n] = sample(start_jd + n * step)
+    data.flush()
+
+    # Measure the interpolation error halfway between samples, where it
+    # peaks, on an evenly spread subset of intervals
+    table = EphemerisTable(data, start_jd, step, max_error=0.0)
+    max_error = 0.0
+    for n in np.linspace(0, count - 2, num=min(count - 1, 2000), dtype=int):
+        jd = start_jd + (n + 0.5) * step
+        diff = np.abs(table.lookup(jd)[0] - sample(jd)[:, 0])
+        max_error = max(max_error, float(np.max(np.minimum(diff, 360.0 - diff))))
+
+    with open(_meta_path(path), "w") as f:
+        json.dump({
+            "bodies": TABLE_BODIES,
+            "start_jd": start_jd,
+            "step": step,
+            "samples": count,
+            "max_error": max_error,
+            "start": start.isoformat(),
+            "end": end.isoformat()
+        }, f, indent=2)
+    return EphemerisTable.load(path)
+
+
+def load_from_env() -> Optional[EphemerisTable]:
+    """Load the table named by ``EPHEMERIS_TABLE`` if it is accurate enough.
+
+    Returns None when no table is configured, or, with a warning, when its
+    measured error exceeds ``EPHEMERIS_TOLERANCE`` degrees.
+    """
+    path = os.environ.get("EPHEMERIS_TABLE")
+    if not path:
+        return None
+    table = EphemerisTable.load(path)
+    tolerance = float(os.environ.get("EPHEMERIS_TOLERANCE", DEFAULT_TOLERANCE))
+    if table.max_error > tolerance:
+        logger.warning(
+            "Ignoring ephemeris table %s: its error of %g° exceeds EPHEMERIS_TOLERANCE (%g°)",
+            path, table.max_error, tolerance
+        )
+        return None
+    return table
+
+
+def _meta_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _parse_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the classical-planet ephemeris table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build")
+    build_parser.add_argument("--out", required=True, help="Output .npy path")
+    build_parser.add_argument("--start", type=_parse_date, default=_parse_date("1900-01-01"))
+    build_parser.add_argument("--end", type=_parse_date, default=_parse_date("2100-01-01"))
+    build_parser.add_argument("--step-hours", type=float, default=24.0)
+    args = parser.parse_args()
+
+    table = build(args.out, args.start, args.end, args.step_hours)
+    print(
+        f"Wrote {len(table.data)} samples to {args.out} "
+        f"({table.data.nbytes / 1e6:.1f} MB), max interpolation error "
+        f"{table.max_error * 3600:.4f} arc-seconds"
+    )
+
+
+if __name__ == "__main__":
+    main()
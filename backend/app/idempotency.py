@@ -0,0 +1,168 @@
+"""``Idempotency-Key`` support for endpoints that charge users.
+
+Clients retry purchases and premium unlocks after timeouts. When a request
+carries an ``Idempotency-Key`` header, the first request with that key runs
+the handler and its outcome (the response body, or a 4xx error) is kept
+for ``IDEMPOTENCY_TTL`` seconds; retries with the same key get that outcome
+back without running the handler again. A duplicate that arrives while the
+first request is still running waits for it. Keys are scoped to the user
+the request acts for, so users that pick the same key never see each
+other's outcomes. Reusing a key for a different request of the same user
+(another path or body) is rejected with 422. Server errors (5xx) are not
+kept, so a retry after one runs the handler again.
+
+The cache lives in this process, like ``chart_cache``: with several
+workers, a retry is only recognised by the worker that served the first
+attempt unless requests are routed by key.
+
+Configuration (environment variables):
+
+- ``IDEMPOTENCY_CACHE_SIZE``: maximum stored outcomes (default: 10000).
+- ``IDEMPOTENCY_TTL``: seconds an outcome is kept (default: 86400).
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import Future
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+ScopedKey = Tuple[str, str]  # (user_id, Idempotency-Key)
+
+
+def fingerprint(*parts: Any) -> str:
+    """Digest of what identifies a request: path, parameters and body."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyCache:
+    """Bounded LRU of request outcomes by ``(user_id, key)``, with per-entry expiry.
+
+    Requests in flight are tracked with thread-safe futures, so duplicates
+    can wait for each other from any thread or event loop.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (user_id, key) -> (expires_at, fingerprint, status_code, body or error detail)
+        self._entries: "OrderedDict[ScopedKey, Tuple[float, str, int, Any]]" = OrderedDict()
+        self._running: Dict[ScopedKey, Tuple[str, Future]] = {}  # (user_id, key) -> (fingerprint, done)
+        self._lock = threading.Lock()
+        self.replays = 0
+        self.waits = 0
+        self.conflicts = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "IdempotencyCache":
+        return cls(
+            max_entries=int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000")),
+            ttl=float(os.environ.get("IDEMPOTENCY_TTL", "86400"))
+        )
+
+    async def run(
+        self,
+        user_id: str,
+        key: str,
+        request_fingerprint: str,
+        handler: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """Run ``handler`` once per user and key; returns ``(body, replayed)``.
+
+        A kept 4xx outcome is raised again as ``HTTPException``.
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+        key = (user_id, key)
+        while True:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    self._check(entry[1], request_fingerprint)
+                    self.replays += 1
+                    _, _, status_code, body = entry
+                    if status_code >= 400:
+                        raise HTTPException(
+                            status_code=status_code, detail=body, headers={REPLAYED_HEADER: "true"}
+                        )
+                    return body, True
+                running = self._running.get(key)
+                if running is None:
+                    done: Future = Future()
+                    self._running[key] = (request_fingerprint, done)
+                    break
+                self._check(running[0], request_fingerprint)
+                self.waits += 1
+            # Wait for the first request, then look again: it either kept an
+            # outcome or failed with a 5xx, and then this request runs instead.
+            # Shielded so a client that gives up does not cancel the shared future.
+            await asyncio.shield(asyncio.wrap_future(running[1]))
+
+        try:
+            body = await handler()
+        except HTTPException as e:
+            if e.status_code < 500:
+                self._keep(key, request_fingerprint, e.status_code, e.detail)
+            raise
+        else:
+            self._keep(key, request_fingerprint, 200, body)
+            return body, False
+        finally:
+            with self._lock:
+                del self._running[key]
+            done.set_result(None)
+
+    def _lookup(self, key: ScopedKey) -> Optional[Tuple[float, str, int, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _check(self, stored: str, request_fingerprint: str) -> None:
+        if stored != request_fingerprint:
+            self.conflicts += 1
+            raise HTTPException(
+                status_code=422, detail="Idempotency-Key was already used for a different request"
+            )
+
+    def _keep(self, key: ScopedKey, request_fingerprint: str, status_code: int, body: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, request_fingerprint, status_code, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "in_flight": len(self._running),
+            "replays": self.replays,
+            "waits": self.waits,
+            "conflicts": self.conflicts,
+            "evictions": self.evictions
+        }
+
+
+idempotency_cache = IdempotencyCache.from_env()
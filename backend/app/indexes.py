@@ -0,0 +1,68 @@
+"""Per-user ordered indexes for keyset (cursor) pagination.
+
+Each user's readings and transactions are kept sorted by
+``(created_at, id)``. A page is two binary searches plus a slice, so its
+cost depends on the page size, not on how many rows the user has.
+"""
+from typing import Any, Generic, List, NamedTuple, Optional, Tuple, TypeVar
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+V = TypeVar("V")
+IndexKey = Tuple[datetime, str]  # (created_at, row id)
+
+
+class IndexPage(NamedTuple):
+    keys: List[IndexKey]
+    values: List[Any]
+    more_before: bool  # rows exist before the first key
+    more_after: bool   # rows exist after the last key
+
+
+class OrderedIndex(Generic[V]):
+    """Values sorted by ``(created_at, id)`` keys."""
+
+    __slots__ = ("keys", "values")
+
+    def __init__(self):
+        self.keys: List[IndexKey] = []
+        self.values: List[V] = []
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def add(self, key: IndexKey, value: V) -> None:
+        keys = self.keys
+        # Rows are created in time order, so this is nearly always an append
+        if not keys or keys[-1] <= key:
+            keys.append(key)
+            self.values.append(value)
+        else:
+            i = bisect_right(keys, key)
+            keys.insert(i, key)
+            self.values.insert(i, value)
+
+    def page(
+        self,
+        limit: Optional[int] = None,
+        before: Optional[IndexKey] = None,
+        after: Optional[IndexKey] = None
+    ) -> IndexPage:
+        """Up to ``limit`` values strictly between ``after`` and ``before``, oldest first.
+
+        With only ``before`` the page ends just before it (paging
+        backwards); otherwise it starts just after ``after``, or at the
+        oldest row.
+        """
+        lo = 0 if after is None else bisect_right(self.keys, after)
+        hi = len(self.keys) if before is None else bisect_left(self.keys, before)
+        hi = max(lo, hi)
+        if limit is not None:
+            if before is not None and after is None:
+                lo = max(lo, hi - limit)
+            else:
+                hi = min(hi, lo + limit)
+        return IndexPage(self.keys[lo:hi], self.values[lo:hi], lo > 0, hi < len(self.keys))
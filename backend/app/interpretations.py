@@ -0,0 +1,85 @@
+"""Interpretation text in every supported language.
+
+Each language is a table of whole-line ``%`` templates, rendered once at
+import with the body, sign and aspect names already in place:
+
+- ``placements[body][sign]`` -> ``"Sun in Capricorn (%.1f°)"``, where the
+  body code is the index in ``BODIES`` (then ``ASCENDANT``) and the sign
+  code is ``int(lon / 30)``;
+- ``aspects[body1][body2][aspect]`` -> ``"Sun-Moon: Square (%.1f°)"``, by the
+  names ``app.aspects.find_aspects`` reports.
+
+A line is then one lookup and one ``%`` with its degrees, which is cheaper
+than the f-strings it replaced (``benchmarks/bench_interpretations.py``).
+The English table reproduces their output exactly.
+"""
+from typing import Dict, Tuple
+
+from flatlib import const
+
+from app.aspects import MAJOR_ASPECTS
+
+LANGUAGES = ("en", "zh")
+DEFAULT_LANGUAGE = "en"
+
+# Body codes: the classical planets in ``app.charts.CLASSICAL_PLANETS`` order,
+# then the Ascendant
+BODIES = (const.SUN, const.MOON, const.MERCURY, const.VENUS, const.MARS, const.JUPITER, const.SATURN)
+ASCENDANT = len(BODIES)
+
+# Source text. English matches the names used everywhere else in the API.
+TEXT = {
+    "en": {
+        "bodies": list(BODIES) + ["Ascendant"],
+        "signs": list(const.LIST_SIGNS),
+        "aspects": list(MAJOR_ASPECTS.values()),
+        "placement": "{body} in {sign} (%.1f°)",
+        "aspect": "{body1}-{body2}: {aspect} (%.1f°)"
+    },
+    "zh": {
+        "bodies": ["太阳", "月亮", "水星", "金星", "火星", "木星", "土星", "上升点"],
+        "signs": [
+            "白羊座", "金牛座", "双子座", "巨蟹座", "狮子座", "处女座",
+            "天秤座", "天蝎座", "射手座", "摩羯座", "水瓶座", "双鱼座"
+        ],
+        "aspects": ["合相", "六分相", "四分相", "三分相", "对分相"],
+        "placement": "{body}落在{sign}（%.1f°）",
+        "aspect": "{body1}-{body2}：{aspect}（%.1f°）"
+    }
+}
+
+
+class Catalog:
+    """The line templates of one language."""
+
+    __slots__ = ("language", "placements", "aspects")
+
+    def __init__(self, language: str):
+        text = TEXT[language]
+        self.language = language
+        # [body][sign] -> "Sun in Aries (%.1f°)"
+        self.placements: Tuple[Tuple[str, ...], ...] = tuple(
+            tuple(text["placement"].format(body=body, sign=sign) for sign in text["signs"])
+            for body in text["bodies"]
+        )
+        # [body1][body2][aspect], by English name -> "Sun-Moon: Square (%.1f°)"
+        names = dict(zip(BODIES, text["bodies"]))
+        aspect_names = dict(zip(MAJOR_ASPECTS.values(), text["aspects"]))
+        self.aspects: Dict[str, Dict[str, Dict[str, str]]] = {
+            body1: {
+                body2: {
+                    aspect: text["aspect"].format(body1=names[body1], body2=names[body2], aspect=name)
+                    for aspect, name in aspect_names.items()
+                }
+                for body2 in BODIES
+            }
+            for body1 in BODIES
+        }
+
+
+def catalog(language: str) -> Catalog:
+    """The catalog for ``language``, or the default one."""
+    return CATALOGS.get(language) or CATALOGS[DEFAULT_LANGUAGE]
+
+
+CATALOGS: Dict[str, Catalog] = {language: Catalog(language) for language in LANGUAGES}
@@ -1,17 +1,48 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from pydantic import BaseModel, Field, ValidationError
+from typing import Annotated, AsyncIterator, Awaitable, Callable, List, Optional, Dict, Any, Literal
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+import base64
+import json
 import uuid
-import math
+import numpy as np
 import pytz
-from flatlib.datetime import Datetime
-from flatlib.geopos import GeoPos
-from flatlib.chart import Chart
-from flatlib import const
 
-app = FastAPI()
+from app import charts, ephemeris_table
+from app.charts import (
+    CLASSICAL_PLANETS, DEFAULT_HOUSE_SYSTEM, HOUSE_SYSTEMS, SIGNS, ChartError,
+    compute_chart, ephemeris_series, interpret_chart, premium_fingerprint
+)
+from app.chart_cache import chart_cache, interpretation_cache
+from app.idempotency import REPLAYED_HEADER, fingerprint, idempotency_cache
+from app.indexes import IndexKey, IndexPage
+from app.interpretations import DEFAULT_LANGUAGE, LANGUAGES
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Gauge, MetricsMiddleware, metrics
+from app.profiling import TOKEN_HEADER as PROFILE_TOKEN_HEADER, CapturedProfile, ProfilingMiddleware, profiler
+from app.records import RESPONSE_FIELDS, ChartRecord
+from app.response_cache import etag_matches, json_bytes, response_cache
+from app.compute import chart_engine
+from app.revenue import DAY, HOUR, RevenueBucket
+from app.storage import MemoryStorage, create_storage
+from app.solar_time import solar_offsets, solar_offsets_from_table
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the chart workers before accepting traffic
+    chart_engine.start()
+    # /ephemeris streams from this process, so it maps the table as well
+    charts.use_ephemeris_table(ephemeris_table.load_from_env())
+    await storage.open()
+    yield
+    await storage.close()
+    chart_engine.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Disable CORS. Do not remove this for full-stack development.
 app.add_middleware(
@@ -20,44 +51,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    # Page cursors, idempotent replays, cached responses
+    expose_headers=["X-Prev-Cursor", "X-Next-Cursor", REPLAYED_HEADER, "ETag"],
 )
+# Per-route latency and status counts for /metrics
+app.add_middleware(MetricsMiddleware)
+# Opt-in profiles of sampled or token-marked requests for /debug/profiles
+app.add_middleware(ProfilingMiddleware)
 
 # Constants
 PREMIUM_UNLOCK_COST = 2000  # Virtual currency cost to unlock premium interpretation
+CHART_BATCH_LIMIT = 1000  # Maximum charts per /charts/batch request
+SOLAR_TIME_BATCH_LIMIT = 10000  # Maximum instants per /solar-time request
+EPHEMERIS_STREAM_LIMIT = 200000  # Maximum lines per /ephemeris response
+EPHEMERIS_CHUNK_LINES = 256  # NDJSON lines per streamed chunk
+PAGE_SIZE_LIMIT = 1000  # Maximum rows per page of a paginated listing
+EXPORT_CHUNK_ROWS = 256  # NDJSON rows per streamed chunk of an export
 
-# Initialize in-memory database
-db = {
-    "users": {
-        "test_user_123": {  # Test user for development
-            "id": "test_user_123",
-            "username": "Test User",
-            "balance": 5000,  # Give test user enough balance for premium features
-            "experience": 0,
-            "purchased_products": [],
-            "language": "en"
-        }
-    },
-    "transactions": [],
-    "revenue": [],
-    "products": {
-        "1": {
-            "id": "1",
-            "name": "完整韦特牌组",
-            "description": "包含所有78张韦特牌的完整牌组",
-            "price": 99,
-            "image": "🎴"
-        },
-        "2": {
-            "id": "2",
-            "name": "专业牌阵解读",
-            "description": "解锁更多专业牌阵和详细解读",
-            "price": 49,
-            "image": "📚"
-        }
-    },
-    "charts": {},  # Store chart data with chart_id as key
-    "readings": {}
-}
+# Storage backend, chosen by STORAGE_URL (see app.storage)
+storage = create_storage()
+# Tables of the in-memory backend, which the tests reset directly
+db = storage.db if isinstance(storage, MemoryStorage) else {}
 
 # Chart-related models
 from pydantic import validator
@@ -68,6 +82,18 @@ class ChartRequest(BaseModel):
     latitude: float = Field(..., ge=-90, le=90, description="Birth place latitude (-90 to 90)")
     longitude: float = Field(..., ge=-180, le=180, description="Birth place longitude (-180 to 180)")
     timezone: str = Field(..., description="Timezone name (e.g., 'America/New_York')")
+    house_time: Literal["standard", "solar"] = Field(
+        default="standard",
+        description="Cast houses for standard (clock) time or true solar time"
+    )
+    house_system: str = Field(
+        default=DEFAULT_HOUSE_SYSTEM,
+        description="Flatlib house system name (e.g., 'Placidus')"
+    )
+    language: str = Field(
+        default=DEFAULT_LANGUAGE,
+        description="Language of the interpretations (en/zh)"
+    )
 
     @validator('timezone')
     def validate_timezone(cls, v):
@@ -77,6 +103,18 @@ class ChartRequest(BaseModel):
         except pytz.exceptions.UnknownTimeZoneError:
             raise ValueError(f"Invalid timezone: {v}")
 
+    @validator('house_system')
+    def validate_house_system(cls, v):
+        if v not in HOUSE_SYSTEMS:
+            raise ValueError(f"Invalid house system: {v}")
+        return v
+
+    @validator('language')
+    def validate_language(cls, v):
+        if v not in LANGUAGES:
+            raise ValueError(f"Invalid language: {v}")
+        return v
+
     @validator('birth_date')
     def validate_birth_date(cls, v):
         try:
@@ -107,112 +145,14 @@ class ChartResponse(BaseModel):
     standard_time: str
     solar_time: str
     solar_interpretation: str
+    house_time: str = "standard"
+    house_system: str = DEFAULT_HOUSE_SYSTEM
 
 class ChartUnlockRequest(BaseModel):
     user_id: str = Field(..., description="User ID to charge for premium unlock")
 
-def calculate_true_solar_time(dt: datetime, longitude: float, chart: Chart) -> tuple[datetime, str]:
-    """Calculate true solar time using Flatlib's sun position."""
-    try:
-        # Get sun position from chart
-        sun = chart.get(const.SUN)
-        
-        # Calculate mean solar time offset based on longitude
-        # Each degree of longitude equals 4 minutes of time
-        longitude_offset = longitude * 4 * 60  # Convert to seconds
-        
-        # Get equation of time from sun's position
-        # This accounts for the eccentricity of Earth's orbit
-        sun_lon = float(sun.lon)  # Get sun's ecliptic longitude
-        
-        # Calculate equation of time using a simplified formula
-        # This approximation is based on astronomical algorithms
-        eot_minutes = -7.658 * math.sin(math.radians(sun_lon)) \
-                     + 9.863 * math.sin(2 * math.radians(sun_lon + 3.58))
-        
-        # Convert to seconds
-        eot_seconds = eot_minutes * 60
-        
-        # Total time offset
-        total_offset = longitude_offset + eot_seconds
-        solar_time = dt + timedelta(seconds=total_offset)
-        
-        # Format interpretation
-        interpretation = (
-            f"True Solar Time is {solar_time.strftime('%H:%M:%S')} "
-            f"({abs(total_offset / 60):.1f} minutes "
-            f"{'ahead of' if total_offset > 0 else 'behind'} standard time). "
-            f"Equation of time correction: {eot_minutes:.1f} minutes."
-        )
-        
-        return solar_time, interpretation
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to calculate true solar time: {str(e)}"
-        )
-
-def interpret_chart(chart: Chart, is_premium: bool = False) -> Dict[str, Optional[str]]:
-    """Generate chart interpretation."""
-    basic = []
-    premium = []
-    
-    # Basic interpretation - Sun, Moon, Ascendant
-    sun = chart.get('Sun')
-    moon = chart.get('Moon')
-    asc = chart.get('Asc')
-    
-    basic.append(f"Sun in {sun.sign} ({sun.signlon:.1f}°)")
-    basic.append(f"Moon in {moon.sign} ({moon.signlon:.1f}°)")
-    basic.append(f"Ascendant in {asc.sign} ({asc.signlon:.1f}°)")
-    
-    if is_premium:
-        # Premium interpretation - Classical planets only
-        classical_planets = ['Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn']
-        
-        # Get positions for classical planets
-        for planet in classical_planets:
-            obj = chart.get(planet)
-            premium.append(f"{planet} in {obj.sign} ({obj.signlon:.1f}°)")
-        
-        # Define major aspects and their angles
-        major_aspects = {
-            0: 'Conjunction',   # 0°
-            60: 'Sextile',     # 60°
-            90: 'Square',      # 90°
-            120: 'Trine',      # 120°
-            180: 'Opposition'  # 180°
-        }
-        
-        # Calculate aspects between classical planets using direct longitude comparison
-        for i, p1 in enumerate(classical_planets):
-            obj1 = chart.get(p1)
-            for p2 in classical_planets[i+1:]:
-                obj2 = chart.get(p2)
-                # Calculate angular distance between planets
-                lon1 = float(obj1.signlon)  # Convert to float
-                lon2 = float(obj2.signlon)  # Convert to float
-                
-                # Calculate smallest angle between the two positions
-                diff = abs(lon1 - lon2)
-                if diff > 180:
-                    diff = 360 - diff
-                
-                # Check for aspects within orb
-                for angle, aspect_name in major_aspects.items():
-                    orb = abs(diff - angle)
-                    if orb <= 6:  # 6° orb
-                        premium.append(
-                            f"{p1}-{p2}: {aspect_name} ({orb:.1f}°)"
-                        )
-    
-    return {
-        "basic": "\n".join(basic),
-        "premium": "\n".join(premium) if is_premium else None
-    }
-
-@app.post("/charts/create", response_model=ChartResponse)
-async def create_chart(request: ChartRequest):
+def chart_request_to_utc(request: ChartRequest) -> datetime:
+    """Convert the request's local birth date and time into UTC."""
     # Parse date and time
     dt = datetime.strptime(
         f"{request.birth_date} {request.birth_time}",
@@ -231,154 +171,450 @@ async def create_chart(request: ChartRequest):
     try:
         # Convert to UTC with proper error handling
         local_dt = local_tz.localize(dt)
-        utc_dt = local_dt.astimezone(pytz.UTC)
+        return local_dt.astimezone(pytz.UTC)
     except Exception as e:
         raise HTTPException(
             status_code=400,
             detail=f"Error converting timezone: {str(e)}"
         )
-    
-    # Create Flatlib date and location for initial chart
-    date = Datetime(
-        f"{utc_dt.year}/{utc_dt.month:02d}/{utc_dt.day:02d}",
-        f"{utc_dt.hour:02d}:{utc_dt.minute:02d}"
+
+def chart_cache_key(request: ChartRequest, utc_dt: datetime) -> tuple:
+    return chart_cache.key(
+        utc_dt, request.latitude, request.longitude,
+        request.house_system, request.house_time
     )
-    pos = GeoPos(request.latitude, request.longitude)
+
+def chart_compute_args(request: ChartRequest, utc_dt: datetime) -> tuple:
+    """Arguments for ``compute_chart`` on the chart engine."""
+    return (
+        utc_dt, request.latitude, request.longitude,
+        request.house_time, request.house_system
+    )
+
+def new_chart_record(request: ChartRequest, positions: array) -> ChartRecord:
+    """Record for a newly computed chart."""
+    return ChartRecord(
+        id=str(uuid.uuid4()),
+        date=request.birth_date,
+        time=request.birth_time,
+        latitude=request.latitude,
+        longitude=request.longitude,
+        house_time=request.house_time,
+        house_system=request.house_system,
+        positions=positions,
+        language=request.language
+    )
+
+async def premium_interpretation(positions: array, language: str = DEFAULT_LANGUAGE) -> str:
+    """Premium text for ``positions``, shared by all charts with the same planets."""
+    key = (language, premium_fingerprint(positions))
+    premium = interpretation_cache.get(key)
+    if premium is None:
+        premium = (await chart_engine.run(interpret_chart, positions, True, language))["premium"]
+        interpretation_cache.put(key, premium)
+    return premium
+
+async def precompute_premium(positions_list: List[array], language: str = DEFAULT_LANGUAGE) -> None:
+    """Background task: have premium interpretations ready for new charts.
+
+    Skipped while the chart engine is at least half busy, so it never
+    delays or rejects real requests; an unlock then computes on demand.
+    """
+    todo: Dict[tuple, array] = {}
+    for positions in positions_list:
+        key = (language, premium_fingerprint(positions))
+        if key not in interpretation_cache:
+            todo.setdefault(key, positions)
+    if not todo or chart_engine.pending * 2 >= chart_engine.max_pending:
+        return
+    outcomes = await chart_engine.map(
+        interpret_chart, [(positions, True, language) for positions in todo.values()]
+    )
+    for key, outcome in zip(todo, outcomes):
+        if not isinstance(outcome, ChartError):
+            interpretation_cache.put(key, outcome["premium"])
+
+@app.post("/charts/create", response_model=ChartResponse)
+async def create_chart(request: ChartRequest, background_tasks: BackgroundTasks):
+    utc_dt = chart_request_to_utc(request)
     
-    # Calculate initial chart
-    chart = Chart(date, pos)
+    # Reuse a cached chart for the same birth data, otherwise compute it
+    # off the event loop
+    cache_key = chart_cache_key(request, utc_dt)
+    positions = chart_cache.get(cache_key)
+    if positions is None:
+        positions = await chart_engine.run(compute_chart, *chart_compute_args(request, utc_dt))
+        chart_cache.put(cache_key, positions)
     
-    # Calculate true solar time using chart data
-    true_solar_dt, solar_interpretation = calculate_true_solar_time(utc_dt, request.longitude, chart)
+    record = new_chart_record(request, positions)
+    await storage.save_chart(record)
+    background_tasks.add_task(precompute_premium, [positions], request.language)
+    return record.to_response(request.language)
+
+class ChartBatchError(BaseModel):
+    status_code: int
+    detail: Any
+
+class ChartBatchItem(BaseModel):
+    index: int
+    chart: Optional[ChartResponse] = None
+    error: Optional[ChartBatchError] = None
+
+class ChartBatchResponse(BaseModel):
+    results: List[ChartBatchItem]
+
+@app.post("/charts/batch", response_model=ChartBatchResponse)
+async def create_charts_batch(items: List[Dict[str, Any]], background_tasks: BackgroundTasks):
+    """Create many charts in one request.
+    
+    Items are validated one by one so a bad item only fails itself.
+    Identical inputs are computed once, and the remaining ephemeris work is
+    spread across the chart workers. Results keep the request order.
+    """
+    if len(items) > CHART_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large. At most {CHART_BATCH_LIMIT} charts per request."
+        )
+    
+    results: List[Dict[str, Any]] = [{"index": i} for i in range(len(items))]
+    requests: Dict[int, ChartRequest] = {}
+    pending: Dict[tuple, List[int]] = {}  # cache key -> item indexes
+    computed: Dict[tuple, Any] = {}
+    compute_args: Dict[tuple, tuple] = {}
+    
+    for i, item in enumerate(items):
+        try:
+            request = ChartRequest(**item)
+        except ValidationError as e:
+            results[i]["error"] = {
+                "status_code": 422,
+                "detail": [
+                    {"loc": err["loc"], "msg": err["msg"], "type": err["type"]}
+                    for err in e.errors()
+                ]
+            }
+            continue
+        try:
+            utc_dt = chart_request_to_utc(request)
+        except HTTPException as e:
+            results[i]["error"] = {"status_code": e.status_code, "detail": e.detail}
+            continue
+        
+        requests[i] = request
+        key = chart_cache_key(request, utc_dt)
+        if key not in pending:
+            pending[key] = []
+            cached = chart_cache.get(key)
+            if cached is not None:
+                computed[key] = cached
+            else:
+                compute_args[key] = chart_compute_args(request, utc_dt)
+        pending[key].append(i)
+    
+    # Compute each distinct uncached chart once
+    keys = list(compute_args)
+    outcomes = await chart_engine.map(compute_chart, [compute_args[k] for k in keys])
+    for key, outcome in zip(keys, outcomes):
+        computed[key] = outcome
+        if not isinstance(outcome, ChartError):
+            chart_cache.put(key, outcome)
+    
+    records = []
+    by_language: Dict[str, List[array]] = {}  # positions to precompute, per language
+    for key, indexes in pending.items():
+        outcome = computed[key]
+        for i in indexes:
+            if isinstance(outcome, ChartError):
+                results[i]["error"] = {
+                    "status_code": outcome.status_code,
+                    "detail": outcome.detail
+                }
+            else:
+                record = new_chart_record(requests[i], outcome)
+                records.append(record)
+                by_language.setdefault(requests[i].language, []).append(outcome)
+                results[i]["chart"] = record.to_response(requests[i].language)
     
-    # Create new chart with solar time
-    solar_date = Datetime(
-        f"{true_solar_dt.year}/{true_solar_dt.month:02d}/{true_solar_dt.day:02d}",
-        f"{true_solar_dt.hour:02d}:{true_solar_dt.minute:02d}"
+    # Store the whole batch in one write
+    if records:
+        await storage.save_charts(records)
+        for language, positions_list in by_language.items():
+            background_tasks.add_task(precompute_premium, positions_list, language)
+    return {"results": results}
+
+class SolarTimeInstant(BaseModel):
+    utc_time: datetime = Field(..., description="Instant (ISO 8601); naive values are taken as UTC")
+    longitude: float = Field(..., ge=-180, le=180, description="Place longitude (-180 to 180)")
+
+class SolarTimeRequest(BaseModel):
+    instants: List[SolarTimeInstant]
+    method: Literal["exact", "table"] = Field(
+        default="exact",
+        description="'exact' computes the Sun's position; 'table' uses the day-of-year table"
     )
-    pos = GeoPos(request.latitude, request.longitude)
-    
-    # Calculate chart
-    chart = Chart(date, pos)
-    
-    # Generate interpretation
-    interpretation = interpret_chart(chart)
-    
-    # Extract positions for classical planets only
-    planets = {}
-    classical_planets = ['Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn']  # Classical planets supported by Flatlib
-    houses = chart.houses  # Get houses as property
-    
-    for planet in classical_planets:
-        obj = chart.get(planet)
-        # Use Flatlib's native method to find house
-        house_num = 1  # Default to house 1
-        for i, house in enumerate(houses, 1):
-            if house.hasObject(obj):  # Use Flatlib's built-in method
-                house_num = i
-                break
-        planets[planet] = {
-            "sign": obj.sign,
-            "position": obj.signlon,
-            "house": house_num
-        }
+
+@app.post("/solar-time")
+async def get_solar_times(request: SolarTimeRequest):
+    """True solar time for many instants in one vectorized pass."""
+    if len(request.instants) > SOLAR_TIME_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many instants. At most {SOLAR_TIME_BATCH_LIMIT} per request."
+        )
     
-    house_data = {}
-    for i, house in enumerate(chart.houses, 1):
-        house_data[str(i)] = {
-            "sign": house.sign,
-            "position": house.lon
-        }
+    utc_times = [
+        i.utc_time if i.utc_time.tzinfo else i.utc_time.replace(tzinfo=timezone.utc)
+        for i in request.instants
+    ]
+    timestamps = np.array([t.timestamp() for t in utc_times])
+    longitudes = np.array([i.longitude for i in request.instants])
+    compute = solar_offsets_from_table if request.method == "table" else solar_offsets
+    offsets, eot = compute(timestamps, longitudes)
     
-    # Update houses in chart data
-    houses = house_data
-    
-    # Create chart record
-    chart_id = str(uuid.uuid4())
-    chart_data = {
-        "id": chart_id,
-        "date": request.birth_date,
-        "time": request.birth_time,
-        "latitude": request.latitude,
-        "longitude": request.longitude,
-        "planets": planets,
-        "houses": houses,
-        "basic_interpretation": interpretation["basic"],
-        "is_premium_unlocked": False,
-        "premium_interpretation": None,
-        "_chart": chart  # Store chart object for premium interpretation
+    solar_times = np.datetime_as_string(
+        np.round((timestamps + offsets) * 1000).astype("int64").astype("datetime64[ms]"),
+        unit="s"
+    )
+    return {
+        "method": request.method,
+        "results": [
+            {
+                "utc_time": utc_time.astimezone(timezone.utc).isoformat(),
+                "longitude": longitude,
+                "solar_time": solar_time,
+                "offset_minutes": offset / 60,
+                "equation_of_time_minutes": eot_minutes
+            }
+            for utc_time, longitude, solar_time, offset, eot_minutes in zip(
+                utc_times, longitudes.tolist(), solar_times.tolist(),
+                offsets.tolist(), eot.tolist()
+            )
+        ]
     }
+
+def _ephemeris_ndjson(start: datetime, step: timedelta, count: int):
+    """Encode ``ephemeris_series`` as NDJSON, a few hundred lines per chunk."""
+    lines = []
+    for utc_dt, lons, speeds in ephemeris_series(start, step, count):
+        lines.append(json.dumps({
+            "time": utc_dt.isoformat(),
+            "planets": {
+                planet: {
+                    "sign": SIGNS[int(lon / 30)],
+                    "position": lon % 30,
+                    "longitude": lon,
+                    "speed": speed,
+                    "retrograde": speed < 0
+                }
+                for planet, lon, speed in zip(CLASSICAL_PLANETS, lons, speeds)
+            }
+        }))
+        if len(lines) == EPHEMERIS_CHUNK_LINES:
+            lines.append("")
+            yield "\n".join(lines)
+            lines = []
+    if lines:
+        lines.append("")
+        yield "\n".join(lines)
+
+@app.get("/ephemeris")
+async def stream_ephemeris(
+    start: datetime,
+    end: datetime,
+    step_hours: float = Query(default=24.0, ge=1 / 60, description="Hours between samples (at least one minute)")
+):
+    """Stream classical planet positions from ``start`` to ``end`` as NDJSON.
+
+    One JSON object per line, produced lazily, so the full series is never
+    held in memory. Naive datetimes are taken as UTC.
+    """
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
     
-    # Add solar time information
-    chart_data["standard_time"] = utc_dt.strftime("%H:%M:%S")
-    chart_data["solar_time"] = true_solar_dt.strftime("%H:%M:%S")
-    chart_data["solar_interpretation"] = solar_interpretation
-    
-    # Save to in-memory database
-    db["charts"][chart_id] = chart_data
+    step = timedelta(hours=step_hours)
+    count = int((end - start) / step) + 1
+    if count > EPHEMERIS_STREAM_LIMIT:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Range too long. At most {EPHEMERIS_STREAM_LIMIT} samples per request."
+        )
     
-    # Remove chart object from response
-    response_data = dict(chart_data)
-    del response_data["_chart"]
-    return response_data
+    return StreamingResponse(
+        _ephemeris_ndjson(start.astimezone(timezone.utc), step, count),
+        media_type="application/x-ndjson"
+    )
+
+IfNoneMatch = Annotated[Optional[str], Header(
+    alias="If-None-Match", description="ETag of a cached copy; answered with 304 if still current"
+)]
+
+@app.get("/charts/{chart_id}", response_model=ChartResponse)
+async def get_chart(
+    chart_id: str,
+    fields: Annotated[Optional[str], Query(
+        description="Comma-separated ChartResponse fields to return, e.g. 'planets' or 'houses,house_system'"
+    )] = None,
+    language: Annotated[str, Query(description="Language of the interpretation (en/zh)")] = DEFAULT_LANGUAGE,
+    if_none_match: IfNoneMatch = None
+):
+    """A stored chart, or only the requested ``fields`` of it (``id`` is always included).
+
+    Interpretations, premium included once unlocked, are in ``language``.
+    Answers 304 when ``If-None-Match`` holds the current ETag, which only
+    changes when the chart is unlocked.
+    """
+    if language not in LANGUAGES:
+        raise HTTPException(status_code=400, detail="Invalid language code")
+    if fields is None:
+        names = RESPONSE_FIELDS
+    else:
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested.difference(RESPONSE_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        requested.add("id")
+        names = tuple(name for name in RESPONSE_FIELDS if name in requested)
+
+    record = await storage.get_chart(chart_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Chart not found")
+    headers = {"ETag": record.etag(names, language)}
+    if if_none_match is not None and etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    content = record.project(names, language)
+    # The stored premium text is in the chart's language; other languages
+    # share the interpretation cache with unlocks
+    if record.is_premium_unlocked and "premium_interpretation" in content and language != record.language:
+        content["premium_interpretation"] = await premium_interpretation(record.positions, language)
+    return Response(content=json_bytes(content), media_type="application/json", headers=headers)
+
+@app.get("/charts/cache/stats")
+async def get_chart_cache_stats():
+    """Hit/miss/eviction counters of the chart result cache."""
+    return chart_cache.stats()
+
+@app.get("/charts/interpretation-cache/stats")
+async def get_interpretation_cache_stats():
+    """Hit/miss/eviction counters of the premium interpretation cache."""
+    return interpretation_cache.stats()
+
+@app.get("/storage/memory/stats")
+async def get_storage_memory_stats():
+    """Resident vs spilled rows and fault latency of memory-budgeted tables."""
+    return storage.memory_stats()
+
+IdempotencyKey = Annotated[Optional[str], Header(
+    alias="Idempotency-Key", description="Retries with the same key get the first response back"
+)]
+
+async def idempotent(
+    idempotency_key: Optional[str],
+    user_id: str,
+    response: Response,
+    handler: Callable[[], Awaitable[Any]],
+    *request_parts: Any
+) -> Any:
+    """Run ``handler``, or replay its outcome for a retried ``Idempotency-Key``.
+
+    Keys belong to ``user_id``, the user the request acts for.
+    ``request_parts`` identify the request; a key reused for other parts
+    is rejected with 422.
+    """
+    if idempotency_key is None:
+        return await handler()
+    body, replayed = await idempotency_cache.run(
+        user_id, idempotency_key, fingerprint(*request_parts), handler
+    )
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return body
 
 @app.post("/charts/{chart_id}/unlock-premium", response_model=ChartResponse)
 async def unlock_premium_interpretation(
     chart_id: str,
-    request: ChartUnlockRequest
+    request: ChartUnlockRequest,
+    response: Response,
+    idempotency_key: IdempotencyKey = None
 ):
-    """Unlock premium interpretation for a chart."""
+    """Unlock premium interpretation for a chart.
+
+    The premium text is written in the paying user's language, as set with
+    ``PUT /users/{user_id}/language``.
+    """
+    return await idempotent(
+        idempotency_key, request.user_id, response, lambda: _unlock_premium(chart_id, request),
+        "unlock-premium", chart_id
+    )
+
+async def _unlock_premium(chart_id: str, request: ChartUnlockRequest) -> Dict[str, Any]:
     # Verify chart exists
-    if chart_id not in db["charts"]:
+    record = await storage.get_chart(chart_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Chart not found")
     
     # Verify user exists
-    if request.user_id not in db["users"]:
+    user = await storage.get_user(request.user_id)
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Verify user has enough balance (20 USD = 2000 coins)
-    user = db["users"][request.user_id]
     if user.get("balance", 0) < 2000:
         raise HTTPException(
             status_code=402,
             detail="Insufficient balance. Premium interpretation costs 2000 coins."
         )
     
-    # Deduct balance
-    user["balance"] -= 2000
-    
-    # Record transaction
-    transaction_id = str(uuid.uuid4())
-    db["transactions"].append({
-        "id": transaction_id,
-        "user_id": request.user_id,
-        "amount": -2000,
-        "type": "premium_unlock",
-        "description": f"Premium chart interpretation unlock for chart {chart_id}",
-        "created_at": datetime.now()
-    })
-    
-    # Record revenue
-    db["revenue"].append({
-        "id": str(uuid.uuid4()),
-        "source": "premium_unlock",
-        "amount": 20.0,  # 20 USD
-        "created_at": datetime.now()
-    })
-    
-    # Generate premium interpretation
-    chart_data = db["charts"][chart_id]
-    chart = chart_data["_chart"]
-    interpretation = interpret_chart(chart, is_premium=True)
-    
-    # Update chart data
-    chart_data["is_premium_unlocked"] = True
-    chart_data["premium_interpretation"] = interpretation["premium"]
+    # Generate premium interpretation, in the paying user's language, before
+    # charging, so a busy or timed out chart engine never costs the user
+    # anything. New charts usually have it precomputed in the language they
+    # were created in, and charts with the same planets share it.
+    language = user.get("language")
+    if language not in LANGUAGES:
+        language = DEFAULT_LANGUAGE
+    premium = await premium_interpretation(record.positions, language)
     
-    # Remove chart object from response
-    response_data = dict(chart_data)
-    del response_data["_chart"]
-    return response_data
+    async with storage.update_user(request.user_id) as update:
+        if update is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user = update.user
+        # The balance may have changed while the interpretation was computed
+        if user.get("balance", 0) < 2000:
+            raise HTTPException(
+                status_code=402,
+                detail="Insufficient balance. Premium interpretation costs 2000 coins."
+            )
+        
+        # Deduct balance
+        user["balance"] -= 2000
+        
+        # Record transaction
+        transaction_id = str(uuid.uuid4())
+        update.add_transaction({
+            "id": transaction_id,
+            "user_id": request.user_id,
+            "amount": -2000,
+            "type": "premium_unlock",
+            "description": f"Premium chart interpretation unlock for chart {chart_id}",
+            "created_at": datetime.now()
+        })
+        
+        # Record revenue
+        update.add_revenue({
+            "id": str(uuid.uuid4()),
+            "source": "premium_unlock",
+            "amount": 20.0,  # 20 USD
+            "created_at": datetime.now()
+        })
+        
+        # Save an unlocked copy; the stored record stays as it is until commit
+        record = record.unlocked(premium, language)
+        update.save_chart(record)
+    return record.to_response(language)
 
 def calculate_level(experience: int) -> Dict[str, Any]:
     """计算用户等级和称号"""
@@ -425,29 +661,72 @@ def calculate_level(experience: int) -> Dict[str, Any]:
             "next_level": 10000
         }
 
-# 内存数据库
-db = {
-    "users": {},
-    "transactions": [],
-    "revenue": [],
-    "products": {
-        "1": {
-            "id": "1",
-            "name": "完整韦特牌组",
-            "description": "包含所有78张韦特牌的完整牌组",
-            "price": 99,
-            "image": "🎴"
-        },
-        "2": {
-            "id": "2",
-            "name": "专业牌阵解读",
-            "description": "解锁更多专业牌阵和详细解读",
-            "price": 49,
-            "image": "📚"
-        }
-    },
-    "readings": {}
-}
+def encode_cursor(key: IndexKey) -> str:
+    """Opaque page cursor for a ``(created_at, id)`` index key."""
+    created_at, row_id = key
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> Optional[IndexKey]:
+    if cursor is None:
+        return None
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), row_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paginate(page: IndexPage, response: Response) -> List[Dict[str, Any]]:
+    """Rows of a page, oldest first.
+
+    Cursors for the neighbouring pages go in the ``X-Prev-Cursor`` (pass
+    as ``before``) and ``X-Next-Cursor`` (pass as ``after``) headers.
+    """
+    if page.keys and page.more_before:
+        response.headers["X-Prev-Cursor"] = encode_cursor(page.keys[0])
+    if page.keys and page.more_after:
+        response.headers["X-Next-Cursor"] = encode_cursor(page.keys[-1])
+    return page.values
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+async def export_ndjson(
+    fetch_page: Callable[..., Awaitable[IndexPage]],
+    user_id: str,
+    limit: Optional[int] = None,
+    before: Optional[IndexKey] = None,
+    after: Optional[IndexKey] = None
+) -> AsyncIterator[str]:
+    """The rows of a user's listing as NDJSON, oldest first.
+
+    These are the rows the JSON page for ``limit``, ``before`` and
+    ``after`` holds; without them, every row. Walks the listing a chunk at
+    a time by key, so rows added while the export streams are neither
+    skipped nor repeated.
+    """
+    if limit is not None and before is not None and after is None:
+        # Paging backwards ends at ``before``; ``limit`` keeps the page small
+        page = await fetch_page(user_id, limit, before, None)
+        if page.keys:
+            yield _ndjson_rows(page.values)
+        return
+    while limit is None or limit > 0:
+        chunk = EXPORT_CHUNK_ROWS if limit is None else min(limit, EXPORT_CHUNK_ROWS)
+        # Only ``after`` is passed: with ``before`` alone a page pages backwards
+        page = await fetch_page(user_id, chunk, None, after)
+        keys = page.keys if before is None else page.keys[:bisect_left(page.keys, before)]
+        if keys:
+            yield _ndjson_rows(page.values[:len(keys)])
+        if len(keys) < chunk:
+            return
+        after = keys[-1]
+        if limit is not None:
+            limit -= len(keys)
+
+def _ndjson_rows(rows: List[Dict[str, Any]]) -> str:
+    return "".join(json.dumps(row, default=_json_default) + "\n" for row in rows)
 
 # Other data models
 class User(BaseModel):
@@ -491,60 +770,71 @@ class PurchaseRequest(BaseModel):
     product_id: str = Field(..., description="Product ID to purchase")
 
 @app.post("/products/{product_id}/purchase")
-async def purchase_product(product_id: str, request: PurchaseRequest):
+async def purchase_product(
+    product_id: str,
+    request: PurchaseRequest,
+    response: Response,
+    idempotency_key: IdempotencyKey = None
+):
     """Purchase a product using virtual currency."""
+    return await idempotent(
+        idempotency_key, request.user_id, response, lambda: _purchase(product_id, request),
+        "purchase", product_id, request.product_id
+    )
+
+async def _purchase(product_id: str, request: PurchaseRequest) -> Dict[str, Any]:
     # Verify product exists
-    if product_id not in db["products"]:
+    product = await storage.get_product(product_id)
+    if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Verify user exists
-    if request.user_id not in db["users"]:
-        raise HTTPException(status_code=404, detail="User not found")
+    async with storage.update_user(request.user_id) as update:
+        # Verify user exists
+        if update is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user = update.user
     
-    product = db["products"][product_id]
-    user = db["users"][request.user_id]
+        # Check if user already owns product
+        if product_id in user.get("purchased_products", []):
+            raise HTTPException(
+                status_code=400,
+                detail="User already owns this product"
+            )
     
-    # Check if user already owns product
-    if product_id in user.get("purchased_products", []):
-        raise HTTPException(
-            status_code=400,
-            detail="User already owns this product"
-        )
+        # Check user balance
+        if user.get("balance", 0) < product["price"]:
+            raise HTTPException(
+                status_code=402,
+                detail=f"Insufficient balance. Product costs {product['price']} coins."
+            )
     
-    # Check user balance
-    if user.get("balance", 0) < product["price"]:
-        raise HTTPException(
-            status_code=402,
-            detail=f"Insufficient balance. Product costs {product['price']} coins."
-        )
+        # Process purchase
+        user["balance"] -= product["price"]
+        if "purchased_products" not in user:
+            user["purchased_products"] = []
+        user["purchased_products"].append(product_id)
     
-    # Process purchase
-    user["balance"] -= product["price"]
-    if "purchased_products" not in user:
-        user["purchased_products"] = []
-    user["purchased_products"].append(product_id)
-    
-    # Record transaction
-    transaction_id = str(uuid.uuid4())
-    db["transactions"].append({
-        "id": transaction_id,
-        "user_id": request.user_id,
-        "amount": -product["price"],
-        "type": "purchase",
-        "description": f"Purchase of {product['name']}",
-        "created_at": datetime.now()
-    })
+        # Record transaction
+        transaction_id = str(uuid.uuid4())
+        update.add_transaction({
+            "id": transaction_id,
+            "user_id": request.user_id,
+            "amount": -product["price"],
+            "type": "purchase",
+            "description": f"Purchase of {product['name']}",
+            "created_at": datetime.now()
+        })
     
-    # Record revenue
-    db["revenue"].append({
-        "id": str(uuid.uuid4()),
-        "source": "purchase",
-        "amount": product["price"] / 100,  # Convert to USD (100 coins = $1)
-        "created_at": datetime.now()
-    })
+        # Record revenue
+        update.add_revenue({
+            "id": str(uuid.uuid4()),
+            "source": "purchase",
+            "amount": product["price"] / 100,  # Convert to USD (100 coins = $1)
+            "created_at": datetime.now()
+        })
     
-    # Add experience points for purchase
-    user["experience"] = user.get("experience", 0) + 50
+        # Add experience points for purchase
+        user["experience"] = user.get("experience", 0) + 50
     
     return {
         "success": True,
@@ -564,38 +854,136 @@ async def purchase_product(product_id: str, request: PurchaseRequest):
 async def healthz():
     return {"status": "ok"}
 
+def _stats_gauges(prefix: str, label: str, sources: Dict[str, Dict[str, Any]], help: str) -> List[Gauge]:
+    """One gauge per numeric statistic, labelled by source."""
+    gauges: Dict[str, Gauge] = {}
+    for source, stats in sources.items():
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)):
+                name = f"{prefix}_{stat}"
+                gauge = gauges.setdefault(name, Gauge(name, f"{help}: {stat}", []))
+                gauge.samples.append(({label: source}, value))
+    return list(gauges.values())
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics: requests, chart engine, caches, locks and tables."""
+    caches = {
+        "chart": chart_cache.stats(),
+        "interpretation": interpretation_cache.stats(),
+        "response": response_cache.stats(),
+        "idempotency": idempotency_cache.stats()
+    }
+    gauges = [
+        Gauge("chart_engine_pending", "Chart engine jobs queued or running", [({}, chart_engine.pending)]),
+        Gauge("db_rows", "Rows per storage table", [
+            ({"table": table}, rows) for table, rows in storage.table_sizes().items()
+        ])
+    ]
+    gauges += _stats_gauges("cache", "cache", caches, "Cache statistic")
+    gauges += _stats_gauges("user_locks", "storage", {"user_locks": storage.user_locks.stats()}, "Striped user locks")
+    gauges += _stats_gauges("storage_memory", "table", storage.memory_stats(), "Memory-budgeted table")
+    return PlainTextResponse(metrics.render(gauges), media_type=METRICS_CONTENT_TYPE)
+
+ProfileToken = Annotated[Optional[str], Header(
+    alias=PROFILE_TOKEN_HEADER, description="PROFILE_TOKEN, required to read profiles"
+)]
+
+def _check_profile_token(token: Optional[str]) -> None:
+    """404 while profiling has no token configured, 403 for a wrong token."""
+    if profiler.token is None:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    if not profiler.authorized(token):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+@app.get("/debug/profiles", include_in_schema=False)
+async def list_profiles(
+    route: Annotated[Optional[str], Query(description="Route template, e.g. /charts")] = None,
+    token: ProfileToken = None
+):
+    """Kept request profiles, newest first."""
+    _check_profile_token(token)
+    return {
+        "mode": profiler.mode,
+        "sample_rate": profiler.sample_rate,
+        "captured": profiler.captured,
+        "skipped": profiler.skipped,
+        "profiles": [profile.summary() for profile in profiler.profiles(route)]
+    }
+
+@app.get("/debug/profiles/{profile_id}", include_in_schema=False)
+async def get_profile(
+    profile_id: int,
+    format: Annotated[Literal["text", "pstats", "collapsed"], Query(
+        description="text: pstats summary; pstats: .prof file; collapsed: stacks for flame graphs"
+    )] = "text",
+    token: ProfileToken = None
+):
+    """One profile: a cProfile one as text or a ``.prof`` file, a sampled one as collapsed stacks."""
+    _check_profile_token(token)
+    profile: Optional[CapturedProfile] = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        if profile.stacks is None:
+            raise HTTPException(status_code=400, detail="Profile has no stack samples (cprofile mode)")
+        return PlainTextResponse(profile.collapsed())
+    if profile.stats is None:
+        raise HTTPException(status_code=400, detail="Profile has no pstats data (sample mode)")
+    if format == "pstats":
+        return Response(
+            content=profile.pstats_bytes(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile.id}.prof"'}
+        )
+    return PlainTextResponse(profile.pstats_text())
+
 @app.get("/products", response_model=List[Product])
-async def get_products():
-    return list(db["products"].values())
+async def get_products(if_none_match: IfNoneMatch = None):
+    # Serialized once per products_version, which every worker sees move;
+    # see app.response_cache
+    version = await storage.products_version()
+    entry = response_cache.lookup("products", version)
+    if entry is None:
+        products = await storage.list_products()
+        entry = response_cache.put(
+            "products", version, [Product(**product).model_dump() for product in products]
+        )
+    return response_cache.respond(entry, if_none_match)
 
 @app.get("/users/{user_id}", response_model=User)
 async def get_user(user_id: str):
-    if user_id not in db["users"]:
+    user = await storage.get_user(user_id)
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db["users"][user_id]
+    return user
 
 @app.get("/users/{user_id}/level")
-async def get_user_level(user_id: str):
-    if user_id not in db["users"]:
+async def get_user_level(user_id: str, if_none_match: IfNoneMatch = None):
+    user = await storage.get_user(user_id)
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user = db["users"][user_id]
-    level_info = calculate_level(user.get("experience", 0))
-    
-    return {
-        "experience": user.get("experience", 0),
-        "level_info": level_info
-    }
+    # The response depends on the experience only, so users share entries
+    experience = user.get("experience", 0)
+    entry = response_cache.lookup(("level", experience), 0)
+    if entry is None:
+        entry = response_cache.put(("level", experience), 0, {
+            "experience": experience,
+            "level_info": calculate_level(experience)
+        })
+    return response_cache.respond(entry, if_none_match)
 
 @app.post("/users/{user_id}/experience")
 async def add_experience(user_id: str, xp_amount: int):
-    if user_id not in db["users"]:
-        raise HTTPException(status_code=404, detail="User not found")
+    async with storage.update_user(user_id) as update:
+        if update is None:
+            raise HTTPException(status_code=404, detail="User not found")
     
-    user = db["users"][user_id]
-    current_xp = user.get("experience", 0)
-    new_xp = current_xp + xp_amount
-    user["experience"] = new_xp
+        user = update.user
+        current_xp = user.get("experience", 0)
+        new_xp = current_xp + xp_amount
+        user["experience"] = new_xp
     
     level_info = calculate_level(new_xp)
     
@@ -609,40 +997,29 @@ class CreateUserRequest(BaseModel):
 
 @app.get("/users/by-username/{username}")
 async def get_user_by_username(username: str):
-    for user_id, user in db["users"].items():
-        if user["username"] == username:
-            return user
-    raise HTTPException(status_code=404, detail="User not found")
+    user = await storage.get_user_by_username(username)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 @app.post("/users")
 async def create_user(request: CreateUserRequest):
-    # Check if username already exists
-    for user in db["users"].values():
-        if user["username"] == request.username:
-            return user  # Return existing user if found
-            
-    user_id = str(uuid.uuid4())
-    user = {
-        "id": user_id,
-        "username": request.username,
-        "purchased_products": [],
-        "experience": 0,
-        "balance": 0,
-        "language": "en"  # Default to English
-    }
-    db["users"][user_id] = user
-    return user
+    # Returns the existing user if the username is taken (ignoring case)
+    return await storage.create_user(request.username)
 
 @app.post("/purchase/{user_id}/{product_id}")
 async def purchase_product(user_id: str, product_id: str):
-    if user_id not in db["users"]:
+    if await storage.get_user(user_id) is None:
         raise HTTPException(status_code=404, detail="User not found")
-    if product_id not in db["products"]:
+    if await storage.get_product(product_id) is None:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    user = db["users"][user_id]
-    if product_id not in user["purchased_products"]:
-        user["purchased_products"].append(product_id)
+    async with storage.update_user(user_id) as update:
+        if update is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user = update.user
+        if product_id not in user["purchased_products"]:
+            user["purchased_products"].append(product_id)
     return user
 
 class ReadingCreate(BaseModel):
@@ -651,7 +1028,7 @@ class ReadingCreate(BaseModel):
 
 @app.post("/readings/{user_id}")
 async def save_reading(user_id: str, reading: ReadingCreate):
-    if user_id not in db["users"]:
+    if await storage.get_user(user_id) is None:
         raise HTTPException(status_code=404, detail="User not found")
     
     reading_id = str(uuid.uuid4())
@@ -662,118 +1039,165 @@ async def save_reading(user_id: str, reading: ReadingCreate):
         "cards": reading.cards,
         "created_at": datetime.now()
     }
-    db["readings"][reading_id] = reading_data
+    await storage.add_reading(reading_data)
     return reading_data
 
+PageLimit = Annotated[Optional[int], Query(ge=1, le=PAGE_SIZE_LIMIT, description="Rows per page; all rows if omitted")]
+PageCursor = Annotated[Optional[str], Query(description="Cursor from X-Prev-Cursor / X-Next-Cursor")]
+ListingFormat = Annotated[Literal["json", "ndjson"], Query(description="'ndjson' streams the rows as NDJSON, all of them without a limit or cursor")]
+
 @app.get("/readings/{user_id}", response_model=List[Reading])
-async def get_user_readings(user_id: str):
-    if user_id not in db["users"]:
+async def get_user_readings(
+    user_id: str,
+    response: Response,
+    limit: PageLimit = None,
+    before: PageCursor = None,
+    after: PageCursor = None,
+    format: ListingFormat = "json"
+):
+    if await storage.get_user(user_id) is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user_readings = [
-        reading for reading in db["readings"].values()
-        if reading["user_id"] == user_id
-    ]
-    return user_readings
+    if format == "ndjson":
+        return StreamingResponse(
+            export_ndjson(
+                storage.readings_page, user_id, limit, decode_cursor(before), decode_cursor(after)
+            ),
+            media_type="application/x-ndjson"
+        )
+    page = await storage.readings_page(user_id, limit, decode_cursor(before), decode_cursor(after))
+    return paginate(page, response)
 
 
 
 @app.put("/users/{user_id}/language")
 async def update_language(user_id: str, language: str = "en"):
-    if user_id not in db["users"]:
-        raise HTTPException(status_code=404, detail="User not found")
-    if language not in ["en", "zh"]:
+    if language not in LANGUAGES:
         raise HTTPException(status_code=400, detail="Invalid language code")
     
-    user = db["users"][user_id]
-    user["language"] = language
+    async with storage.update_user(user_id) as update:
+        if update is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user = update.user
+        user["language"] = language
     return {"success": True, "language": language, "user": user}
 
 @app.post("/users/{user_id}/balance/add")
 async def add_balance(user_id: str, amount: int, source: str):
-    if user_id not in db["users"]:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user = db["users"][user_id]
-    user["balance"] = user.get("balance", 0) + amount
+    async with storage.update_user(user_id) as update:
+        if update is None:
+            raise HTTPException(status_code=404, detail="User not found")
     
-    # Record transaction
-    transaction = {
-        "id": str(uuid.uuid4()),
-        "user_id": user_id,
-        "amount": amount,
-        "type": source,
-        "description": f"Added {amount} coins from {source}",
-        "created_at": datetime.now()
-    }
-    db["transactions"].append(transaction)
+        user = update.user
+        user["balance"] = user.get("balance", 0) + amount
     
-    # Record revenue if applicable
-    if source == "payment":
-        revenue = {
-            "id": str(uuid.uuid4()),
-            "source": "payment",
-            "amount": float(amount) * 0.1,  # 假设1个虚拟币=0.1元
-            "created_at": datetime.now()
-        }
-        db["revenue"].append(revenue)
-    elif source == "ad":
-        revenue = {
+        # Record transaction
+        transaction = {
             "id": str(uuid.uuid4()),
-            "source": "ad",
-            "amount": 0.01,  # 假设每次看广告收益0.01元
+            "user_id": user_id,
+            "amount": amount,
+            "type": source,
+            "description": f"Added {amount} coins from {source}",
             "created_at": datetime.now()
         }
-        db["revenue"].append(revenue)
+        update.add_transaction(transaction)
+    
+        # Record revenue if applicable
+        if source == "payment":
+            revenue = {
+                "id": str(uuid.uuid4()),
+                "source": "payment",
+                "amount": float(amount) * 0.1,  # 假设1个虚拟币=0.1元
+                "created_at": datetime.now()
+            }
+            update.add_revenue(revenue)
+        elif source == "ad":
+            revenue = {
+                "id": str(uuid.uuid4()),
+                "source": "ad",
+                "amount": 0.01,  # 假设每次看广告收益0.01元
+                "created_at": datetime.now()
+            }
+            update.add_revenue(revenue)
     
     return user
 
 @app.post("/users/{user_id}/balance/deduct")
 async def deduct_balance(user_id: str, amount: int, description: str):
-    if user_id not in db["users"]:
-        raise HTTPException(status_code=404, detail="User not found")
+    async with storage.update_user(user_id) as update:
+        if update is None:
+            raise HTTPException(status_code=404, detail="User not found")
     
-    user = db["users"][user_id]
-    current_balance = user.get("balance", 0)
+        user = update.user
+        current_balance = user.get("balance", 0)
     
-    if current_balance < amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
+        if current_balance < amount:
+            raise HTTPException(status_code=400, detail="Insufficient balance")
     
-    user["balance"] = current_balance - amount
+        user["balance"] = current_balance - amount
     
-    # Record transaction
-    transaction = {
-        "id": str(uuid.uuid4()),
-        "user_id": user_id,
-        "amount": -amount,
-        "type": "purchase",
-        "description": description,
-        "created_at": datetime.now()
-    }
-    db["transactions"].append(transaction)
+        # Record transaction
+        transaction = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "amount": -amount,
+            "type": "purchase",
+            "description": description,
+            "created_at": datetime.now()
+        }
+        update.add_transaction(transaction)
     
     return user
 
 @app.get("/users/{user_id}/transactions")
-async def get_transactions(user_id: str):
-    if user_id not in db["users"]:
+async def get_transactions(
+    user_id: str,
+    response: Response,
+    limit: PageLimit = None,
+    before: PageCursor = None,
+    after: PageCursor = None,
+    format: ListingFormat = "json"
+):
+    if await storage.get_user(user_id) is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return [t for t in db["transactions"] if t["user_id"] == user_id]
-
-@app.get("/revenue/summary")
-async def get_revenue_summary(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
-    filtered_revenue = db["revenue"]
-    if start_date:
-        filtered_revenue = [r for r in filtered_revenue if r["created_at"] >= start_date]
-    if end_date:
-        filtered_revenue = [r for r in filtered_revenue if r["created_at"] <= end_date]
-    
-    total_ad_revenue = sum(r["amount"] for r in filtered_revenue if r["source"] == "ad")
-    total_payment_revenue = sum(r["amount"] for r in filtered_revenue if r["source"] == "payment")
     
+    if format == "ndjson":
+        return StreamingResponse(
+            export_ndjson(
+                storage.transactions_page, user_id, limit, decode_cursor(before), decode_cursor(after)
+            ),
+            media_type="application/x-ndjson"
+        )
+    page = await storage.transactions_page(user_id, limit, decode_cursor(before), decode_cursor(after))
+    return paginate(page, response)
+
+def _revenue_totals(bucket: RevenueBucket) -> Dict[str, Any]:
+    ad_revenue = bucket.amount("ad")
+    payment_revenue = bucket.amount("payment")
     return {
-        "total_revenue": total_ad_revenue + total_payment_revenue,
-        "ad_revenue": total_ad_revenue,
-        "payment_revenue": total_payment_revenue,
-        "transaction_count": len(filtered_revenue)
+        "total_revenue": ad_revenue + payment_revenue,
+        "ad_revenue": ad_revenue,
+        "payment_revenue": payment_revenue,
+        "transaction_count": bucket.count
     }
+
+def _local_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Revenue timestamps are naive local time; convert aware bounds to match."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+@app.get("/revenue/summary")
+async def get_revenue_summary(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    bucket: Literal["hour", "day"] = "day"
+):
+    """Revenue totals and a per-bucket breakdown, answered from the rollups."""
+    start_date, end_date = _local_naive(start_date), _local_naive(end_date)
+    unit = HOUR if bucket == "hour" else DAY
+    total, buckets = await storage.revenue_summary(start_date, end_date, unit)
+    
+    summary = _revenue_totals(total)
+    summary["buckets"] = [{"start": key, **_revenue_totals(part)} for key, part in buckets]
+    return summary
@@ -0,0 +1,183 @@
+"""Request and compute metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every HTTP request and records it under its
+route template (``/charts/{chart_id}``, not the concrete path), so the
+number of series stays bounded. ``ChartEngine`` records each job it runs,
+and chart functions called inline in a request (the basic interpretation)
+are timed with ``observe_inline``.
+``GET /metrics`` renders everything, plus gauges collected at scrape time
+(cache, lock and table statistics), for Prometheus to scrape.
+
+Recording takes no lock: it is a dict lookup and a few integer increments,
+which the event loop thread never interleaves. Requests served from other
+threads (the test client) may very rarely lose an increment, which is fine
+for monitoring.
+"""
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+from bisect import bisect_left
+import math
+import time
+
+# Latency buckets in seconds, from fast cached reads to slow chart batches
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Counts per bucket (not cumulative) and the sum of observed values."""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Gauge(NamedTuple):
+    """A metric collected at scrape time: ``samples`` are ``(labels, value)``."""
+    name: str
+    help: str
+    samples: List[Tuple[Mapping[str, Any], float]]
+
+
+class Metrics:
+    """Request latencies and status codes, in-flight requests and compute jobs."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.requests: Dict[Tuple[str, str], Histogram] = {}  # (method, route) -> latency
+        self.responses: Dict[Tuple[str, str, int], int] = {}  # (method, route, status) -> count
+        self.in_flight = 0
+        self.jobs: Dict[str, Histogram] = {}  # function -> job duration
+        self.job_items: Dict[Tuple[str, str], int] = {}  # (function, outcome) -> items
+        self.inline: Dict[str, Histogram] = {}  # function -> duration of calls outside the engine
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float) -> None:
+        histogram = self.requests.get((method, route))
+        if histogram is None:
+            histogram = self.requests.setdefault((method, route), Histogram(self.buckets))
+        histogram.observe(seconds)
+        key = (method, route, status)
+        self.responses[key] = self.responses.get(key, 0) + 1
+
+    def observe_job(self, fn: str, seconds: Optional[float], items: int = 1, outcome: str = "ok") -> None:
+        """One chart engine job of ``items`` calls to ``fn`` (more than one for batches).
+
+        ``seconds`` is None for jobs that never ran (rejected while busy).
+        """
+        if seconds is not None:
+            histogram = self.jobs.get(fn)
+            if histogram is None:
+                histogram = self.jobs.setdefault(fn, Histogram(self.buckets))
+            histogram.observe(seconds)
+        key = (fn, outcome)
+        self.job_items[key] = self.job_items.get(key, 0) + items
+
+    def observe_inline(self, fn: str, seconds: float) -> None:
+        """One call to ``fn`` run inline in a request, not on the chart engine."""
+        histogram = self.inline.get(fn)
+        if histogram is None:
+            histogram = self.inline.setdefault(fn, Histogram(self.buckets))
+        histogram.observe(seconds)
+
+    def render(self, gauges: Iterable[Gauge] = ()) -> str:
+        """Everything recorded, and ``gauges``, in the Prometheus text format."""
+        lines: List[str] = []
+        _histograms(lines, "http_request_duration_seconds", "HTTP request latency by route",
+                    ("method", "route"), self.requests)
+        _header(lines, "http_responses_total", "counter", "HTTP responses by route and status code")
+        for (method, route, status), count in sorted(self.responses.items()):
+            labels = {"method": method, "route": route, "status": status}
+            lines.append(_sample("http_responses_total", labels, count))
+        _header(lines, "http_requests_in_flight", "gauge", "HTTP requests being served")
+        lines.append(_sample("http_requests_in_flight", {}, self.in_flight))
+        _histograms(lines, "chart_engine_job_duration_seconds",
+                    "Chart engine job duration, queueing included, by function", ("fn",),
+                    {(fn,): histogram for fn, histogram in self.jobs.items()})
+        _header(lines, "chart_engine_calls_total", "counter", "Chart engine function calls by outcome")
+        for (fn, outcome), count in sorted(self.job_items.items()):
+            lines.append(_sample("chart_engine_calls_total", {"fn": fn, "outcome": outcome}, count))
+        _histograms(lines, "chart_inline_duration_seconds",
+                    "Chart function calls run inline in a request, off the chart engine, by function",
+                    ("fn",), {(fn,): histogram for fn, histogram in self.inline.items()})
+        for gauge in gauges:
+            _header(lines, gauge.name, "gauge", gauge.help)
+            for labels, value in gauge.samples:
+                lines.append(_sample(gauge.name, labels, value))
+        return "\n".join(lines) + "\n"
+
+
+def _header(lines: List[str], name: str, kind: str, help: str) -> None:
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+
+def _histograms(
+    lines: List[str],
+    name: str,
+    help: str,
+    label_names: Tuple[str, ...],
+    histograms: Mapping[Tuple[str, ...], Histogram]
+) -> None:
+    _header(lines, name, "histogram", help)
+    for key, histogram in sorted(histograms.items()):
+        labels = dict(zip(label_names, key))
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (math.inf,), list(histogram.counts)):
+            cumulative += count
+            le = "+Inf" if math.isinf(bound) else repr(bound)
+            lines.append(_sample(f"{name}_bucket", {**labels, "le": le}, cumulative))
+        lines.append(_sample(f"{name}_sum", labels, histogram.sum))
+        lines.append(_sample(f"{name}_count", labels, cumulative))
+
+def _sample(name: str, labels: Mapping[str, Any], value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+        name = f"{name}{{{rendered}}}"
+    if isinstance(value, bool):
+        value = int(value)
+    return f"{name} {value}"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and in-flight count per route."""
+
+    def __init__(self, app, registry: Optional[Metrics] = None):
+        self.app = app
+        self.metrics = registry or metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metrics = self.metrics
+        status = 500  # If the app fails before starting a response
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.in_flight += 1
+        began = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.in_flight -= 1
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            metrics.observe_request(
+                scope["method"], getattr(route, "path", "unmatched"), status, time.perf_counter() - began
+            )
+
+
+metrics = Metrics()
@@ -0,0 +1,299 @@
+"""Opt-in request profiling for the live process.
+
+``ProfilingMiddleware`` profiles a request when it is sampled
+(``PROFILE_SAMPLE_RATE``) or when it carries ``X-Profile-Token`` set to
+``PROFILE_TOKEN``. Captured profiles go into a bounded ring per route and
+are served by the ``/debug/profiles`` endpoints (same token required), as
+pstats files for ``snakeviz``/``pstats`` or as collapsed stacks for
+``flamegraph.pl``/speedscope.
+
+Two modes (``PROFILE_MODE``):
+
+- ``cprofile``: deterministic cProfile of the request, exact call counts
+  but slower while it runs;
+- ``sample``: a thread samples the serving thread's stack every
+  ``PROFILE_SAMPLE_INTERVAL`` seconds, which costs the request very little.
+
+One request is profiled at a time. Both modes see the whole event loop
+thread, so other requests that run concurrently show up in the profile.
+Without a token nobody could read the profiles, so nothing is sampled and
+the middleware passes requests straight through.
+
+Configuration (environment variables):
+
+- ``PROFILE_SAMPLE_RATE``: fraction of requests profiled, once
+  ``PROFILE_TOKEN`` is set (default: 0).
+- ``PROFILE_TOKEN``: secret that enables ``X-Profile-Token`` and the
+  ``/debug/profiles`` endpoints (default: unset, both disabled).
+- ``PROFILE_MODE``: ``cprofile`` or ``sample`` (default: ``cprofile``).
+- ``PROFILE_SAMPLE_INTERVAL``: seconds between stack samples (default: 0.001).
+- ``PROFILE_RING_SIZE``: profiles kept per route (default: 20).
+"""
+from typing import Any, Deque, Dict, List, Optional
+from collections import deque
+from datetime import datetime, timezone
+import cProfile
+import hmac
+import io
+import itertools
+import logging
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+TOKEN_HEADER = "X-Profile-Token"
+MODES = ("cprofile", "sample")
+
+logger = logging.getLogger(__name__)
+
+
+class CapturedProfile:
+    """One profiled request: pstats data (cprofile) or stack counts (sample)."""
+
+    __slots__ = ("id", "method", "route", "path", "status", "captured_at", "seconds", "mode", "stats", "stacks")
+
+    def __init__(self, id: int, method: str, route: str, path: str, mode: str):
+        self.id = id
+        self.method = method
+        self.route = route
+        self.path = path
+        self.status: Optional[int] = None
+        self.captured_at = datetime.now(timezone.utc)
+        self.seconds = 0.0
+        self.mode = mode
+        self.stats: Optional[Dict[Any, Any]] = None  # cProfile.Profile.stats
+        self.stacks: Optional[Dict[str, int]] = None  # "root;...;leaf" -> samples
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "route": self.route,
+            "path": self.path,
+            "status": self.status,
+            "captured_at": self.captured_at.isoformat(),
+            "duration_ms": round(self.seconds * 1000, 3),
+            "mode": self.mode,
+            "samples": sum(self.stacks.values()) if self.stacks is not None else None
+        }
+
+    def pstats_bytes(self) -> bytes:
+        """The profile in the ``.prof`` format ``pstats.Stats`` loads."""
+        return marshal.dumps(self.stats)
+
+    def pstats_text(self, limit: int = 50) -> str:
+        out = io.StringIO()
+        stats = pstats.Stats(_StatsHolder(self.stats), stream=out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return out.getvalue()
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one ``frame;frame;frame count`` line per stack."""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+class _StatsHolder:
+    """What ``pstats.Stats`` expects from a profiler, around stored stats."""
+
+    def __init__(self, stats: Dict[Any, Any]):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a background thread."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Dict[str, int]:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        stacks = self.stacks
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                stack = ";".join(reversed(names))
+                stacks[stack] = stacks.get(stack, 0) + 1
+
+
+class Profiler:
+    """Decides which requests to profile and keeps the captured profiles."""
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        token: Optional[str] = None,
+        mode: str = "cprofile",
+        sample_interval: float = 0.001,
+        ring_size: int = 20
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.sample_rate = sample_rate
+        self.token = token or None
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.ring_size = ring_size
+        self._rings: Dict[str, Deque[CapturedProfile]] = {}  # route -> newest profiles
+        self._busy = threading.Lock()  # Held while a request is profiled
+        self._ids = itertools.count(1)
+        self.captured = 0
+        self.skipped = 0  # Selected while another request was being profiled
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        profiler = cls(
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+            token=os.environ.get("PROFILE_TOKEN"),
+            mode=os.environ.get("PROFILE_MODE", "cprofile"),
+            sample_interval=float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.001")),
+            ring_size=int(os.environ.get("PROFILE_RING_SIZE", "20"))
+        )
+        if profiler.sample_rate > 0 and profiler.token is None:
+            logger.warning("PROFILE_SAMPLE_RATE is ignored: set PROFILE_TOKEN to read the profiles")
+        return profiler
+
+    @property
+    def enabled(self) -> bool:
+        return self.token is not None
+
+    def authorized(self, token: Optional[str]) -> bool:
+        return self.token is not None and token is not None and hmac.compare_digest(token, self.token)
+
+    def selects(self, header_token: Optional[str]) -> bool:
+        """Whether to profile a request carrying ``header_token`` (or none)."""
+        if self.token is None:
+            return False
+        if header_token is not None and self.authorized(header_token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def begin(self, method: str, path: str) -> Optional["_Capture"]:
+        """Start profiling the calling thread, unless a profile is already running."""
+        if not self._busy.acquire(blocking=False):
+            self.skipped += 1
+            return None
+        profile = CapturedProfile(next(self._ids), method, "unmatched", path, self.mode)
+        return _Capture(self, profile)
+
+    def _keep(self, profile: CapturedProfile) -> None:
+        ring = self._rings.get(profile.route)
+        if ring is None:
+            ring = self._rings.setdefault(profile.route, deque(maxlen=self.ring_size))
+        ring.append(profile)
+        self.captured += 1
+
+    def profiles(self, route: Optional[str] = None) -> List[CapturedProfile]:
+        """Kept profiles, newest first, optionally for one route template."""
+        rings = [self._rings.get(route, ())] if route is not None else list(self._rings.values())
+        return sorted((p for ring in rings for p in list(ring)), key=lambda p: p.id, reverse=True)
+
+    def get(self, profile_id: int) -> Optional[CapturedProfile]:
+        for ring in list(self._rings.values()):
+            for profile in list(ring):
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def clear(self) -> None:
+        self._rings.clear()
+
+
+class _Capture:
+    """A profile in progress, for ``ProfilingMiddleware``."""
+
+    def __init__(self, profiler: Profiler, profile: CapturedProfile):
+        self.profiler = profiler
+        self.profile = profile
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+        self._began = time.perf_counter()
+        if profile.mode == "cprofile":
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        else:
+            self._sampler = StackSampler(threading.get_ident(), profiler.sample_interval)
+            self._sampler.start()
+
+    def finish(self, route: str, status: Optional[int]) -> CapturedProfile:
+        profile = self.profile
+        try:
+            if self._cprofile is not None:
+                self._cprofile.disable()
+                self._cprofile.create_stats()
+                profile.stats = self._cprofile.stats
+            else:
+                profile.stacks = self._sampler.stop()
+            profile.seconds = time.perf_counter() - self._began
+            profile.route = route
+            profile.status = status
+            self.profiler._keep(profile)
+        finally:
+            self.profiler._busy.release()
+        return profile
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests ``Profiler.selects``."""
+
+    def __init__(self, app, registry: Optional[Profiler] = None):
+        self.app = app
+        self.profiler = registry or profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if scope["type"] != "http" or not profiler.enabled or scope["path"].startswith("/debug/"):
+            await self.app(scope, receive, send)
+            return
+        header_token = None
+        if profiler.token is not None:
+            for name, value in scope["headers"]:
+                if name == b"x-profile-token":
+                    header_token = value.decode("latin-1")
+                    break
+        if not profiler.selects(header_token):
+            await self.app(scope, receive, send)
+            return
+        capture = profiler.begin(scope["method"], scope["path"])
+        if capture is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            capture.finish(getattr(route, "path", "unmatched"), status)
+
+
+profiler = Profiler.from_env()
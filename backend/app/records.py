@@ -0,0 +1,175 @@
+"""Compact chart records stored in ``db["charts"]``.
+
+A ``ChartRecord`` keeps the request metadata plus the positions array
+produced by ``app.charts.compute_chart`` (body longitudes and speeds, house
+cusps, angles and solar-time offsets). Everything else in a chart response,
+including the basic interpretation, is derived from that array on demand.
+No flatlib ``Chart`` object is kept alive after the computation.
+"""
+from typing import Any, Callable, Dict, Iterable, Optional
+from array import array
+from time import perf_counter
+import hashlib
+import sys
+
+from app.charts import (
+    houses_data, interpret_chart, planets_data, solar_time_fields
+)
+from app.interpretations import DEFAULT_LANGUAGE
+from app.metrics import metrics
+
+
+class ChartRecord:
+    """One stored chart, sized to stay small under load."""
+
+    __slots__ = (
+        "id", "date", "time", "latitude", "longitude",
+        "house_time", "house_system", "positions",
+        "is_premium_unlocked", "premium_interpretation", "language"
+    )
+
+    def __init__(
+        self,
+        id: str,
+        date: str,
+        time: str,
+        latitude: float,
+        longitude: float,
+        house_time: str,
+        house_system: str,
+        positions: array,
+        language: str = DEFAULT_LANGUAGE
+    ):
+        self.id = id
+        self.date = date
+        self.time = time
+        self.latitude = latitude
+        self.longitude = longitude
+        self.house_time = sys.intern(house_time)
+        self.house_system = sys.intern(house_system)
+        self.positions = positions
+        self.is_premium_unlocked = False
+        self.premium_interpretation: Optional[str] = None
+        self.language = sys.intern(language)  # Of the premium text: the creator's, then the unlocker's
+
+    def project(self, fields: Iterable[str], language: str = DEFAULT_LANGUAGE) -> Dict[str, Any]:
+        """Only ``fields`` of the ``ChartResponse`` payload (names from ``RESPONSE_FIELDS``).
+
+        Nothing else is derived from the positions, so asking for the
+        planets alone skips the houses, interpretation and solar time.
+        """
+        response: Dict[str, Any] = {}
+        solar = None
+        for name in fields:
+            if name in SOLAR_FIELDS:
+                if solar is None:
+                    solar = solar_time_fields(self.positions)
+                response[name] = solar[name]
+            else:
+                response[name] = FIELD_VALUES[name](self, language)
+        return response
+
+    def etag(self, fields: Iterable[str], language: str = DEFAULT_LANGUAGE) -> str:
+        """ETag of ``project(fields, language)``, without building it.
+
+        The positions never change after computation; only a premium unlock
+        changes a stored chart.
+        """
+        state = f"{self.id}|{self.is_premium_unlocked}|{language}|{','.join(fields)}"
+        return f'"{hashlib.blake2b(state.encode(), digest_size=16).hexdigest()}"'
+
+    def to_response(self, language: str = DEFAULT_LANGUAGE) -> Dict[str, Any]:
+        """Build the ``ChartResponse`` payload for this chart, interpreted in ``language``."""
+        return {
+            "id": self.id,
+            "date": self.date,
+            "time": self.time,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "planets": planets_data(self.positions),
+            "houses": houses_data(self.positions),
+            "basic_interpretation": basic_interpretation(self.positions, language),
+            "is_premium_unlocked": self.is_premium_unlocked,
+            "premium_interpretation": self.premium_interpretation,
+            "house_time": self.house_time,
+            "house_system": self.house_system,
+            **solar_time_fields(self.positions)
+        }
+
+    def unlocked(self, premium_interpretation: str, language: str) -> "ChartRecord":
+        """A copy of this chart with its premium interpretation unlocked.
+
+        Stored records are replaced, never edited, so a snapshot or a
+        rolled back update never sees half an unlock.
+        """
+        record = ChartRecord(
+            self.id, self.date, self.time, self.latitude, self.longitude,
+            self.house_time, self.house_system, self.positions, language
+        )
+        record.is_premium_unlocked = True
+        record.premium_interpretation = premium_interpretation
+        return record
+
+    def __reduce__(self):
+        # Flat tuple with the positions as raw bytes: several times faster
+        # to pickle than the default slot state (ledger, snapshots, spill)
+        return _restore_record, (
+            self.id, self.date, self.time, self.latitude, self.longitude,
+            self.house_time, self.house_system, self.positions.tobytes(),
+            self.is_premium_unlocked, self.premium_interpretation, self.language
+        )
+
+    def nbytes(self) -> int:
+        """Approximate memory held by this record, in bytes.
+
+        Counts the record itself plus every object it references that is
+        not shared (interned strings and small ints/floats are skipped).
+        """
+        size = sys.getsizeof(self)
+        for name in ("id", "date", "time", "latitude", "longitude", "positions",
+                     "premium_interpretation"):
+            value = getattr(self, name)
+            if value is not None:
+                size += sys.getsizeof(value)
+        return size
+
+
+def basic_interpretation(positions: array, language: str = DEFAULT_LANGUAGE) -> str:
+    """The basic interpretation, computed inline and timed like engine jobs."""
+    began = perf_counter()
+    basic = interpret_chart(positions, False, language)["basic"]
+    metrics.observe_inline("interpret_chart", perf_counter() - began)
+    return basic
+
+
+def _restore_record(
+    id: str, date: str, time: str, latitude: float, longitude: float, house_time: str,
+    house_system: str, positions: bytes, is_premium_unlocked: bool, premium_interpretation: Optional[str],
+    language: str = DEFAULT_LANGUAGE  # Absent from records logged before charts kept it
+) -> ChartRecord:
+    record = ChartRecord(
+        id, date, time, latitude, longitude, house_time, house_system, array("d", positions), language
+    )
+    record.is_premium_unlocked = is_premium_unlocked
+    record.premium_interpretation = premium_interpretation
+    return record
+
+
+SOLAR_FIELDS = ("standard_time", "solar_time", "solar_interpretation")  # from solar_time_fields
+
+# ChartResponse field -> its value for a record, in response order
+FIELD_VALUES: Dict[str, Callable[[ChartRecord, str], Any]] = {
+    "id": lambda record, language: record.id,
+    "date": lambda record, language: record.date,
+    "time": lambda record, language: record.time,
+    "latitude": lambda record, language: record.latitude,
+    "longitude": lambda record, language: record.longitude,
+    "planets": lambda record, language: planets_data(record.positions),
+    "houses": lambda record, language: houses_data(record.positions),
+    "basic_interpretation": lambda record, language: basic_interpretation(record.positions, language),
+    "is_premium_unlocked": lambda record, language: record.is_premium_unlocked,
+    "premium_interpretation": lambda record, language: record.premium_interpretation,
+    "house_time": lambda record, language: record.house_time,
+    "house_system": lambda record, language: record.house_system
+}
+RESPONSE_FIELDS = tuple(FIELD_VALUES) + SOLAR_FIELDS
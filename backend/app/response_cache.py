@@ -0,0 +1,121 @@
+"""Pre-serialized JSON responses with ETags for hot read endpoints.
+
+Every app open asks for the product list and the user's level. Both change
+rarely, so the JSON body is serialized once and kept as bytes together with
+its ETag and the version of the data it was built from. A lookup with the
+current version returns those bytes as they are; a newer version rebuilds
+the entry. A request whose ``If-None-Match`` holds the ETag gets a 304
+without any serialization.
+
+Versions come from the storage backend, so a product saved through one
+worker invalidates the product list of every worker on the same database.
+ETags are digests of the body, so they stay valid across restarts and
+workers.
+
+Configuration (environment variables):
+
+- ``RESPONSE_CACHE_SIZE``: maximum cached responses (default: 10000).
+"""
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+
+from fastapi import Response
+
+
+class CachedResponse(NamedTuple):
+    version: Hashable
+    body: bytes
+    etag: str
+
+
+def json_bytes(content: Any) -> bytes:
+    """``content`` serialized the way FastAPI's ``JSONResponse`` does."""
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an ``If-None-Match`` header lists ``etag`` (weak comparison)."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+class ResponseCache:
+    """Thread-safe LRU of serialized responses, each valid for one data version."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0  # Misses on an entry built from an older version
+        self.not_modified = 0  # 304 responses
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", "10000")))
+
+    def lookup(self, key: Hashable, version: Hashable) -> Optional[CachedResponse]:
+        """The entry for ``key`` if it was built from ``version``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            if entry is not None:
+                self.invalidations += 1
+            return None
+
+    def put(self, key: Hashable, version: Hashable, content: Any) -> CachedResponse:
+        """Serialize ``content``, built from ``version`` of the data, and keep it."""
+        body = json_bytes(content)
+        entry = CachedResponse(version, body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+        if self.max_entries <= 0:
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def respond(self, entry: CachedResponse, if_none_match: Optional[str] = None) -> Response:
+        """200 with the cached body, or 304 if the client already has it."""
+        headers = {"ETag": entry.etag}
+        if if_none_match is not None and etag_matches(if_none_match, entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+response_cache = ResponseCache.from_env()
@@ -0,0 +1,129 @@
+"""Incremental revenue rollups.
+
+Revenue rows are appended to ``db["revenue"]`` and never change, so the
+rollup aggregates them as they arrive: per source, per hour and per day.
+A date-range summary then adds up whole day buckets, and only the two
+partial days at the edges are refined, from their hour buckets and, for
+the partial hours, from the raw rows those hour buckets keep. That makes
+``/revenue/summary`` O(buckets) instead of several passes over all rows.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def _floor(dt: datetime, unit: timedelta) -> datetime:
+    if unit == HOUR:
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class RevenueBucket:
+    """Revenue amount per source and row count over some span of time."""
+
+    __slots__ = ("amounts", "count", "rows")
+
+    def __init__(self, keep_rows: bool = False):
+        self.amounts: Dict[str, float] = {}
+        self.count = 0
+        # Hour buckets keep their rows so partial hours can be refined
+        self.rows: Optional[List[Dict[str, Any]]] = [] if keep_rows else None
+
+    def add(self, row: Dict[str, Any]) -> None:
+        source = row["source"]
+        self.amounts[source] = self.amounts.get(source, 0.0) + row["amount"]
+        self.count += 1
+        if self.rows is not None:
+            self.rows.append(row)
+
+    def merge(self, other: "RevenueBucket") -> None:
+        for source, amount in other.amounts.items():
+            self.amounts[source] = self.amounts.get(source, 0.0) + amount
+        self.count += other.count
+
+    def amount(self, source: str) -> float:
+        return self.amounts.get(source, 0.0)
+
+
+class RevenueRollup:
+    """Hour and day buckets over revenue rows, updated on every append."""
+
+    def __init__(self, rows: Optional[List[Dict[str, Any]]] = None):
+        self._buckets: Dict[timedelta, Dict[datetime, RevenueBucket]] = {HOUR: {}, DAY: {}}
+        self._keys: Dict[timedelta, List[datetime]] = {HOUR: [], DAY: []}
+        # Latest bucket per unit as (start, end, bucket): consecutive rows
+        # nearly always share it, which skips the floor and dict lookups
+        self._last: Dict[timedelta, Tuple[datetime, datetime, RevenueBucket]] = {}
+        for row in rows or ():
+            self.add(row)
+
+    def add(self, row: Dict[str, Any]) -> None:
+        created_at = row["created_at"]
+        for unit in (HOUR, DAY):
+            last = self._last.get(unit)
+            if last is not None and last[0] <= created_at < last[1]:
+                last[2].add(row)
+                continue
+            key = _floor(created_at, unit)
+            buckets = self._buckets[unit]
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = RevenueBucket(keep_rows=unit == HOUR)
+                keys = self._keys[unit]
+                # Rows almost always arrive in time order, so this appends
+                if not keys or keys[-1] < key:
+                    keys.append(key)
+                else:
+                    insort(keys, key)
+            self._last[unit] = (key, key + unit, bucket)
+            bucket.add(row)
+
+    def buckets(
+        self,
+        unit: timedelta,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        within: Optional[Tuple[datetime, datetime]] = None
+    ) -> Iterator[Tuple[datetime, RevenueBucket]]:
+        """Non-empty ``unit`` buckets overlapping ``[start, end]``, clipped to it.
+
+        Buckets entirely inside the range are yielded as stored; edge
+        buckets are recomputed for just the part inside the range.
+        ``within`` limits the bucket keys to a half-open span.
+        """
+        keys = self._keys[unit]
+        buckets = self._buckets[unit]
+        lo = 0 if start is None else bisect_left(keys, _floor(start, unit))
+        hi = len(keys) if end is None else bisect_right(keys, end)
+        if within is not None:
+            lo = max(lo, bisect_left(keys, within[0]))
+            hi = min(hi, bisect_left(keys, within[1]))
+
+        for i in range(lo, hi):
+            key = keys[i]
+            bucket = buckets[key]
+            if (start is None or start <= key) and (end is None or key + unit <= end):
+                yield key, bucket
+                continue
+
+            part = RevenueBucket()
+            if unit == DAY:
+                for _, hour in self.buckets(HOUR, start, end, within=(key, key + DAY)):
+                    part.merge(hour)
+            else:
+                for row in bucket.rows:
+                    created_at = row["created_at"]
+                    if (start is None or created_at >= start) and (end is None or created_at <= end):
+                        part.add(row)
+            if part.count:
+                yield key, part
+
+    def total(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> RevenueBucket:
+        """Revenue of all rows with ``start <= created_at <= end``."""
+        total = RevenueBucket()
+        for _, bucket in self.buckets(DAY, start, end):
+            total.merge(bucket)
+        return total
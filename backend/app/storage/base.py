@@ -0,0 +1,209 @@
+"""Storage interface shared by the memory, SQLite and Postgres backends.
+
+Rows are plain dicts shaped like the API models (``User``, ``Product``,
+``Reading``, ``Transaction``, ``Revenue``) and charts are ``ChartRecord``
+objects, whatever the backend keeps underneath.
+
+Everything that changes a user's balance goes through ``update_user``,
+which stages the new transaction and revenue rows next to the modified
+user and writes them all at once, so a balance and its ledger never
+disagree. ``update_user`` also holds the user's stripe of ``user_locks``
+from the read to the write, so the balance check in the block and the
+change it guards are atomic for that user while other users proceed in
+parallel. Do not call the storage again from inside the block.
+"""
+from typing import Any, AsyncContextManager, Dict, List, Optional, Sequence, Tuple
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+import os
+import unicodedata
+
+from app.indexes import IndexKey, IndexPage
+from app.locks import StripedLock
+from app.records import ChartRecord
+from app.revenue import RevenueBucket
+
+# Seeded into every backend so the shop works out of the box
+DEFAULT_PRODUCTS = [
+    {
+        "id": "1",
+        "name": "完整韦特牌组",
+        "description": "包含所有78张韦特牌的完整牌组",
+        "price": 99,
+        "image": "🎴"
+    },
+    {
+        "id": "2",
+        "name": "专业牌阵解读",
+        "description": "解锁更多专业牌阵和详细解读",
+        "price": 49,
+        "image": "📚"
+    }
+]
+
+
+def normalize_username(username: str) -> str:
+    """Key for the username index: usernames are unique ignoring case."""
+    return unicodedata.normalize("NFKC", username).casefold()
+
+
+def new_user(user_id: str, username: str) -> Dict[str, Any]:
+    return {
+        "id": user_id,
+        "username": username,
+        "purchased_products": [],
+        "experience": 0,
+        "balance": 0,
+        "language": "en"  # Default to English
+    }
+
+
+class UserUpdate:
+    """Changes to one user staged inside ``Storage.update_user``.
+
+    ``user`` is a private copy; edit it in place. Rows added here are
+    written together with it when the ``async with`` block exits cleanly
+    and discarded if it raises.
+    """
+
+    __slots__ = ("user", "transactions", "revenue", "charts")
+
+    def __init__(self, user: Dict[str, Any]):
+        self.user = user
+        self.transactions: List[Dict[str, Any]] = []
+        self.revenue: List[Dict[str, Any]] = []
+        self.charts: List[ChartRecord] = []
+
+    def add_transaction(self, transaction: Dict[str, Any]) -> None:
+        self.transactions.append(transaction)
+
+    def add_revenue(self, revenue: Dict[str, Any]) -> None:
+        self.revenue.append(revenue)
+
+    def save_chart(self, record: ChartRecord) -> None:
+        self.charts.append(record)
+
+
+class Storage(ABC):
+    """Repository for users, products, charts, readings, transactions and revenue."""
+
+    def __init__(self):
+        # Serializes update_user per user (USER_LOCK_STRIPES locks in total)
+        self.user_locks = StripedLock(int(os.environ.get("USER_LOCK_STRIPES", 1024)))
+
+    async def open(self) -> None:
+        """Acquire connections; called once at startup."""
+
+    async def close(self) -> None:
+        """Release connections; called once at shutdown."""
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Resident and spilled rows of memory-budgeted tables, by table."""
+        return {}
+
+    def table_sizes(self) -> Dict[str, int]:
+        """Rows per table, where counting is free (the memory backend)."""
+        return {}
+
+    # Users
+
+    @abstractmethod
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        """Look a user up by username, ignoring case."""
+
+    @abstractmethod
+    async def create_user(self, username: str) -> Dict[str, Any]:
+        """Create a user, or return the one that already has this username.
+
+        Uniqueness is enforced atomically: of two concurrent signups for
+        the same name, exactly one creates the account.
+        """
+
+    @abstractmethod
+    def update_user(self, user_id: str) -> AsyncContextManager[Optional[UserUpdate]]:
+        """Modify a user atomically::
+
+            async with storage.update_user(user_id) as update:
+                if update is None:
+                    ...  # no such user
+                update.user["balance"] -= price
+                update.add_transaction({...})
+
+        Yields None for an unknown user. Concurrent updates of the same
+        user are serialized; keep the block short and free of awaits.
+        """
+
+    # Products
+
+    @abstractmethod
+    async def list_products(self) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_product(self, product_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def save_product(self, product: Dict[str, Any]) -> None:
+        """Insert or replace a product, and bump ``products_version``."""
+
+    @abstractmethod
+    async def products_version(self) -> int:
+        """Count of product saves, as seen by every worker of this storage.
+
+        Cached product listings are rebuilt when it moves.
+        """
+
+    # Charts
+
+    @abstractmethod
+    async def get_chart(self, chart_id: str) -> Optional[ChartRecord]:
+        ...
+
+    @abstractmethod
+    async def save_charts(self, records: Sequence[ChartRecord]) -> None:
+        """Insert or replace charts."""
+
+    async def save_chart(self, record: ChartRecord) -> None:
+        await self.save_charts([record])
+
+    # Readings and transactions, paged by (created_at, id)
+
+    @abstractmethod
+    async def add_reading(self, reading: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def readings_page(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        before: Optional[IndexKey] = None,
+        after: Optional[IndexKey] = None
+    ) -> IndexPage:
+        """A page of a user's readings, as ``OrderedIndex.page`` defines it."""
+
+    @abstractmethod
+    async def transactions_page(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        before: Optional[IndexKey] = None,
+        after: Optional[IndexKey] = None
+    ) -> IndexPage:
+        """A page of a user's transactions, as ``OrderedIndex.page`` defines it."""
+
+    # Revenue
+
+    @abstractmethod
+    async def revenue_summary(
+        self,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        unit: timedelta
+    ) -> Tuple[RevenueBucket, List[Tuple[datetime, RevenueBucket]]]:
+        """Revenue with ``start <= created_at <= end``: totals and ``unit`` buckets."""
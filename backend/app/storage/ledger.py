@@ -0,0 +1,217 @@
+"""Append-only ledger that makes the in-memory backend durable.
+
+Every change ``MemoryStorage`` makes is appended to a binary log as
+``(kind, row)`` records. The records of one append form one frame::
+
+    <u32 payload length> <u32 crc32 of payload> <pickled [(kind, row), ...]>
+
+A single writer thread owns the log file. Appends queue their frames and
+get the future of the batch they joined; the writer takes everything
+queued so far, writes it, calls ``fsync`` once for the whole batch (group
+commit) and resolves that one future. While one ``fsync`` runs the next
+batch collects, so the number of disk flushes, and of wakeups on the
+appending side, stays flat as the append rate grows.
+
+The log is split into numbered segments (``ledger-00000001.log``, ...).
+A snapshot ``snapshot-N.pickle`` holds the full state as of the start of
+segment ``N``; once it is written, older segments and snapshots are
+deleted. Recovery loads the newest snapshot and replays only the segments
+from ``N`` on, stopping at the first torn or corrupt frame.
+"""
+from typing import Any, Iterator, List, Optional, Tuple
+from concurrent.futures import Future
+import os
+import pickle
+import re
+import struct
+import threading
+import zlib
+
+FRAME_HEADER = struct.Struct("<II")
+SEGMENT_NAME = "ledger-{:08d}.log"
+SNAPSHOT_NAME = "snapshot-{:08d}.pickle"
+_FILE_PATTERN = re.compile(r"(ledger|snapshot)-(\d{8})\.(log|pickle)$")
+
+Record = Tuple[str, Any]
+
+
+def encode_frame(records: List[Record]) -> bytes:
+    payload = pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_frames(path: str) -> Tuple[List[Record], int]:
+    """Decode the records of one segment and the length of its valid prefix."""
+    with open(path, "rb") as f:
+        data = f.read()
+    records, offset = [], 0
+    while offset + FRAME_HEADER.size <= len(data):
+        length, checksum = FRAME_HEADER.unpack_from(data, offset)
+        start = offset + FRAME_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break  # Torn write at the tail
+        records.extend(pickle.loads(payload))
+        offset = start + length
+    return records, offset
+
+
+class _Rotate:
+    """Queue marker: switch the writer to segment ``number``."""
+
+    def __init__(self, number: int):
+        self.number = number
+
+
+class Ledger:
+    """Segmented append-only log plus snapshots, in one directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segment = 0  # Segment the writer appends to
+        self._queue: List[Any] = []
+        self._batch: Future = Future()  # Resolves when the queued frames are on disk
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.fsyncs = 0  # Disk flushes so far, for benchmarks
+
+    def _path(self, name: str, number: int) -> str:
+        return os.path.join(self.directory, name.format(number))
+
+    def _files(self, kind: str) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = _FILE_PATTERN.match(name)
+            if match and match.group(1) == kind:
+                numbers.append(int(match.group(2)))
+        return sorted(numbers)
+
+    # Recovery
+
+    def recover(self) -> Tuple[Optional[Any], Iterator[Record]]:
+        """Load the newest snapshot and the records logged after it.
+
+        Returns ``(state, records)``; ``state`` is None without a snapshot.
+        Call before ``start``. A torn tail is cut off the last segment.
+        """
+        snapshots = self._files("snapshot")
+        state, first = None, 0
+        if snapshots:
+            first = snapshots[-1]
+            with open(self._path(SNAPSHOT_NAME, first), "rb") as f:
+                state = pickle.load(f)
+        segments = [n for n in self._files("ledger") if n >= first]
+        self.segment = max(segments[-1] if segments else 0, first)
+        return state, self._replay(segments)
+
+    def _replay(self, segments: List[int]) -> Iterator[Record]:
+        for number in segments:
+            path = self._path(SEGMENT_NAME, number)
+            records, valid = read_frames(path)
+            if valid < os.path.getsize(path):
+                with open(path, "r+b") as f:
+                    f.truncate(valid)
+            yield from records
+
+    # Writing
+
+    def start(self) -> None:
+        """Start the writer thread, appending to the current segment."""
+        self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, records: List[Record]) -> Future:
+        """Queue ``records``; the returned future resolves once they are fsynced.
+
+        Appends that join the same batch get the same future.
+        """
+        frame = encode_frame(records)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Ledger is closed")
+            self._queue.append(frame)
+            self._cond.notify()
+            return self._batch
+
+    def rotate(self) -> int:
+        """Start a new segment for later appends and return its number.
+
+        Everything appended before this call lands in earlier segments, so
+        a snapshot of the state at this moment belongs to the new number.
+        """
+        with self._cond:
+            self.segment += 1
+            self._queue.append(_Rotate(self.segment))
+            self._cond.notify()
+            return self.segment
+
+    def _run(self) -> None:
+        f = open(self._path(SEGMENT_NAME, self.segment), "ab")
+        try:
+            while True:
+                with self._cond:
+                    while not self._queue and not self._closed:
+                        self._cond.wait()
+                    if not self._queue and self._closed:
+                        return
+                    batch, self._queue = self._queue, []
+                    done, self._batch = self._batch, Future()
+                try:
+                    for item in batch:
+                        if isinstance(item, _Rotate):
+                            self._sync(f)
+                            f.close()
+                            f = open(self._path(SEGMENT_NAME, item.number), "ab")
+                        else:
+                            f.write(item)
+                    self._sync(f)
+                except BaseException as e:
+                    # Fail this batch and everything after it; the log can
+                    # no longer promise durability
+                    with self._cond:
+                        self._closed = True
+                        self._queue = []
+                    done.set_exception(e)
+                    self._batch.set_exception(e)
+                    raise
+                done.set_result(None)
+        finally:
+            f.close()
+
+    def _sync(self, f) -> None:
+        f.flush()
+        os.fsync(f.fileno())
+        self.fsyncs += 1
+
+    # Snapshots
+
+    def write_snapshot(self, number: int, state: Any) -> None:
+        """Write ``state`` as snapshot ``number`` and drop what it replaces."""
+        path = self._path(SNAPSHOT_NAME, number)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        for old in self._files("snapshot"):
+            if old < number:
+                os.remove(self._path(SNAPSHOT_NAME, old))
+        for old in self._files("ledger"):
+            if old < number:
+                os.remove(self._path(SEGMENT_NAME, old))
+
+    def close(self) -> None:
+        """Flush what is queued and stop the writer."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
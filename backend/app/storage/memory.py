@@ -0,0 +1,377 @@
+"""In-memory storage: plain dicts and lists in one process.
+
+Fast and dependency free, for development and tests. State is not shared
+between worker processes. Without a ledger nothing survives a restart;
+with one (``STORAGE_URL=memory:///path/to/dir``) every change is appended
+to a group-committed log before the request answers, and startup replays
+the newest snapshot plus the log tail (see ``app.storage.ledger``).
+
+``charts`` and ``readings`` can be held to a memory budget
+(``CHARTS_MEMORY_MB``/``READINGS_MEMORY_MB``), spilling their coldest rows
+to a file in ``SPILL_DIR`` (default: the ledger directory, or a temporary
+one) and reading them back on access (see ``app.storage.spill``).
+"""
+from typing import Any, Awaitable, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import asyncio
+import gc
+import os
+import threading
+import uuid
+
+from app.indexes import IndexKey, IndexPage, OrderedIndex
+from app.records import ChartRecord
+from app.revenue import RevenueBucket, RevenueRollup
+from app.storage.base import (
+    DEFAULT_PRODUCTS, Storage, UserUpdate, new_user, normalize_username
+)
+from app.storage.ledger import Ledger, Record
+from app.storage.spill import SpillingDict, deep_sizeof, spilling_table
+
+# Tables written to snapshots; the indexes are rebuilt from them on load
+SNAPSHOT_TABLES = ("users", "transactions", "revenue", "products", "charts", "readings")
+# Tables that may spill to disk, with the size estimate of one row
+SPILLING_TABLES = (("charts", ChartRecord.nbytes), ("readings", deep_sizeof))
+
+
+def empty_db() -> Dict[str, Any]:
+    """Fresh tables, with the default products and a development test user."""
+    return {
+        "users": {
+            "test_user_123": {  # Test user for development
+                "id": "test_user_123",
+                "username": "Test User",
+                "balance": 5000,  # Give test user enough balance for premium features
+                "experience": 0,
+                "purchased_products": [],
+                "language": "en"
+            }
+        },
+        "users_by_username": {"test user": "test_user_123"},  # normalize_username() -> user_id
+        "transactions": [],
+        "transactions_by_user": {},  # user_id -> OrderedIndex of that user's transactions
+        "revenue": [],
+        "revenue_rollup": RevenueRollup(),  # hour/day buckets over "revenue"
+        "products": {product["id"]: dict(product) for product in DEFAULT_PRODUCTS},
+        "charts": {},  # chart_id -> ChartRecord
+        "readings": {},
+        "readings_by_user": {}  # user_id -> OrderedIndex of that user's reading ids
+    }
+
+
+def _copy_user(user: Dict[str, Any]) -> Dict[str, Any]:
+    return {**user, "purchased_products": list(user.get("purchased_products", []))}
+
+
+class MemoryStorage(Storage):
+    """Keeps every table in ``self.db``; the tests reset its entries directly.
+
+    With ``ledger_dir`` set, changes are logged there and a snapshot is
+    taken every ``snapshot_rows`` logged records (``LEDGER_SNAPSHOT_ROWS``).
+    ``memory_budgets`` maps ``charts``/``readings`` to megabytes they may
+    keep resident (default: ``<TABLE>_MEMORY_MB``, ``0`` for no limit).
+    """
+
+    def __init__(
+        self,
+        db: Optional[Dict[str, Any]] = None,
+        ledger_dir: Optional[str] = None,
+        snapshot_rows: Optional[int] = None,
+        memory_budgets: Optional[Dict[str, float]] = None,
+        spill_dir: Optional[str] = None
+    ):
+        super().__init__()
+        self._products_version = 0  # Bumped by every product saved or replayed
+        self.db = empty_db() if db is None else db
+        spill_dir = spill_dir or os.environ.get("SPILL_DIR") or ledger_dir
+        for name, sizeof in SPILLING_TABLES:
+            if memory_budgets is None:
+                budget = float(os.environ.get(f"{name.upper()}_MEMORY_MB", 0))
+            else:
+                budget = memory_budgets.get(name, 0)
+            table = spilling_table(spill_dir, name, budget, sizeof)
+            if table is not None:
+                table.update(self.db[name])
+                self.db[name] = table
+        self.ledger = Ledger(ledger_dir) if ledger_dir else None
+        self.snapshot_rows = snapshot_rows or int(os.environ.get("LEDGER_SNAPSHOT_ROWS", 1_000_000))
+        self._logged = 0  # Records logged since the last snapshot
+        self._snapshot_thread: Optional[threading.Thread] = None
+        # (ledger batch, loop, asyncio future) of the latest append, so the
+        # appends of one batch share a single cross-thread wakeup
+        self._durable: Optional[Tuple[Future, asyncio.AbstractEventLoop, asyncio.Future]] = None
+
+    async def open(self) -> None:
+        if self.ledger is None:
+            return
+        # Recovery allocates millions of long-lived rows; collector passes
+        # over them would cost more than the loading itself
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            state, records = self.ledger.recover()
+            if state is not None:
+                self._load_snapshot(state)
+            for kind, row in records:
+                self._apply(kind, row)
+                self._logged += 1
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self.ledger.start()
+
+    async def close(self) -> None:
+        if self.ledger is not None:
+            if self._snapshot_thread is not None:
+                self._snapshot_thread.join()
+            # A fresh snapshot keeps the next startup to a snapshot load
+            if self._logged:
+                self.ledger.write_snapshot(self.ledger.rotate(), self._snapshot_state())
+            self.ledger.close()
+        for name, _ in SPILLING_TABLES:
+            if isinstance(self.db[name], SpillingDict):
+                self.db[name].close()
+
+    def table_sizes(self) -> Dict[str, int]:
+        return {name: len(self.db[name]) for name in SNAPSHOT_TABLES}
+
+    def memory_stats(self) -> Dict[str, Any]:
+        return {
+            name: self.db[name].stats()
+            for name, _ in SPILLING_TABLES if isinstance(self.db[name], SpillingDict)
+        }
+
+    # Ledger
+
+    def _apply(self, kind: str, row: Any) -> None:
+        """Replay one logged change."""
+        if kind == "user":
+            self.db["users"][row["id"]] = row
+            self.db["users_by_username"][normalize_username(row["username"])] = row["id"]
+        elif kind == "transaction":
+            self.record_transaction(row)
+        elif kind == "revenue":
+            self.record_revenue(row)
+        elif kind == "chart":
+            self.db["charts"][row.id] = row
+        elif kind == "reading":
+            self._store_reading(row)
+        elif kind == "product":
+            self.db["products"][row["id"]] = row
+            self._products_version += 1
+
+    async def _log(self, records: List[Record]) -> None:
+        """Append changes already applied in memory; returns once durable."""
+        durable = self._append(records)
+        if durable is not None:
+            await durable
+
+    def _append(self, records: List[Record]) -> Optional[Awaitable[None]]:
+        """Queue changes already applied in memory; await the result for durability.
+
+        Callers apply a change and call this without awaiting in between,
+        so a snapshot never sees a change whose record lands after it.
+        """
+        if self.ledger is None:
+            return None
+        done = self.ledger.append(records)
+        self._logged += len(records)
+        if self._logged >= self.snapshot_rows and not (
+            self._snapshot_thread is not None and self._snapshot_thread.is_alive()
+        ):
+            self._start_snapshot()
+        loop = asyncio.get_running_loop()
+        if self._durable is None or self._durable[0] is not done or self._durable[1] is not loop:
+            self._durable = (done, loop, asyncio.wrap_future(done, loop=loop))
+        # Shielded: a cancelled request must not cancel the shared future
+        return asyncio.shield(self._durable[2])
+
+    def _snapshot_state(self) -> Dict[str, Any]:
+        # Shallow copies: stored rows are replaced, not edited (users are
+        # copied by update_user, charts by ChartRecord.unlocked), so the
+        # copies stay a consistent view while they are pickled. Spilling
+        # tables copy only their resident rows here; the spilled ones are
+        # read from disk while the snapshot thread pickles them.
+        self._logged = 0
+        return {
+            name: self.db[name].snapshot() if isinstance(self.db[name], SpillingDict) else self.db[name].copy()
+            for name in SNAPSHOT_TABLES
+        }
+
+    def _start_snapshot(self) -> None:
+        number = self.ledger.rotate()
+        self._snapshot_thread = threading.Thread(
+            target=self.ledger.write_snapshot,
+            args=(number, self._snapshot_state()),
+            name="ledger-snapshot",
+            daemon=True
+        )
+        self._snapshot_thread.start()
+
+    def _load_snapshot(self, state: Dict[str, Any]) -> None:
+        # The snapshot is unpickled whole before it gets here, so loading
+        # needs its full size in memory; spilling tables drop back to their
+        # budget as the rows go in.
+        for name, rows in state.items():
+            if isinstance(self.db[name], SpillingDict):
+                self.db[name].update(rows)
+            else:
+                self.db[name] = rows
+        self.db["users_by_username"] = {
+            normalize_username(user["username"]): user_id for user_id, user in state["users"].items()
+        }
+        self.db["transactions_by_user"] = {}
+        for transaction in state["transactions"]:
+            self._index_transaction(transaction)
+        self.db["revenue_rollup"] = RevenueRollup(state["revenue"])
+        self.db["readings_by_user"] = {}
+        for reading in state["readings"].values():
+            self._index_reading(reading)
+
+    # Users
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self.db["users"].get(user_id)
+
+    async def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        user_id = self.db["users_by_username"].get(normalize_username(username))
+        return None if user_id is None else self.db["users"][user_id]
+
+    async def create_user(self, username: str) -> Dict[str, Any]:
+        user_id = str(uuid.uuid4())
+        # Claim the username; setdefault is atomic, so of two concurrent
+        # signups for the same name exactly one wins
+        owner_id = self.db["users_by_username"].setdefault(normalize_username(username), user_id)
+        if owner_id != user_id:
+            return self.db["users"][owner_id]  # Return existing user if found
+        user = new_user(user_id, username)
+        self.db["users"][user_id] = user
+        await self._log([("user", user)])
+        return user
+
+    @asynccontextmanager
+    async def update_user(self, user_id: str):
+        async with self.user_locks.lock(user_id):
+            user = self.db["users"].get(user_id)
+            if user is None:
+                yield None
+                return
+            update = UserUpdate(_copy_user(user))
+            yield update
+
+            self.db["users"][user_id] = update.user
+            for transaction in update.transactions:
+                self.record_transaction(transaction)
+            for revenue in update.revenue:
+                self.record_revenue(revenue)
+            for record in update.charts:
+                self.db["charts"][record.id] = record
+            durable = self._append(
+                [("user", update.user)]
+                + [("transaction", row) for row in update.transactions]
+                + [("revenue", row) for row in update.revenue]
+                + [("chart", record) for record in update.charts]
+            )
+        # The lock is released before the fsync: the log keeps the order, so
+        # a later change to this user can never become durable before this one
+        if durable is not None:
+            await durable
+
+    def record_transaction(self, transaction: Dict[str, Any]) -> None:
+        """Append a transaction and index it under its user (not logged)."""
+        self.db["transactions"].append(transaction)
+        self._index_transaction(transaction)
+
+    def _index_transaction(self, transaction: Dict[str, Any]) -> None:
+        index = self.db["transactions_by_user"].get(transaction["user_id"])
+        if index is None:
+            index = self.db["transactions_by_user"][transaction["user_id"]] = OrderedIndex()
+        index.add((transaction["created_at"], transaction["id"]), transaction)
+
+    def record_revenue(self, revenue: Dict[str, Any]) -> None:
+        """Append a revenue row and add it to the rollups (not logged)."""
+        self.db["revenue"].append(revenue)
+        self.db["revenue_rollup"].add(revenue)
+
+    # Products
+
+    async def list_products(self) -> List[Dict[str, Any]]:
+        return list(self.db["products"].values())
+
+    async def get_product(self, product_id: str) -> Optional[Dict[str, Any]]:
+        return self.db["products"].get(product_id)
+
+    async def save_product(self, product: Dict[str, Any]) -> None:
+        product = dict(product)
+        self._apply("product", product)
+        await self._log([("product", product)])
+
+    async def products_version(self) -> int:
+        return self._products_version  # One process holds the data
+
+    # Charts
+
+    async def get_chart(self, chart_id: str) -> Optional[ChartRecord]:
+        return self.db["charts"].get(chart_id)
+
+    async def save_charts(self, records: Sequence[ChartRecord]) -> None:
+        charts = self.db["charts"]
+        for record in records:
+            charts[record.id] = record
+        await self._log([("chart", record) for record in records])
+
+    # Readings and transactions
+
+    async def add_reading(self, reading: Dict[str, Any]) -> None:
+        self._store_reading(reading)
+        await self._log([("reading", reading)])
+
+    def _store_reading(self, reading: Dict[str, Any]) -> None:
+        """Store a reading and index its id under its user."""
+        self.db["readings"][reading["id"]] = reading
+        self._index_reading(reading)
+
+    def _index_reading(self, reading: Dict[str, Any]) -> None:
+        index = self.db["readings_by_user"].get(reading["user_id"])
+        if index is None:
+            index = self.db["readings_by_user"][reading["user_id"]] = OrderedIndex()
+        index.add((reading["created_at"], reading["id"]), reading["id"])
+
+    async def readings_page(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        before: Optional[IndexKey] = None,
+        after: Optional[IndexKey] = None
+    ) -> IndexPage:
+        index = self.db["readings_by_user"].get(user_id)
+        if index is None:
+            return IndexPage([], [], False, False)
+        page = index.page(limit, before, after)
+        readings = self.db["readings"]
+        return page._replace(values=[readings[reading_id] for reading_id in page.values])
+
+    async def transactions_page(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        before: Optional[IndexKey] = None,
+        after: Optional[IndexKey] = None
+    ) -> IndexPage:
+        index = self.db["transactions_by_user"].get(user_id)
+        if index is None:
+            return IndexPage([], [], False, False)
+        return index.page(limit, before, after)
+
+    # Revenue
+
+    async def revenue_summary(
+        self,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        unit: timedelta
+    ) -> Tuple[RevenueBucket, List[Tuple[datetime, RevenueBucket]]]:
+        rollup = self.db["revenue_rollup"]
+        return rollup.total(start, end), list(rollup.buckets(unit, start, end))
@@ -0,0 +1,95 @@
+"""Postgres storage on an async psycopg connection pool.
+
+Connections are opened once at startup (``open``) and shared by all
+requests. Every statement is sent with ``prepare=True``, so each
+connection parses and plans a query once and afterwards only sends
+parameters. ``update_user`` runs in a transaction that locks the user's
+row with ``SELECT ... FOR UPDATE``.
+
+Needs ``psycopg`` with the ``pool`` extra (``psycopg_pool``).
+"""
+from typing import Any, List, Optional, Sequence
+from contextlib import asynccontextmanager
+from datetime import timedelta
+import os
+
+from app.revenue import HOUR
+from app.storage.sql import (
+    ADDED_COLUMNS, INSERT_PRODUCT, INSERT_VERSION, PRODUCT_ROWS, SQLSession, SQLStorage
+)
+
+
+class PostgresSession(SQLSession):
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        cursor = await self.conn.execute(sql, params, prepare=True)
+        return await cursor.fetchone()
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        cursor = await self.conn.execute(sql, params, prepare=True)
+        return await cursor.fetchall()
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> None:
+        await self.conn.execute(sql, params, prepare=True)
+
+    async def executemany(self, sql: str, params: Sequence[Sequence[Any]]) -> None:
+        async with self.conn.cursor() as cursor:
+            await cursor.executemany(sql, params)
+
+
+class PostgresStorage(SQLStorage):
+    FOR_UPDATE = " FOR UPDATE"
+    TYPES = {"json": "JSONB", "float": "DOUBLE PRECISION", "blob": "BYTEA", "timestamp": "TIMESTAMP"}
+
+    def __init__(self, url: str, min_size: Optional[int] = None, max_size: Optional[int] = None):
+        try:
+            from psycopg.types.json import Jsonb
+            from psycopg_pool import AsyncConnectionPool
+        except ImportError as e:
+            raise RuntimeError(
+                "Postgres storage needs psycopg with the pool extra: "
+                "pip install 'psycopg[binary,pool]'"
+            ) from e
+        super().__init__()
+        self._jsonb = Jsonb
+        self.pool = AsyncConnectionPool(
+            url,
+            min_size=min_size or int(os.environ.get("STORAGE_POOL_MIN", 2)),
+            max_size=max_size or int(os.environ.get("STORAGE_POOL_MAX", 10)),
+            kwargs={"autocommit": True},
+            open=False
+        )
+
+    async def open(self) -> None:
+        await self.pool.open(wait=True)
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                # DDL cannot be prepared
+                for statement in self._schema():
+                    await conn.execute(statement)
+                for table, column, definition in ADDED_COLUMNS:
+                    await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+                await PostgresSession(conn).executemany(INSERT_PRODUCT, PRODUCT_ROWS)
+                await PostgresSession(conn).execute(INSERT_VERSION, ("products",))
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    @asynccontextmanager
+    async def _session(self):
+        async with self.pool.connection() as conn:
+            yield PostgresSession(conn)
+
+    @asynccontextmanager
+    async def _transaction(self):
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                yield PostgresSession(conn)
+
+    def _bucket(self, unit: timedelta) -> str:
+        return f"date_trunc('{'hour' if unit == HOUR else 'day'}', created_at)"
+
+    def _to_json(self, value: Any) -> Any:
+        return self._jsonb(value)
@@ -0,0 +1,242 @@
+"""Memory-bounded tables that spill cold rows to disk.
+
+``SpillingDict`` is a mutable mapping for the memory backend's largest
+tables, ``charts`` and ``readings``. It keeps recently used rows in memory
+up to a byte budget; past it, the least recently used rows are pickled into
+a SQLite file and dropped from memory. Reading a spilled row faults it back
+in (and makes it resident again), so callers never see the difference
+except in latency. Once over budget, rows are written out down to
+``SPILL_TARGET`` of the budget, so spills come in batches rather than one
+per insert.
+
+A faulted-in row leaves its copy on disk: it is only ever read again after
+the row is spilled anew, which overwrites it.
+
+The spill file is a cache, not storage: it is emptied when the table is
+created, and durability still comes from the ledger (``app.storage.ledger``).
+Ledger snapshots take ``snapshot()``, which copies only the resident rows;
+the spilled ones are read from the file while the snapshot is pickled, a
+batch at a time, on the snapshot thread.
+"""
+from typing import Any, Callable, Dict, Iterator, List, MutableMapping, Optional, Set, Tuple
+from collections import OrderedDict
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+SPILL_TARGET = 0.9  # Resident fraction of the budget left after a spill
+SNAPSHOT_BATCH = 500  # Spilled rows read per query (and lock hold) while snapshotting
+
+
+def deep_sizeof(value: Any) -> int:
+    """Approximate bytes held by a JSON-like value (dicts, lists, scalars)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + deep_sizeof(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += deep_sizeof(item)
+    return size
+
+
+class SpillingDict(MutableMapping):
+    """Dict of string keys with at most ``budget`` bytes of values resident, the rest in ``path``.
+
+    ``sizeof`` estimates the memory one value holds.
+    """
+
+    def __init__(self, path: str, budget: int, sizeof: Callable[[Any], int] = deep_sizeof):
+        self.path = path
+        self.budget = budget
+        self.sizeof = sizeof
+        self._resident: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()  # key -> (value, size)
+        self._spilled: Set[str] = set()
+        self.resident_bytes = 0
+        self._lock = threading.RLock()
+        if os.path.exists(path):
+            os.remove(path)
+        # Nothing here has to survive a crash, so skip the journal and fsyncs
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute("CREATE TABLE spill (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        self.spills = 0  # Rows written out
+        self.faults = 0  # Rows read back in
+        self.fault_seconds = 0.0
+        self.max_fault_seconds = 0.0
+
+    # Mapping
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is not None:
+                self._resident.move_to_end(key)
+                return entry[0]
+            if key not in self._spilled:
+                raise KeyError(key)
+            value = self._fault(key)
+            self._keep(key, value)
+            return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._spilled.discard(key)  # The stale copy on disk is never read
+            self._keep(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            entry = self._resident.pop(key, None)
+            if entry is not None:
+                self.resident_bytes -= entry[1]
+            elif key in self._spilled:
+                self._spilled.discard(key)
+            else:
+                raise KeyError(key)
+            self._conn.execute("DELETE FROM spill WHERE key = ?", (key,))
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._resident or key in self._spilled
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            keys = list(self._resident)
+            keys.extend(self._spilled)
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return len(self._resident) + len(self._spilled)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._resident.clear()
+            self._spilled.clear()
+            self.resident_bytes = 0
+            self._conn.execute("DELETE FROM spill")
+
+    def copy(self) -> Dict[str, Any]:
+        """Every row in a plain dict, read without changing what is resident."""
+        with self._lock:
+            rows = {key: value for key, (value, _) in self._resident.items()}
+            for key, blob in self._conn.execute("SELECT key, value FROM spill"):
+                if key in self._spilled:
+                    rows[key] = pickle.loads(blob)
+        return rows
+
+    def snapshot(self) -> "TableSnapshot":
+        """A view of every row that pickles as a plain dict, without loading spilled rows now."""
+        with self._lock:
+            return TableSnapshot(self, {key: value for key, (value, _) in self._resident.items()}, list(self._spilled))
+
+    def _read_spilled(self, keys: List[str]) -> List[Tuple[str, Any]]:
+        with self._lock:
+            placeholders = ",".join("?" * len(keys))
+            rows = self._conn.execute(
+                f"SELECT key, value FROM spill WHERE key IN ({placeholders})", keys
+            ).fetchall()
+        return [(key, pickle.loads(blob)) for key, blob in rows]
+
+    # Spilling
+
+    def _keep(self, key: str, value: Any) -> None:
+        """Make ``key`` resident and most recently used, then enforce the budget."""
+        size = self.sizeof(value)
+        previous = self._resident.pop(key, None)
+        if previous is not None:
+            self.resident_bytes -= previous[1]
+        self._resident[key] = (value, size)
+        self.resident_bytes += size
+        if self.resident_bytes > self.budget:
+            self._spill()
+
+    def _spill(self) -> None:
+        """Write the coldest rows out until the rest fits ``SPILL_TARGET`` of the budget.
+
+        The newest row always stays, even when it alone is over budget.
+        """
+        rows = []
+        target = self.budget * SPILL_TARGET
+        while self.resident_bytes > target and len(self._resident) > 1:
+            key, (value, size) = self._resident.popitem(last=False)
+            self.resident_bytes -= size
+            self._spilled.add(key)
+            rows.append((key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+        if rows:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO spill (key, value) VALUES (?, ?)", rows)
+            self._conn.execute("COMMIT")
+            self.spills += len(rows)
+
+    def _fault(self, key: str) -> Any:
+        began = time.perf_counter()
+        blob, = self._conn.execute("SELECT value FROM spill WHERE key = ?", (key,)).fetchone()
+        self._spilled.discard(key)
+        value = pickle.loads(blob)
+        elapsed = time.perf_counter() - began
+        self.faults += 1
+        self.fault_seconds += elapsed
+        self.max_fault_seconds = max(self.max_fault_seconds, elapsed)
+        return value
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budget_bytes": self.budget,
+            "resident": len(self._resident),
+            "resident_bytes": self.resident_bytes,
+            "spilled": len(self._spilled),
+            "spills": self.spills,
+            "faults": self.faults,
+            "fault_ms_mean": self.fault_seconds / self.faults * 1000 if self.faults else 0.0,
+            "fault_ms_max": self.max_fault_seconds * 1000
+        }
+
+
+class TableSnapshot:
+    """The rows of a ``SpillingDict`` at one moment, streamed when pickled.
+
+    Pickling writes the resident rows copied at that moment, then the rows
+    spilled at that moment, read back ``SNAPSHOT_BATCH`` at a time; it
+    unpickles as a plain dict. A spilled row rewritten since then may be
+    read in its newer version, or be gone if it was deleted. The ledger
+    replays every change logged after the snapshot point, and those changes
+    overwrite rows by key, so either way recovery ends in the same state.
+    """
+
+    def __init__(self, table: SpillingDict, resident: Dict[str, Any], spilled: List[str]):
+        self.table = table
+        self.resident = resident
+        self.spilled = spilled
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        yield from self.resident.items()
+        for start in range(0, len(self.spilled), SNAPSHOT_BATCH):
+            yield from self.table._read_spilled(self.spilled[start:start + SNAPSHOT_BATCH])
+
+    def __reduce__(self):
+        return dict, (), None, None, self.items()
+
+
+def spilling_table(
+    directory: Optional[str],
+    name: str,
+    budget_mb: float,
+    sizeof: Callable[[Any], int] = deep_sizeof
+) -> Optional[SpillingDict]:
+    """A ``SpillingDict`` for table ``name`` if ``budget_mb`` is set, else None."""
+    if budget_mb <= 0:
+        return None
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="tarot-spill-")
+    os.makedirs(directory, exist_ok=True)
+    return SpillingDict(os.path.join(directory, f"spill-{name}.sqlite"), int(budget_mb * 1024 * 1024), sizeof)
@@ -0,0 +1,457 @@
+"""Schema and queries shared by the SQLite and Postgres backends.
+
+Queries are written once with ``%s`` placeholders. A backend supplies a
+session (one connection, optionally inside a transaction) with async
+``fetchone``/``fetchall``/``execute``/``executemany`` plus the few type
+conversions where the two databases differ.
+"""
+from typing import Any, AsyncContextManager, Dict, List, Optional, Sequence, Tuple
+from abc import ABC, abstractmethod
+from array import array
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import uuid
+
+from app.indexes import IndexKey, IndexPage
+from app.records import ChartRecord
+from app.revenue import RevenueBucket
+from app.storage.base import (
+    DEFAULT_PRODUCTS, Storage, UserUpdate, new_user, normalize_username
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    username_key TEXT NOT NULL UNIQUE,
+    balance BIGINT NOT NULL DEFAULT 0,
+    experience BIGINT NOT NULL DEFAULT 0,
+    language TEXT NOT NULL DEFAULT 'en',
+    purchased_products {json} NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    price BIGINT NOT NULL,
+    image TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS charts (
+    id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    latitude {float} NOT NULL,
+    longitude {float} NOT NULL,
+    house_time TEXT NOT NULL,
+    house_system TEXT NOT NULL,
+    positions {blob} NOT NULL,
+    is_premium_unlocked BOOLEAN NOT NULL,
+    premium_interpretation TEXT,
+    language TEXT NOT NULL DEFAULT 'en'
+);
+CREATE TABLE IF NOT EXISTS readings (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    spread_type TEXT NOT NULL,
+    cards {json} NOT NULL,
+    created_at {timestamp} NOT NULL
+);
+CREATE INDEX IF NOT EXISTS readings_by_user ON readings (user_id, created_at, id);
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    amount BIGINT NOT NULL,
+    type TEXT NOT NULL,
+    description TEXT NOT NULL,
+    created_at {timestamp} NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_by_user ON transactions (user_id, created_at, id);
+CREATE TABLE IF NOT EXISTS revenue (
+    id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    amount {float} NOT NULL,
+    created_at {timestamp} NOT NULL
+);
+CREATE INDEX IF NOT EXISTS revenue_by_time ON revenue (created_at);
+CREATE TABLE IF NOT EXISTS versions (
+    name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL
+);
+"""
+# Columns added to SCHEMA later: (table, column, definition), added to
+# databases created before them when the backend opens
+ADDED_COLUMNS = (("charts", "language", "TEXT NOT NULL DEFAULT 'en'"),)
+
+USER_COLUMNS = "id, username, purchased_products, experience, balance, language"
+PRODUCT_COLUMNS = "id, name, description, price, image"
+CHART_COLUMNS = (
+    "id, date, time, latitude, longitude, house_time, house_system, positions, "
+    "is_premium_unlocked, premium_interpretation, language"
+)
+READING_COLUMNS = "id, user_id, spread_type, cards, created_at"
+TRANSACTION_COLUMNS = "id, user_id, amount, type, description, created_at"
+
+INSERT_USER = (
+    "INSERT INTO users (id, username, username_key, balance, experience, language, "
+    "purchased_products) VALUES (%s, %s, %s, %s, %s, %s, %s) "
+    "ON CONFLICT (username_key) DO NOTHING"
+)
+UPDATE_USER = (
+    "UPDATE users SET balance = %s, experience = %s, language = %s, "
+    "purchased_products = %s WHERE id = %s"
+)
+INSERT_PRODUCT = (
+    f"INSERT INTO products ({PRODUCT_COLUMNS}) VALUES (%s, %s, %s, %s, %s) "
+    "ON CONFLICT (id) DO NOTHING"
+)
+UPSERT_PRODUCT = (
+    f"INSERT INTO products ({PRODUCT_COLUMNS}) VALUES (%s, %s, %s, %s, %s) "
+    "ON CONFLICT (id) DO UPDATE SET name = excluded.name, description = excluded.description, "
+    "price = excluded.price, image = excluded.image"
+)
+UPSERT_CHART = (
+    f"INSERT INTO charts ({CHART_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
+    "ON CONFLICT (id) DO UPDATE SET is_premium_unlocked = excluded.is_premium_unlocked, "
+    "premium_interpretation = excluded.premium_interpretation"
+)
+# Change counters in ``versions``, shared by every worker on the database
+INSERT_VERSION = "INSERT INTO versions (name, version) VALUES (%s, 0) ON CONFLICT (name) DO NOTHING"
+BUMP_VERSION = "UPDATE versions SET version = version + 1 WHERE name = %s"
+SELECT_VERSION = "SELECT version FROM versions WHERE name = %s"
+INSERT_READING = f"INSERT INTO readings ({READING_COLUMNS}) VALUES (%s, %s, %s, %s, %s)"
+INSERT_TRANSACTION = f"INSERT INTO transactions ({TRANSACTION_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s)"
+INSERT_REVENUE = "INSERT INTO revenue (id, source, amount, created_at) VALUES (%s, %s, %s, %s)"
+
+PRODUCT_FIELDS = ("id", "name", "description", "price", "image")
+# Parameters seeding DEFAULT_PRODUCTS with INSERT_PRODUCT
+PRODUCT_ROWS = [tuple(product[column] for column in PRODUCT_FIELDS) for product in DEFAULT_PRODUCTS]
+
+
+class SQLSession(ABC):
+    """One connection's query methods, as the backends provide them."""
+
+    @abstractmethod
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        """The first row of a query, or None."""
+
+    @abstractmethod
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        """Every row of a query."""
+
+    @abstractmethod
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> None:
+        """Run one statement."""
+
+    @abstractmethod
+    async def executemany(self, sql: str, params: Sequence[Sequence[Any]]) -> None:
+        """Run one statement for each parameter row."""
+
+
+class SQLStorage(Storage):
+    """Storage over a SQL database; see ``SQLiteStorage`` and ``PostgresStorage``."""
+
+    # Row locks for update_user (SQLite locks the whole database instead)
+    FOR_UPDATE = ""
+    # Column types substituted into SCHEMA
+    TYPES: Dict[str, str] = {}
+
+    @abstractmethod
+    def _session(self) -> AsyncContextManager[SQLSession]:
+        """A session for independent statements (autocommit)."""
+
+    @abstractmethod
+    def _transaction(self) -> AsyncContextManager[SQLSession]:
+        """A session inside a write transaction, committed on clean exit."""
+
+    @abstractmethod
+    def _bucket(self, unit: timedelta) -> str:
+        """SQL expression truncating ``created_at`` to an hour or day bucket."""
+
+    def _to_time(self, value: datetime) -> Any:
+        return value
+
+    def _from_time(self, value: Any) -> datetime:
+        return value
+
+    def _to_json(self, value: Any) -> Any:
+        return value
+
+    def _from_json(self, value: Any) -> Any:
+        return value
+
+    def _from_bucket(self, value: Any) -> datetime:
+        return value
+
+    def _schema(self) -> List[str]:
+        """Statements creating any missing tables and indexes."""
+        return [s for s in SCHEMA.format(**self.TYPES).split(";") if s.strip()]
+
+    # Row conversion
+
+    def _user(self, row: tuple) -> Dict[str, Any]:
+        user_id, username, purchased, experience, balance, language = row
+        return {
+            "id": user_id,
+            "username": username,
+            "purchased_products": self._from_json(purchased),
+            "experience": experience,
+            "balance": balance,
+            "language": language
+        }
+
+    def _chart(self, row: tuple) -> ChartRecord:
+        record = ChartRecord(
+            id=row[0], date=row[1], time=row[2], latitude=row[3], longitude=row[4],
+            house_time=row[5], house_system=row[6], positions=array('d', bytes(row[7])),
+            language=row[10]
+        )
+        record.is_premium_unlocked = bool(row[8])
+        record.premium_interpretation = row[9]
+        return record
+
+    def _chart_params(self, record: ChartRecord) -> tuple:
+        return (
+            record.id, record.date, record.time, record.latitude, record.longitude,
+            record.house_time, record.house_system, record.positions.tobytes(),
+            record.is_premium_unlocked, record.premium_interpretation, record.language
+        )
+
+    def _reading(self, row: tuple) -> Dict[str, Any]:
+        reading_id, user_id, spread_type, cards, created_at = row
+        return {
+            "id": reading_id,
+            "user_id": user_id,
+            "spread_type": spread_type,
+            "cards": self._from_json(cards),
+            "created_at": self._from_time(created_at)
+        }
+
+    def _transaction_row(self, row: tuple) -> Dict[str, Any]:
+        transaction_id, user_id, amount, type_, description, created_at = row
+        return {
+            "id": transaction_id,
+            "user_id": user_id,
+            "amount": amount,
+            "type": type_,
+            "description": description,
+            "created_at": self._from_time(created_at)
+        }
+
+    def _transaction_params(self, transaction: Dict[str, Any]) -> tuple:
+        return (
+            transaction["id"], transaction["user_id"], transaction["amount"],
+            transaction["type"], transaction["description"],
+            self._to_time(transaction["created_at"])
+        )
+
+    def _revenue_params(self, revenue: Dict[str, Any]) -> tuple:
+        return (
+            revenue["id"], revenue["source"], revenue["amount"],
+            self._to_time(revenue["created_at"])
+        )
+
+    # Users
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        async with self._session() as session:
+            row = await session.fetchone(f"SELECT {USER_COLUMNS} FROM users WHERE id = %s", (user_id,))
+        return None if row is None else self._user(row)
+
+    async def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        async with self._session() as session:
+            row = await session.fetchone(
+                f"SELECT {USER_COLUMNS} FROM users WHERE username_key = %s",
+                (normalize_username(username),)
+            )
+        return None if row is None else self._user(row)
+
+    async def create_user(self, username: str) -> Dict[str, Any]:
+        user = new_user(str(uuid.uuid4()), username)
+        key = normalize_username(username)
+        async with self._session() as session:
+            # The unique username_key makes the loser of a race a no-op
+            await session.execute(INSERT_USER, (
+                user["id"], username, key, user["balance"], user["experience"],
+                user["language"], self._to_json(user["purchased_products"])
+            ))
+            row = await session.fetchone(f"SELECT {USER_COLUMNS} FROM users WHERE username_key = %s", (key,))
+        return self._user(row)
+
+    @asynccontextmanager
+    async def update_user(self, user_id: str):
+        # The stripe lock queues this process's updates of one user before
+        # they take a connection; FOR UPDATE guards against other processes
+        async with self.user_locks.lock(user_id), self._transaction() as session:
+            row = await session.fetchone(
+                f"SELECT {USER_COLUMNS} FROM users WHERE id = %s{self.FOR_UPDATE}", (user_id,)
+            )
+            if row is None:
+                yield None
+                return
+            update = UserUpdate(self._user(row))
+            yield update
+
+            user = update.user
+            await session.execute(UPDATE_USER, (
+                user["balance"], user["experience"], user["language"],
+                self._to_json(user["purchased_products"]), user_id
+            ))
+            if update.transactions:
+                await session.executemany(
+                    INSERT_TRANSACTION, [self._transaction_params(t) for t in update.transactions]
+                )
+            if update.revenue:
+                await session.executemany(
+                    INSERT_REVENUE, [self._revenue_params(r) for r in update.revenue]
+                )
+            if update.charts:
+                await session.executemany(UPSERT_CHART, [self._chart_params(c) for c in update.charts])
+
+    # Products
+
+    async def list_products(self) -> List[Dict[str, Any]]:
+        async with self._session() as session:
+            rows = await session.fetchall(f"SELECT {PRODUCT_COLUMNS} FROM products ORDER BY id")
+        return [dict(zip(PRODUCT_FIELDS, row)) for row in rows]
+
+    async def get_product(self, product_id: str) -> Optional[Dict[str, Any]]:
+        async with self._session() as session:
+            row = await session.fetchone(
+                f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id = %s", (product_id,)
+            )
+        return None if row is None else dict(zip(PRODUCT_FIELDS, row))
+
+    async def save_product(self, product: Dict[str, Any]) -> None:
+        async with self._transaction() as session:
+            await session.execute(UPSERT_PRODUCT, tuple(product[column] for column in PRODUCT_FIELDS))
+            await session.execute(BUMP_VERSION, ("products",))
+
+    async def products_version(self) -> int:
+        async with self._session() as session:
+            row = await session.fetchone(SELECT_VERSION, ("products",))
+        return row[0]
+
+    # Charts
+
+    async def get_chart(self, chart_id: str) -> Optional[ChartRecord]:
+        async with self._session() as session:
+            row = await session.fetchone(f"SELECT {CHART_COLUMNS} FROM charts WHERE id = %s", (chart_id,))
+        return None if row is None else self._chart(row)
+
+    async def save_charts(self, records: Sequence[ChartRecord]) -> None:
+        async with self._transaction() as session:
+            await session.executemany(UPSERT_CHART, [self._chart_params(r) for r in records])
+
+    # Readings and transactions
+
+    async def add_reading(self, reading: Dict[str, Any]) -> None:
+        async with self._session() as session:
+            await session.execute(INSERT_READING, (
+                reading["id"], reading["user_id"], reading["spread_type"],
+                self._to_json(reading["cards"]), self._to_time(reading["created_at"])
+            ))
+
+    async def _page(
+        self,
+        table: str,
+        columns: str,
+        user_id: str,
+        limit: Optional[int],
+        before: Optional[IndexKey],
+        after: Optional[IndexKey]
+    ) -> Tuple[List[tuple], bool, bool]:
+        """Rows of one user between the cursors, with ``OrderedIndex.page`` semantics."""
+        where, params = ["user_id = %s"], [user_id]
+        if after is not None:
+            where.append("(created_at, id) > (%s, %s)")
+            params += [self._to_time(after[0]), after[1]]
+        if before is not None:
+            where.append("(created_at, id) < (%s, %s)")
+            params += [self._to_time(before[0]), before[1]]
+        backwards = limit is not None and before is not None and after is None
+        order = "DESC" if backwards else "ASC"
+        sql = f"SELECT {columns} FROM {table} WHERE {' AND '.join(where)} ORDER BY created_at {order}, id {order}"
+        if limit is not None:
+            sql += " LIMIT %s"
+            params.append(limit + 1)  # one extra row tells whether more follow
+
+        async with self._session() as session:
+            rows = await session.fetchall(sql, params)
+            more = limit is not None and len(rows) > limit
+            rows = rows[:limit] if limit is not None else rows
+
+            async def exists(op: str, key: IndexKey) -> bool:
+                return await session.fetchone(
+                    f"SELECT 1 FROM {table} WHERE user_id = %s AND (created_at, id) {op} (%s, %s) LIMIT 1",
+                    (user_id, self._to_time(key[0]), key[1])
+                ) is not None
+
+            if backwards:
+                rows.reverse()
+                return rows, more, await exists(">=", before)
+            more_before = after is not None and await exists("<=", after)
+            more_after = more or (before is not None and await exists(">=", before))
+            return rows, more_before, more_after
+
+    async def readings_page(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        before: Optional[IndexKey] = None,
+        after: Optional[IndexKey] = None
+    ) -> IndexPage:
+        rows, more_before, more_after = await self._page(
+            "readings", READING_COLUMNS, user_id, limit, before, after
+        )
+        readings = [self._reading(row) for row in rows]
+        return IndexPage([(r["created_at"], r["id"]) for r in readings], readings, more_before, more_after)
+
+    async def transactions_page(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        before: Optional[IndexKey] = None,
+        after: Optional[IndexKey] = None
+    ) -> IndexPage:
+        rows, more_before, more_after = await self._page(
+            "transactions", TRANSACTION_COLUMNS, user_id, limit, before, after
+        )
+        transactions = [self._transaction_row(row) for row in rows]
+        return IndexPage(
+            [(t["created_at"], t["id"]) for t in transactions], transactions, more_before, more_after
+        )
+
+    # Revenue
+
+    async def revenue_summary(
+        self,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        unit: timedelta
+    ) -> Tuple[RevenueBucket, List[Tuple[datetime, RevenueBucket]]]:
+        where, params = [], []
+        if start is not None:
+            where.append("created_at >= %s")
+            params.append(self._to_time(start))
+        if end is not None:
+            where.append("created_at <= %s")
+            params.append(self._to_time(end))
+        condition = f" WHERE {' AND '.join(where)}" if where else ""
+        bucket = self._bucket(unit)
+        async with self._session() as session:
+            rows = await session.fetchall(
+                f"SELECT {bucket} AS bucket, source, SUM(amount), COUNT(*) FROM revenue{condition} "
+                f"GROUP BY bucket, source ORDER BY bucket",
+                params
+            )
+
+        total = RevenueBucket()
+        buckets: List[Tuple[datetime, RevenueBucket]] = []
+        for key, source, amount, count in rows:
+            key = self._from_bucket(key)
+            if not buckets or buckets[-1][0] != key:
+                buckets.append((key, RevenueBucket()))
+            for target in (buckets[-1][1], total):
+                target.amounts[source] = target.amounts.get(source, 0.0) + float(amount)
+                target.count += count
+        return total, buckets
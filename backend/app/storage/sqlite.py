@@ -0,0 +1,101 @@
+"""SQLite storage in WAL mode, for local use and tests.
+
+One connection serves the whole process. Statements take microseconds
+and run directly on the event loop; WAL lets other processes read while
+this one writes, and ``update_user`` takes the write lock up front with
+``BEGIN IMMEDIATE``. Sessions and transactions take turns on the
+connection, so a transaction that awaits never has another coroutine's
+statements run inside it.
+"""
+from typing import Any, List, Optional, Sequence
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import json
+import os
+import sqlite3
+
+from app.locks import StripedLock
+from app.revenue import HOUR
+from app.storage.sql import (
+    ADDED_COLUMNS, INSERT_PRODUCT, INSERT_VERSION, PRODUCT_ROWS, SQLSession, SQLStorage
+)
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"  # fixed width, so text order is time order
+
+
+class SQLiteSession(SQLSession):
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        return self.conn.execute(sql.replace("%s", "?"), params).fetchone()
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        return self.conn.execute(sql.replace("%s", "?"), params).fetchall()
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> None:
+        self.conn.execute(sql.replace("%s", "?"), params)
+
+    async def executemany(self, sql: str, params: Sequence[Sequence[Any]]) -> None:
+        self.conn.executemany(sql.replace("%s", "?"), params)
+
+
+class SQLiteStorage(SQLStorage):
+    TYPES = {"json": "TEXT", "float": "REAL", "blob": "BLOB", "timestamp": "TEXT"}
+
+    def __init__(self, path: str):
+        super().__init__()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit; update_user and save_charts open explicit transactions
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA busy_timeout = 5000")
+        self.session = SQLiteSession(self.conn)
+        self.conn_lock = StripedLock(1)
+        for statement in self._schema():
+            self.conn.execute(statement)
+        for table, column, definition in ADDED_COLUMNS:
+            if column not in {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        self.conn.executemany(INSERT_PRODUCT.replace("%s", "?"), PRODUCT_ROWS)
+        self.conn.execute(INSERT_VERSION.replace("%s", "?"), ("products",))
+
+    async def close(self) -> None:
+        self.conn.close()
+
+    @asynccontextmanager
+    async def _session(self):
+        async with self.conn_lock.lock(None):
+            yield self.session
+
+    @asynccontextmanager
+    async def _transaction(self):
+        async with self.conn_lock.lock(None):
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.session
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _bucket(self, unit: timedelta) -> str:
+        # Prefix of the fixed-width timestamp: "YYYY-MM-DDTHH" or "YYYY-MM-DD"
+        return f"substr(created_at, 1, {13 if unit == HOUR else 10})"
+
+    def _to_time(self, value: datetime) -> str:
+        return value.strftime(TIME_FORMAT)
+
+    def _from_time(self, value: str) -> datetime:
+        return datetime.fromisoformat(value)
+
+    def _to_json(self, value: Any) -> str:
+        return json.dumps(value)
+
+    def _from_json(self, value: str) -> Any:
+        return json.loads(value)
+
+    def _from_bucket(self, value: str) -> datetime:
+        return datetime.strptime(value, "%Y-%m-%dT%H" if len(value) == 13 else "%Y-%m-%d")
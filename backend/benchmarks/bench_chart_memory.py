@@ -0,0 +1,92 @@
+"""Bytes per stored chart: legacy dict + flatlib Chart vs ChartRecord.
+
+Usage: python -m benchmarks.bench_chart_memory [--charts N]
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+from flatlib.chart import Chart
+from flatlib.geopos import GeoPos
+
+from app import charts
+from app.records import ChartRecord
+
+
+def _inputs(n):
+    rng = random.Random(42)
+    start = datetime(1950, 1, 1, tzinfo=pytz.UTC)
+    for _ in range(n):
+        yield (
+            start + timedelta(minutes=rng.randrange(60 * 24 * 365 * 70)),
+            rng.uniform(-60, 60),
+            rng.uniform(-180, 180)
+        )
+
+def legacy_record(utc_dt, latitude, longitude):
+    """The chart_data dict create_chart used to store, live Chart included."""
+    chart = Chart(charts._flatlib_datetime(utc_dt), GeoPos(latitude, longitude))
+    positions = charts.compute_chart(utc_dt, latitude, longitude)
+    return {
+        "id": str(uuid.uuid4()),
+        "date": utc_dt.strftime("%Y-%m-%d"),
+        "time": utc_dt.strftime("%H:%M"),
+        "latitude": latitude,
+        "longitude": longitude,
+        "planets": charts.planets_data(positions),
+        "houses": charts.houses_data(positions),
+        "basic_interpretation": charts.interpret_chart(positions)["basic"],
+        "is_premium_unlocked": False,
+        "premium_interpretation": None,
+        "_chart": chart,
+        **charts.solar_time_fields(positions)
+    }
+
+def compact_record(utc_dt, latitude, longitude):
+    return ChartRecord(
+        id=str(uuid.uuid4()),
+        date=utc_dt.strftime("%Y-%m-%d"),
+        time=utc_dt.strftime("%H:%M"),
+        latitude=latitude,
+        longitude=longitude,
+        house_time=charts.HOUSE_TIME_STANDARD,
+        house_system=charts.DEFAULT_HOUSE_SYSTEM,
+        positions=charts.compute_chart(utc_dt, latitude, longitude)
+    )
+
+def measure(factory, n):
+    """Bytes retained per chart, measured with tracemalloc."""
+    inputs = list(_inputs(n))
+    charts.warm_up()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = {}
+    for args in inputs:
+        record = factory(*args)
+        store[id(record)] = record
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / n
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--charts", type=int, default=2000)
+    args = parser.parse_args()
+
+    legacy = measure(legacy_record, args.charts)
+    compact = measure(compact_record, args.charts)
+    sample = compact_record(*next(_inputs(1)))
+    print(f"charts measured:           {args.charts}")
+    print(f"legacy dict + Chart:       {legacy:,.0f} bytes/chart")
+    print(f"ChartRecord (tracemalloc): {compact:,.0f} bytes/chart")
+    print(f"ChartRecord.nbytes():      {sample.nbytes():,} bytes/chart")
+    print(f"reduction:                 {legacy / compact:.1f}x")
+
+if __name__ == "__main__":
+    main()
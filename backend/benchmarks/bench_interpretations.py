@@ -0,0 +1,83 @@
+"""Cost of one chart interpretation: f-strings vs the precompiled catalog.
+
+Builds ``--charts`` random position arrays and times the basic and the
+premium interpretation of each, once with the former f-string code
+(English only) and once per language with ``interpret_chart``, which
+fills the line templates of ``app.interpretations``. The aspect search is
+the same in both and is included, as it is in a real request. The last
+columns are the speedup over the f-strings; the run fails if the English
+catalog is slower than them.
+
+Usage: python -m benchmarks.bench_interpretations [--charts N] [--repeat N]
+"""
+from array import array
+import argparse
+import random
+import time
+
+from app.aspects import find_aspects
+from app.charts import CLASSICAL_PLANETS, POS_ASC, POS_LON, POSITIONS_SIZE, SIGNS, interpret_chart
+from app.interpretations import LANGUAGES
+
+
+def _sign(lon):
+    return SIGNS[int(lon / 30)]
+
+def fstring_interpret_chart(positions, is_premium=False):
+    """``interpret_chart`` as it was before the catalog."""
+    sun, moon, asc = positions[POS_LON], positions[POS_LON + 1], positions[POS_ASC]
+    basic = [
+        f"Sun in {_sign(sun)} ({sun % 30:.1f}°)",
+        f"Moon in {_sign(moon)} ({moon % 30:.1f}°)",
+        f"Ascendant in {_sign(asc)} ({asc % 30:.1f}°)"
+    ]
+    premium = []
+    if is_premium:
+        longitudes = {}
+        for i, planet in enumerate(CLASSICAL_PLANETS):
+            lon = positions[POS_LON + i]
+            longitudes[planet] = lon
+            premium.append(f"{planet} in {_sign(lon)} ({lon % 30:.1f}°)")
+        for aspect in find_aspects(longitudes):
+            premium.append(f"{aspect.body1}-{aspect.body2}: {aspect.aspect} ({aspect.orb:.1f}°)")
+    return {"basic": "\n".join(basic), "premium": "\n".join(premium) if is_premium else None}
+
+def _time(fn, charts, repeat, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        began = time.perf_counter()
+        for positions in charts:
+            fn(positions, *args)
+        best = min(best, time.perf_counter() - began)
+    return best / len(charts) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--charts", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    charts = [array("d", (rng.uniform(0, 360) for _ in range(POSITIONS_SIZE))) for _ in range(args.charts)]
+    for positions in charts[:1000]:
+        assert interpret_chart(positions, True) == fstring_interpret_chart(positions, True)
+
+    print(f"{args.charts} charts, best of {args.repeat}, µs per interpretation")
+    print(f"{'version':<14}{'basic':>10}{'premium':>10}{'speedup':>10}{'':>10}")
+    runs = [("f-strings", fstring_interpret_chart, ())]
+    runs += [(f"catalog {language}", interpret_chart, (language,)) for language in LANGUAGES]
+    results = {}
+    for name, fn, language in runs:
+        basic = _time(fn, charts, args.repeat, False, *language)
+        premium = _time(fn, charts, args.repeat, True, *language)
+        results[name] = basic, premium
+        base_basic, base_premium = results["f-strings"]
+        print(
+            f"{name:<14}{basic:>10.2f}{premium:>10.2f}"
+            f"{base_basic / basic:>9.2f}x{base_premium / premium:>9.2f}x"
+        )
+    basic, premium = results["catalog en"]
+    assert basic <= base_basic and premium <= base_premium, "the catalog is slower than f-strings"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Ledger write throughput and restart time of the durable memory backend.
+
+Runs ad-reward top-ups (``update_user`` with a transaction and a revenue
+row, the hottest write path) from many concurrent tasks against a ledger in
+a temporary directory and reports top-ups per second and records per
+``fsync``, next to a single task that pays one ``fsync`` per top-up. It then restarts from the files three ways: replaying the whole
+log, loading the snapshot a clean shutdown writes, and loading a snapshot
+plus a tail of ``--tail`` top-ups.
+
+Usage: python -m benchmarks.bench_ledger [--rows N] [--concurrency N] [--tail N]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import datetime
+
+from app.storage import MemoryStorage
+
+
+async def _top_ups(storage, user_ids, start, stop, concurrency):
+    async def worker(offset):
+        for i in range(start + offset, stop, concurrency):
+            user_id = user_ids[i % len(user_ids)]
+            async with storage.update_user(user_id) as update:
+                update.user["balance"] += 10
+                update.add_transaction({
+                    "id": f"t{i}", "user_id": user_id, "amount": 10, "type": "ad",
+                    "description": "Added 10 coins from ad", "created_at": datetime.now()
+                })
+                update.add_revenue({
+                    "id": f"rev{i}", "source": "ad", "amount": 0.01, "created_at": datetime.now()
+                })
+
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+
+def _restart(directory):
+    began = time.perf_counter()
+    storage = MemoryStorage(ledger_dir=directory, snapshot_rows=10**12)
+    asyncio.run(storage.open())
+    return storage, time.perf_counter() - began
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="ledger rows (2 per top-up)")
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--tail", type=int, default=10_000)
+    args = parser.parse_args()
+    top_ups = args.rows // 2
+
+    with tempfile.TemporaryDirectory() as directory:
+        # No periodic snapshot, so the first restart replays the whole log
+        storage = MemoryStorage(ledger_dir=directory, snapshot_rows=10**12)
+
+        async def write():
+            await storage.open()
+            user_ids = [(await storage.create_user(f"ledger_user_{n}"))["id"] for n in range(1000)]
+            began = time.perf_counter()
+            await _top_ups(storage, user_ids, 0, 1000, 1)
+            print(f"1 task: {1000 / (time.perf_counter() - began):,.0f} top-ups/s")
+            fsyncs = storage.ledger.fsyncs
+            began = time.perf_counter()
+            await _top_ups(storage, user_ids, 1000, top_ups, args.concurrency)
+            return user_ids, time.perf_counter() - began, storage.ledger.fsyncs - fsyncs
+
+        user_ids, elapsed, fsyncs = asyncio.run(write())
+        print(f"{args.concurrency} tasks: {(top_ups - 1000) / elapsed:,.0f} top-ups/s, "
+              f"{(top_ups - 1000) * 3 / fsyncs:,.1f} records per fsync")
+        expected = len(storage.db["transactions"])
+        storage.ledger.close()  # Stop the writer without a shutdown snapshot
+
+        storage, seconds = _restart(directory)
+        assert len(storage.db["transactions"]) == expected
+        print(f"restart, full log replay:      {seconds:6.2f} s")
+
+        asyncio.run(storage.close())
+        storage, seconds = _restart(directory)
+        assert len(storage.db["transactions"]) == expected
+        print(f"restart, snapshot only:        {seconds:6.2f} s")
+
+        async def tail():
+            await _top_ups(storage, user_ids, top_ups, top_ups + args.tail, args.concurrency)
+
+        asyncio.run(tail())
+        storage.ledger.close()
+        storage, seconds = _restart(directory)
+        assert len(storage.db["transactions"]) == expected + args.tail
+        print(f"restart, snapshot + {args.tail:,} tail: {seconds:6.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Concurrent load test of the API with a realistic endpoint mix.
+
+``--concurrency`` virtual users each sign up, then loop over weighted
+operations until ``--duration`` runs out: balance top-ups, chart creation,
+premium unlocks (of their own charts, once they can afford one), saving and
+listing readings, and now and then signing up as a new user. Requests made
+during the first ``--warmup`` seconds are not counted.
+
+By default the app is driven in-process through its ASGI interface (with
+its lifespan, so chart workers and storage start as in production);
+``--spawn`` starts a local uvicorn on a free port instead, and ``--url``
+targets a server that is already running.
+
+Prints requests/s and p50/p95/p99 latency per endpoint. ``--out`` writes
+the same numbers, with the commit and settings, as JSON; ``--compare``
+prints the change against such a file from an earlier run.
+
+Usage: python -m benchmarks.bench_load [--concurrency N] [--duration S]
+       [--warmup S] [--mix op=weight,...] [--seed N] [--spawn | --url URL]
+       [--out results.json] [--compare previous.json]
+"""
+from typing import Any, Dict, List, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import json
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+import numpy as np
+
+from app import main as api
+
+# Operation -> (method, route template), in report order
+OPERATIONS = {
+    "signup": ("POST", "/users"),
+    "balance_add": ("POST", "/users/{user_id}/balance/add"),
+    "chart_create": ("POST", "/charts/create"),
+    "premium_unlock": ("POST", "/charts/{chart_id}/unlock-premium"),
+    "reading_create": ("POST", "/readings/{user_id}"),
+    "reading_list": ("GET", "/readings/{user_id}")
+}
+DEFAULT_MIX = {
+    "signup": 1,
+    "balance_add": 4,
+    "chart_create": 3,
+    "premium_unlock": 1,
+    "reading_create": 2,
+    "reading_list": 2
+}
+TOP_UP = 500  # Coins per balance_add
+PLACES = (
+    (52.52, 13.405, "Europe/Berlin"),
+    (39.9042, 116.4074, "Asia/Shanghai"),
+    (40.7128, -74.006, "America/New_York"),
+    (-33.8688, 151.2093, "Australia/Sydney"),
+    (51.5074, -0.1278, "Europe/London")
+)
+CARDS = ("The Fool", "The Magician", "The High Priestess", "The Empress", "The Tower", "The Star", "The Moon")
+
+
+class Recorder:
+    """Latencies and errors per operation, counted between ``start`` and ``stop``."""
+
+    def __init__(self, start: float, stop: float):
+        self.start = start
+        self.stop = stop
+        self.latencies: Dict[str, List[float]] = {name: [] for name in OPERATIONS}
+        self.errors: Dict[str, int] = {name: 0 for name in OPERATIONS}
+        self.statuses: Dict[str, Dict[int, int]] = {name: {} for name in OPERATIONS}
+
+    def add(self, name: str, began: float, ended: float, status: Optional[int]) -> None:
+        if began < self.start or ended > self.stop:
+            return
+        self.latencies[name].append(ended - began)
+        if status is None or status >= 400:
+            self.errors[name] += 1
+        if status is not None:
+            counts = self.statuses[name]
+            counts[status] = counts.get(status, 0) + 1
+
+
+async def _call(client: httpx.AsyncClient, recorder: Recorder, name: str, url: str, **kwargs) -> Optional[Any]:
+    """One timed request; its JSON body if it succeeded."""
+    began = time.perf_counter()
+    try:
+        response = await client.request(OPERATIONS[name][0], url, **kwargs)
+    except httpx.HTTPError:
+        recorder.add(name, began, time.perf_counter(), None)
+        return None
+    recorder.add(name, began, time.perf_counter(), response.status_code)
+    return response.json() if response.status_code < 400 else None
+
+
+def _chart_request(rng: random.Random) -> Dict[str, Any]:
+    latitude, longitude, tz = rng.choice(PLACES)
+    return {
+        "birth_date": f"{rng.randint(1950, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "birth_time": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+        "latitude": latitude,
+        "longitude": longitude,
+        "timezone": tz
+    }
+
+
+async def _virtual_user(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    mix: Dict[str, int],
+    rng: random.Random,
+    deadline: float
+) -> None:
+    names, weights = list(mix), list(mix.values())
+    user: Optional[Dict[str, Any]] = None
+    locked: List[str] = []  # This user's charts without premium
+    balance = 0
+    while time.perf_counter() < deadline:
+        op = "signup" if user is None else rng.choices(names, weights)[0]
+        # Unlocking needs a chart and the coins for it: do what is missing first
+        if op == "premium_unlock" and not locked:
+            op = "chart_create"
+        elif op == "premium_unlock" and balance < api.PREMIUM_UNLOCK_COST:
+            op = "balance_add"
+
+        if op == "signup":
+            created = await _call(client, recorder, op, "/users", json={"username": f"load_{uuid.uuid4().hex}"})
+            if created is not None:
+                user, locked, balance = created, [], created.get("balance", 0)
+        elif op == "balance_add":
+            updated = await _call(
+                client, recorder, op, f"/users/{user['id']}/balance/add", params={"amount": TOP_UP, "source": "ad"}
+            )
+            if updated is not None:
+                balance = updated["balance"]
+        elif op == "chart_create":
+            chart = await _call(client, recorder, op, "/charts/create", json=_chart_request(rng))
+            if chart is not None:
+                locked.append(chart["id"])
+        elif op == "premium_unlock":
+            chart_id = locked.pop()
+            unlocked = await _call(
+                client, recorder, op, f"/charts/{chart_id}/unlock-premium", json={"user_id": user["id"]}
+            )
+            if unlocked is not None:
+                balance -= api.PREMIUM_UNLOCK_COST
+        elif op == "reading_create":
+            cards = [
+                {"name": name, "position": position}
+                for name, position in zip(rng.sample(CARDS, 3), ("past", "present", "future"))
+            ]
+            await _call(
+                client, recorder, op, f"/readings/{user['id']}",
+                json={"spread_type": "three_card", "cards": cards}
+            )
+        else:
+            await _call(client, recorder, op, f"/readings/{user['id']}")
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    concurrency: int,
+    duration: float,
+    warmup: float = 0.0,
+    mix: Optional[Dict[str, int]] = None,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """Run the mix on ``client`` and summarize it per operation."""
+    mix = mix or DEFAULT_MIX
+    began = time.perf_counter()
+    recorder = Recorder(began + warmup, began + warmup + duration)
+    await asyncio.gather(*(
+        _virtual_user(client, recorder, mix, random.Random(seed * 100003 + n), recorder.stop)
+        for n in range(concurrency)
+    ))
+    endpoints = {}
+    for name, (method, route) in OPERATIONS.items():
+        endpoints[name] = {"method": method, "route": route, **_summary(recorder.latencies[name], duration)}
+        endpoints[name]["errors"] = recorder.errors[name]
+        endpoints[name]["statuses"] = {str(status): count for status, count in sorted(recorder.statuses[name].items())}
+    everything = [latency for latencies in recorder.latencies.values() for latency in latencies]
+    total = {**_summary(everything, duration), "errors": sum(recorder.errors.values())}
+    return {"endpoints": endpoints, "total": total}
+
+def _summary(latencies: List[float], duration: float) -> Dict[str, Any]:
+    if not latencies:
+        return {"requests": 0, "rps": 0.0, "p50_ms": None, "p95_ms": None, "p99_ms": None,
+                "mean_ms": None, "max_ms": None}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / duration, 2),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "max_ms": round(float(ms.max()), 3)
+    }
+
+
+@asynccontextmanager
+async def in_process_client():
+    """A client calling the app directly, with its lifespan running."""
+    async with api.app.router.lifespan_context(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load") as client:
+            yield client
+
+@asynccontextmanager
+async def http_client(url: str, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        yield client
+
+@asynccontextmanager
+async def spawned_server():
+    """A uvicorn serving the app on a free local port; yields its URL."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=url) as probe:
+            for _ in range(300):
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+                try:
+                    if (await probe.get("/healthz")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start within 30 seconds")
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name.strip()!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name.strip()] = int(weight)
+    return mix
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+def _print_results(results: Dict[str, Any]) -> None:
+    print(f"{'endpoint':<16}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    rows = list(results["endpoints"].items()) + [("total", results["total"])]
+    for name, row in rows:
+        print(f"{name:<16}{row['requests']:>10,}{row['errors']:>8,}{row['rps']:>10,.1f}"
+              f"{_ms(row['p50_ms']):>9}{_ms(row['p95_ms']):>9}{_ms(row['p99_ms']):>9}")
+
+def _print_comparison(results: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    print(f"\nchange vs {previous.get('commit') or 'previous run'} ({previous.get('started_at')})")
+    print(f"{'endpoint':<16}{'req/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}")
+    old_rows = {**previous["endpoints"], "total": previous["total"]}
+    for name, row in list(results["endpoints"].items()) + [("total", results["total"])]:
+        old = old_rows.get(name)
+        if old is None:
+            continue
+        cells = [_change(row[key], old[key]) for key in ("rps", "p50_ms", "p95_ms", "p99_ms")]
+        print(f"{name:<16}{cells[0]:>10}{cells[1]:>9}{cells[2]:>9}{cells[3]:>9}")
+
+def _change(new: Optional[float], old: Optional[float]) -> str:
+    if not new or not old:
+        return "-"
+    return f"{(new - old) / old:+.0%}"
+
+
+async def _main(args) -> Dict[str, Any]:
+    if args.spawn:
+        async with spawned_server() as url, http_client(url, args.concurrency) as client:
+            return await run_load(client, args.concurrency, args.duration, args.warmup, args.mix, args.seed)
+    if args.url:
+        async with http_client(args.url, args.concurrency) as client:
+            return await run_load(client, args.concurrency, args.duration, args.warmup, args.mix, args.seed)
+    async with in_process_client() as client:
+        return await run_load(client, args.concurrency, args.duration, args.warmup, args.mix, args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds before measuring")
+    parser.add_argument("--mix", type=_parse_mix, default=DEFAULT_MIX,
+                        help="op=weight pairs, e.g. chart_create=1,reading_list=5")
+    parser.add_argument("--seed", type=int, default=0)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--spawn", action="store_true", help="start a local uvicorn and load it over HTTP")
+    target.add_argument("--url", help="load a running server, e.g. http://localhost:8000")
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    target_name = "spawned uvicorn" if args.spawn else args.url or "in-process"
+    print(f"{args.concurrency} virtual users for {args.duration:g} s ({args.warmup:g} s warmup), {target_name}")
+    results = {
+        "commit": _commit(),
+        "started_at": started_at,
+        "target": target_name,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "mix": args.mix,
+        "seed": args.seed,
+        **asyncio.run(_main(args))
+    }
+    _print_results(results)
+    if args.compare:
+        with open(args.compare) as f:
+            _print_comparison(results, json.load(f))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.out}")
+
+if __name__ == "__main__":
+    main()
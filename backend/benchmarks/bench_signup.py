@@ -0,0 +1,59 @@
+"""Signup throughput as the user count grows, with the username index.
+
+Calls the ``create_user`` coroutine (without HTTP) until ``--users``
+accounts exist and reports signups per second for each block. At the end
+it times the username scan ``create_user`` used to do, at the final size.
+
+Usage: python -m benchmarks.bench_signup [--users N] [--block N]
+"""
+import argparse
+import asyncio
+import time
+
+from app.main import db, create_user, get_user_by_username, CreateUserRequest
+
+
+def legacy_find(username):
+    for user in db["users"].values():
+        if user["username"] == username:
+            return user
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--block", type=int, default=100_000)
+    args = parser.parse_args()
+
+    db["users"] = {}
+    db["users_by_username"] = {}
+    requests = [CreateUserRequest(username=f"User{n}") for n in range(args.users)]
+
+    async def signup(batch):
+        for request in batch:
+            await create_user(request)
+
+    loop = asyncio.new_event_loop()
+    print(f"{'users':>11}{'signups/s':>14}")
+    for start in range(0, args.users, args.block):
+        batch = requests[start:start + args.block]
+        began = time.perf_counter()
+        loop.run_until_complete(signup(batch))
+        elapsed = time.perf_counter() - began
+        print(f"{start + len(batch):>11,}{len(batch) / elapsed:>14,.0f}")
+
+    # Existing names, worst case for the scan (the most recent signup)
+    last = f"user{args.users - 1}"
+    began = time.perf_counter()
+    for _ in range(100):
+        loop.run_until_complete(get_user_by_username(last))
+    indexed = (time.perf_counter() - began) / 100
+    began = time.perf_counter()
+    legacy_find(f"User{args.users - 1}")
+    scan = time.perf_counter() - began
+    loop.close()
+    print(f"lookup at {args.users:,} users: index {indexed * 1e6:.1f} us, "
+          f"linear scan {scan * 1e3:.1f} ms")
+
+if __name__ == "__main__":
+    main()
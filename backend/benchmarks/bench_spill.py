@@ -0,0 +1,74 @@
+"""Memory-budgeted chart table: resident size, spill rate and fault latency.
+
+Stores ``--charts`` chart records in the memory backend with a
+``--budget-mb`` budget for ``charts``, then reads ``--reads`` random
+charts, most of which have to be faulted back in from the spill file.
+Reports traced Python memory with and without the budget.
+
+Usage: python -m benchmarks.bench_spill [--charts N] [--budget-mb MB] [--reads N]
+"""
+from array import array
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from app.records import ChartRecord
+from app.storage import MemoryStorage
+
+
+def _chart(i):
+    return ChartRecord(
+        id=f"chart-{i:08d}", date="1990-01-01", time="12:00", latitude=48.8566, longitude=2.3522,
+        house_time="standard", house_system="Placidus", positions=array("d", [i / 7] * 31)
+    )
+
+async def _run(charts, budget_mb, reads, directory):
+    tracemalloc.start()
+    storage = MemoryStorage(memory_budgets={"charts": budget_mb}, spill_dir=directory)
+    began = time.perf_counter()
+    for start in range(0, charts, 1000):
+        await storage.save_charts([_chart(i) for i in range(start, min(start + 1000, charts))])
+    insert_rate = charts / (time.perf_counter() - began)
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rng = random.Random(1)
+    latencies = []
+    for _ in range(reads):
+        chart_id = f"chart-{rng.randrange(charts):08d}"
+        began = time.perf_counter()
+        await storage.get_chart(chart_id)
+        latencies.append(time.perf_counter() - began)
+    latencies.sort()
+    stats = storage.memory_stats().get("charts", {})
+    path = os.path.join(directory, "spill-charts.sqlite")
+    spill_size = os.path.getsize(path) if os.path.exists(path) else 0
+    await storage.close()
+    return insert_rate, traced, spill_size, latencies, stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--charts", type=int, default=200000)
+    parser.add_argument("--budget-mb", type=float, default=16)
+    parser.add_argument("--reads", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{args.charts} charts, {args.reads} random reads")
+    print(f"{'budget':>10}{'inserts/s':>12}{'traced MB':>11}{'spill MB':>10}"
+          f"{'spilled':>10}{'faults':>9}{'p50 µs':>9}{'p99 µs':>9}")
+    for budget in (0, args.budget_mb):
+        with tempfile.TemporaryDirectory() as directory:
+            rate, traced, spill_size, latencies, stats = asyncio.run(
+                _run(args.charts, budget, args.reads, directory)
+            )
+        p50 = latencies[len(latencies) // 2] * 1e6
+        p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+        print(f"{budget or 'none':>10}{rate:>12,.0f}{traced / 2**20:>11.1f}{spill_size / 2**20:>10.1f}"
+              f"{stats.get('spilled', 0):>10}{stats.get('faults', 0):>9}{p50:>9.1f}{p99:>9.1f}")
+
+if __name__ == "__main__":
+    main()
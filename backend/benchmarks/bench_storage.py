@@ -0,0 +1,87 @@
+"""Per-operation latency of each storage backend.
+
+Times the storage calls the hot endpoints make: signup (``create_user``),
+a balance top-up (``update_user`` with a transaction row), ``get_user`` and
+one page of readings. Memory and SQLite (a temporary WAL file) always run;
+Postgres runs when ``STORAGE_BENCH_POSTGRES_URL`` points at a scratch
+database, whose tables are emptied first.
+
+Usage: python -m benchmarks.bench_storage [--ops N] [--concurrency N]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from app.storage import create_storage
+
+
+async def _timed(label, ops, concurrency, op):
+    """Run ``op(i)`` for ``i < ops`` from ``concurrency`` tasks; print us/op."""
+    async def worker(offset):
+        for i in range(offset, ops, concurrency):
+            await op(i)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - began
+    print(f"  {label:<18}{elapsed / ops * 1e6:>10,.1f} us/op{ops / elapsed:>12,.0f} ops/s")
+
+async def bench(url, ops, concurrency):
+    storage = create_storage(url)
+    await storage.open()
+    try:
+        if url.startswith("postgres"):
+            async with storage._session() as session:
+                await session.execute("TRUNCATE users, charts, readings, transactions, revenue")
+
+        user_ids = [None] * ops
+
+        async def signup(i):
+            user_ids[i] = (await storage.create_user(f"bench_user_{i}"))["id"]
+
+        async def top_up(i):
+            async with storage.update_user(user_ids[i]) as update:
+                update.user["balance"] += 10
+                update.add_transaction({
+                    "id": f"t{i}", "user_id": user_ids[i], "amount": 10, "type": "ad",
+                    "description": "Added 10 coins from ad", "created_at": datetime.now()
+                })
+
+        async def get_user(i):
+            await storage.get_user(user_ids[i])
+
+        async def readings_page(i):
+            await storage.readings_page(user_ids[0], limit=20)
+
+        await _timed("create_user", ops, concurrency, signup)
+        # One user with many readings, paged 20 at a time
+        for n in range(1000):
+            await storage.add_reading({
+                "id": f"r{n}", "user_id": user_ids[0], "spread_type": "three_card",
+                "cards": [], "created_at": datetime.now()
+            })
+        await _timed("update_user", ops, concurrency, top_up)
+        await _timed("get_user", ops, concurrency, get_user)
+        await _timed("readings page", ops, concurrency, readings_page)
+    finally:
+        await storage.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        urls = ["memory://", f"sqlite:///{os.path.join(tmp, 'bench.db')}"]
+        if os.environ.get("STORAGE_BENCH_POSTGRES_URL"):
+            urls.append(os.environ["STORAGE_BENCH_POSTGRES_URL"])
+        for url in urls:
+            print(url.split(":")[0])
+            asyncio.run(bench(url, args.ops, args.concurrency))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Per-user lookup latency as the global row count grows: full scan vs index.
+
+Fills ``db`` with readings and transactions spread over many users, then
+times ``GET /readings/{user_id}`` and ``GET /users/{user_id}/transactions``
+(the endpoint coroutines, without HTTP) for one user with a fixed number of
+rows, next to the full scans those endpoints used to do. Finally it times
+one cursor page of transactions for a single user with a growing history.
+
+Usage: python -m benchmarks.bench_user_indexes [--max-rows N] [--user-rows N]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from fastapi import Response
+
+from app.main import db, encode_cursor, get_transactions, get_user_readings, storage
+
+TARGET_USER = "bench_target"
+HEAVY_USER = "bench_heavy"
+
+
+async def _populate(kind, start, stop, user_rows, created_at):
+    """Add rows ``start..stop``; the first ``user_rows`` belong to the target user."""
+    for n in range(start, stop):
+        user_id = TARGET_USER if n < user_rows else f"user{n % 50000}"
+        if kind == "readings":
+            await storage.add_reading({
+                "id": f"r{n}", "user_id": user_id, "spread_type": "three_card",
+                "cards": [], "created_at": created_at
+            })
+        else:
+            storage.record_transaction({
+                "id": f"t{n}", "user_id": user_id, "amount": 10, "type": "ad",
+                "description": "Added 10 coins from ad", "created_at": created_at
+            })
+
+def legacy_readings(user_id):
+    return [r for r in db["readings"].values() if r["user_id"] == user_id]
+
+def legacy_transactions(user_id):
+    return [t for t in db["transactions"] if t["user_id"] == user_id]
+
+def _time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-rows", type=int, default=1_000_000)
+    parser.add_argument("--user-rows", type=int, default=20)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    db["users"][TARGET_USER] = {"id": TARGET_USER, "username": TARGET_USER, "balance": 0}
+    created_at = datetime.now()
+    sizes = [n for n in (10_000, 100_000, 1_000_000, 10_000_000) if n <= args.max_rows]
+    print(f"target user rows: {args.user_rows}")
+    print(f"{'table':<13}{'rows':>11}{'scan (us)':>13}{'index (us)':>13}")
+
+    for kind, endpoint, legacy in (
+        ("readings", get_user_readings, legacy_readings),
+        ("transactions", get_transactions, legacy_transactions),
+    ):
+        filled = 0
+        for size in sizes:
+            loop.run_until_complete(_populate(kind, filled, size, args.user_rows, created_at))
+            filled = size
+            assert len(loop.run_until_complete(endpoint(TARGET_USER, Response()))) == len(legacy(TARGET_USER))
+            scan = _time(lambda: legacy(TARGET_USER), 3)
+            index = _time(lambda: loop.run_until_complete(endpoint(TARGET_USER, Response())), 200)
+            print(f"{kind:<13}{size:>11,}{scan:>13,.0f}{index:>13,.1f}")
+        # Free this table before filling the next one
+        db[kind] = {} if kind == "readings" else []
+        db[f"{kind}_by_user"] = {}
+
+    print(f"\n{'user rows':>11}{'page of 50 (us)':>18}")
+    db["users"][HEAVY_USER] = {"id": HEAVY_USER, "username": HEAVY_USER, "balance": 0}
+    filled = 0
+    for size in sizes:
+        for n in range(filled, size):
+            storage.record_transaction({
+                "id": f"h{n}", "user_id": HEAVY_USER, "amount": 10, "type": "ad",
+                "description": "Added 10 coins from ad", "created_at": created_at
+            })
+        filled = size
+        index = db["transactions_by_user"][HEAVY_USER]
+        cursor = encode_cursor(index.keys[size // 2])
+        page = _time(lambda: loop.run_until_complete(
+            get_transactions(HEAVY_USER, Response(), limit=50, after=cursor)
+        ), 200)
+        print(f"{size:>11,}{page:>18,.1f}")
+    loop.close()
+
+if __name__ == "__main__":
+    main()
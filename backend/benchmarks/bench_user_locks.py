@@ -0,0 +1,59 @@
+"""Throughput of balance updates under one global lock vs striped user locks.
+
+Runs ``--tasks`` concurrent tasks, each doing ``update_user`` top-ups on
+the memory backend with an ``await asyncio.sleep(--hold-ms)`` between the
+balance check and the change, standing in for a storage round trip. The
+same workload runs with a single lock for every user and with
+``--stripes`` striped locks, spread over ``--users`` users and aimed at
+one hot user. Each run checks that no top-up was lost.
+
+Usage: python -m benchmarks.bench_user_locks [--tasks N] [--ops N] [--users N]
+       [--stripes N] [--hold-ms MS]
+"""
+import argparse
+import asyncio
+import time
+
+from app.locks import StripedLock
+from app.storage import MemoryStorage
+
+
+async def _run(stripes, users, tasks, ops, hold):
+    storage = MemoryStorage()
+    storage.user_locks = StripedLock(stripes)
+    user_ids = [(await storage.create_user(f"lock_user_{n}"))["id"] for n in range(users)]
+
+    async def worker(offset):
+        for i in range(offset, ops * tasks, tasks):
+            async with storage.update_user(user_ids[i % users]) as update:
+                balance = update.user["balance"]
+                await asyncio.sleep(hold)
+                update.user["balance"] = balance + 1
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(tasks)))
+    elapsed = time.perf_counter() - began
+    total = sum(storage.db["users"][user_id]["balance"] for user_id in user_ids)
+    assert total == ops * tasks, f"lost {ops * tasks - total} updates"
+    stats = storage.user_locks.stats()
+    return ops * tasks / elapsed, stats["contended"] / stats["acquired"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=20)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--stripes", type=int, default=1024)
+    parser.add_argument("--hold-ms", type=float, default=1.0)
+    args = parser.parse_args()
+    hold = args.hold_ms / 1000
+
+    print(f"{args.tasks} tasks x {args.ops} top-ups, {args.hold_ms} ms inside the lock")
+    print(f"{'workload':<12}{'locks':>8}{'updates/s':>12}{'contended':>12}")
+    for workload, users in (("spread", args.users), ("hot user", 1)):
+        for stripes in (1, args.stripes):
+            rate, contended = asyncio.run(_run(stripes, users, args.tasks, args.ops, hold))
+            print(f"{workload:<12}{stripes:>8}{rate:>12,.0f}{contended:>12.0%}")
+
+if __name__ == "__main__":
+    main()
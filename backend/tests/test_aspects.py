@@ -0,0 +1,41 @@
+"""Tests for the vectorized aspect engine."""
+import pytest
+
+from app.aspects import find_aspects
+
+
+def test_uses_absolute_longitude():
+    """10° Aries and 10° Leo form a trine, not a conjunction."""
+    aspects = find_aspects({"Sun": 10.0, "Moon": 130.0})
+    assert [(a.body1, a.body2, a.aspect) for a in aspects] == [("Sun", "Moon", "Trine")]
+    assert aspects[0].orb == pytest.approx(0.0)
+
+def test_wraps_around_zero_aries():
+    """Separation is measured the short way round the zodiac."""
+    aspects = find_aspects({"Sun": 358.0, "Moon": 2.0})
+    assert aspects[0].aspect == "Conjunction"
+    assert aspects[0].separation == pytest.approx(4.0)
+
+def test_each_pair_once_in_order():
+    """Pairs are reported once, ordered like the bodies."""
+    aspects = find_aspects({"Sun": 0.0, "Moon": 90.0, "Mars": 180.0})
+    assert [(a.body1, a.body2, a.aspect) for a in aspects] == [
+        ("Sun", "Moon", "Square"),
+        ("Sun", "Mars", "Opposition"),
+        ("Moon", "Mars", "Square"),
+    ]
+
+def test_per_aspect_and_per_planet_orbs():
+    """Aspect orbs and planet orbs both narrow what counts as an aspect."""
+    positions = {"Sun": 0.0, "Moon": 64.0}
+    orbs = {0: 8.0, 60: 5.0, 90: 8.0, 120: 8.0, 180: 8.0}
+    assert find_aspects(positions, aspect_orbs=orbs)[0].aspect == "Sextile"
+    assert find_aspects(positions, aspect_orbs=orbs, planet_orbs={"Sun": 4.0, "Moon": 3.0}) == []
+
+def test_cross_aspects_between_sets():
+    """Two position sets give every cross pair (synastry, transits)."""
+    aspects = find_aspects({"Sun": 0.0}, other={"Sun": 120.0, "Venus": 2.0})
+    assert [(a.body1, a.body2, a.aspect) for a in aspects] == [
+        ("Sun", "Sun", "Trine"),
+        ("Sun", "Venus", "Conjunction"),
+    ]
@@ -0,0 +1,68 @@
+"""Tests for the batch chart endpoint."""
+from fastapi.testclient import TestClient
+
+from app import main
+
+client = TestClient(main.app)
+
+NEW_YORK = {
+    "birth_date": "1990-01-01",
+    "birth_time": "12:00",
+    "latitude": 40.7128,
+    "longitude": -74.0060,
+    "timezone": "America/New_York"
+}
+LONDON = {
+    "birth_date": "1975-03-21",
+    "birth_time": "06:45",
+    "latitude": 51.5074,
+    "longitude": -0.1278,
+    "timezone": "Europe/London"
+}
+
+
+def test_batch_dedupes_and_keeps_order(monkeypatch):
+    """Duplicates are computed once; results and errors keep request order."""
+    main.db["charts"] = {}
+    main.chart_cache.clear()
+    computed = []
+    original_map = main.chart_engine.map
+
+    async def recording_map(fn, arg_list):
+        if fn is main.compute_chart:
+            computed.extend(arg_list)
+        return await original_map(fn, arg_list)
+
+    monkeypatch.setattr(main.chart_engine, "map", recording_map)
+    response = client.post(
+        "/charts/batch",
+        json=[NEW_YORK, dict(NEW_YORK, timezone="Invalid/Timezone"), LONDON, NEW_YORK]
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert len(computed) == 2
+
+    assert results[1]["chart"] is None
+    assert results[1]["error"]["status_code"] == 422
+
+    for i in (0, 2, 3):
+        assert results[i]["error"] is None
+        assert results[i]["chart"]["id"] in main.db["charts"]
+    assert results[0]["chart"]["planets"] == results[3]["chart"]["planets"]
+    assert results[0]["chart"]["id"] != results[3]["chart"]["id"]
+    assert results[2]["chart"]["date"] == "1975-03-21"
+
+def test_batch_matches_single_create():
+    """Batch charts carry the same data as /charts/create."""
+    main.db["charts"] = {}
+    single = client.post("/charts/create", json=LONDON).json()
+    batch = client.post("/charts/batch", json=[LONDON]).json()["results"][0]["chart"]
+    for field in ("planets", "houses", "basic_interpretation", "solar_time"):
+        assert batch[field] == single[field]
+
+def test_batch_limit(monkeypatch):
+    """Oversized batches are rejected as a whole."""
+    monkeypatch.setattr(main, "CHART_BATCH_LIMIT", 2)
+    response = client.post("/charts/batch", json=[NEW_YORK] * 3)
+    assert response.status_code == 413
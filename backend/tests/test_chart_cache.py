@@ -0,0 +1,65 @@
+"""Tests for the chart result cache."""
+from datetime import datetime
+from fastapi.testclient import TestClient
+
+from app import main
+from app.chart_cache import ChartCache
+
+client = TestClient(main.app)
+
+
+def test_key_normalizes_birth_data():
+    """Seconds and sub-precision coordinate noise map onto the same key."""
+    cache = ChartCache(precision=2)
+    a = cache.key(datetime(1990, 1, 1, 17, 0, 12), 40.71281, -74.00601, "Placidus")
+    b = cache.key(datetime(1990, 1, 1, 17, 0, 48), 40.71449, -74.00599, "Placidus")
+    assert a == b
+    assert a != cache.key(datetime(1990, 1, 1, 17, 0), 40.71281, -74.00601, "Koch")
+
+def test_lru_eviction():
+    """The least recently used entry is evicted first."""
+    cache = ChartCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+def test_ttl_expiry():
+    """Expired entries are dropped on access and counted."""
+    cache = ChartCache(ttl=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["misses"] == 1
+
+def test_repeated_chart_skips_engine(monkeypatch):
+    """A second chart for the same birth data is served from the cache."""
+    main.db["charts"] = {}
+    main.chart_cache.clear()
+    payload = {
+        "birth_date": "1985-06-15",
+        "birth_time": "08:30",
+        "latitude": 31.2304,
+        "longitude": 121.4737,
+        "timezone": "Asia/Shanghai"
+    }
+    first = client.post("/charts/create", json=payload)
+    assert first.status_code == 200
+
+    async def fail(*args):
+        raise AssertionError("chart engine should not be called")
+
+    monkeypatch.setattr(main.chart_engine, "run", fail)
+    hits = main.chart_cache.hits
+    second = client.post("/charts/create", json=payload)
+    assert second.status_code == 200
+    assert second.json()["planets"] == first.json()["planets"]
+    assert second.json()["id"] != first.json()["id"]
+    assert main.chart_cache.hits == hits + 1
+
+    stats = client.get("/charts/cache/stats").json()
+    assert stats["hits"] >= 1
@@ -0,0 +1,70 @@
+"""Tests for GET /charts/{chart_id}: projection and conditional requests."""
+import uuid
+from fastapi.testclient import TestClient
+
+from app import main
+
+client = TestClient(main.app)
+
+CHART = {
+    "birth_date": "1985-12-24",
+    "birth_time": "23:10",
+    "latitude": 40.7128,
+    "longitude": -74.0060,
+    "timezone": "America/New_York"
+}
+
+
+def test_full_chart_matches_creation():
+    created = client.post("/charts/create", json=CHART).json()
+    fetched = client.get(f"/charts/{created['id']}")
+    assert fetched.status_code == 200
+    assert fetched.json() == created
+    assert client.get("/charts/missing").status_code == 404
+
+def test_field_projection(monkeypatch):
+    chart_id = client.post("/charts/create", json=CHART).json()["id"]
+
+    def fail(positions):
+        raise AssertionError("houses were not requested")
+    monkeypatch.setattr("app.records.houses_data", fail)
+    planets = client.get(f"/charts/{chart_id}", params={"fields": "planets"}).json()
+    assert list(planets) == ["id", "planets"] and len(planets["planets"]) == 7
+
+    solar = client.get(f"/charts/{chart_id}", params={"fields": "solar_time, basic_interpretation"}).json()
+    assert list(solar) == ["id", "basic_interpretation", "solar_time"]
+    zh = client.get(f"/charts/{chart_id}", params={"fields": "basic_interpretation", "language": "zh"}).json()
+    assert zh["basic_interpretation"].startswith("太阳落在")
+
+    assert client.get(f"/charts/{chart_id}", params={"fields": "planets,_chart"}).status_code == 400
+    assert client.get(f"/charts/{chart_id}", params={"language": "fr"}).status_code == 400
+
+def test_etag_changes_on_unlock():
+    chart_id = client.post("/charts/create", json=CHART).json()["id"]
+    first = client.get(f"/charts/{chart_id}")
+    etag = first.headers["ETag"]
+    again = client.get(f"/charts/{chart_id}", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    # Each projection has its own ETag
+    assert client.get(f"/charts/{chart_id}", params={"fields": "houses"}).headers["ETag"] != etag
+
+    user_id = client.post("/users", json={"username": f"chart_get_{uuid.uuid4().hex[:8]}"}).json()["id"]
+    client.post(f"/users/{user_id}/balance/add", params={"amount": 5000, "source": "test"})
+    client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id})
+    unlocked = client.get(f"/charts/{chart_id}", headers={"If-None-Match": etag})
+    assert unlocked.status_code == 200 and unlocked.headers["ETag"] != etag
+    assert unlocked.json()["is_premium_unlocked"] is True
+
+def test_premium_follows_requested_language():
+    chart_id = client.post("/charts/create", json=CHART).json()["id"]
+    user_id = client.post("/users", json={"username": f"chart_get_{uuid.uuid4().hex[:8]}"}).json()["id"]
+    client.post(f"/users/{user_id}/balance/add", params={"amount": 5000, "source": "test"})
+    english = client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id}).json()
+    assert english["premium_interpretation"].startswith("Sun in ")
+
+    zh = client.get(f"/charts/{chart_id}", params={"language": "zh"})
+    assert zh.json()["premium_interpretation"].startswith("太阳落在")
+    assert zh.json()["premium_interpretation"].count("\n") == english["premium_interpretation"].count("\n")
+    en = client.get(f"/charts/{chart_id}", params={"fields": "premium_interpretation"})
+    assert en.json()["premium_interpretation"] == english["premium_interpretation"]
+    assert zh.headers["ETag"] != client.get(f"/charts/{chart_id}").headers["ETag"]
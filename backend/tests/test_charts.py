@@ -0,0 +1,55 @@
+"""Tests for the chart computation pipeline."""
+from datetime import datetime, timedelta
+import pytest
+
+from app import charts
+
+
+def _count_builds(monkeypatch):
+    calls = []
+    original = charts.build_chart
+
+    def counting_build_chart(*args):
+        calls.append(args)
+        return original(*args)
+
+    monkeypatch.setattr(charts, "build_chart", counting_build_chart)
+    return calls
+
+def test_standard_time_computes_one_chart(monkeypatch):
+    """Standard-time houses need a single ephemeris computation."""
+    calls = _count_builds(monkeypatch)
+    result = charts.compute_chart(datetime(1990, 1, 1, 17, 0), 40.7128, -74.0060)
+    assert len(calls) == 1
+    assert len(result) == charts.POSITIONS_SIZE
+
+def test_solar_houses_keep_planets_and_shift_by_equation_of_time(monkeypatch):
+    """Solar-time houses reuse the UTC planets; only the angles move, by the EoT."""
+    calls = _count_builds(monkeypatch)
+    utc_dt = datetime(1990, 1, 1, 17, 0)
+    solar = charts.compute_chart(utc_dt, 40.7128, -74.0060, charts.HOUSE_TIME_SOLAR)
+    assert len(calls) == 1
+    standard = charts.compute_chart(utc_dt, 40.7128, -74.0060)
+
+    assert solar[charts.POS_LON:charts.POS_CUSPS] == standard[charts.POS_LON:charts.POS_CUSPS]
+    eot_minutes = standard[charts.POS_EOT_MINUTES]
+    assert eot_minutes == pytest.approx(2.70, abs=0.01)
+    # 2.7 minutes of sidereal time: MC about 0.63° later, Asc about 1.12°
+    assert solar[charts.POS_MC] - standard[charts.POS_MC] == pytest.approx(0.626, abs=0.01)
+    assert solar[charts.POS_ASC] - standard[charts.POS_ASC] == pytest.approx(1.120, abs=0.01)
+    cusps, asc, mc = charts.house_positions(utc_dt + timedelta(minutes=eot_minutes), 40.7128, -74.0060)
+    assert (solar[charts.POS_ASC], solar[charts.POS_MC]) == (asc, mc)
+
+def test_positions_match_flatlib():
+    """Derived planets and houses agree with flatlib's own chart."""
+    utc_dt = datetime(1990, 1, 1, 17, 0)
+    positions = charts.compute_chart(utc_dt, 40.7128, -74.0060)
+    chart = charts.build_chart(utc_dt, 40.7128, -74.0060)
+    planets = charts.planets_data(positions)
+    for planet in charts.CLASSICAL_PLANETS:
+        obj = chart.get(planet)
+        house = next(i for i, h in enumerate(chart.houses, 1) if h.hasObject(obj))
+        assert planets[planet] == {"sign": obj.sign, "position": obj.signlon, "house": house}
+    houses = charts.houses_data(positions)
+    for i, house in enumerate(chart.houses, 1):
+        assert houses[str(i)] == {"sign": house.sign, "position": house.lon}
@@ -0,0 +1,76 @@
+"""Tests for the chart compute engine."""
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException
+
+from app.charts import ChartError
+from app.compute import ChartEngine
+
+
+def _fail():
+    raise ChartError(status_code=500, detail="boom")
+
+
+def test_engine_runs_job():
+    """Jobs run on the pool and return their result."""
+    engine = ChartEngine(workers=0, max_pending=2, timeout=5)
+    try:
+        assert asyncio.run(engine.run(sum, [1, 2, 3])) == 6
+        assert engine.pending == 0
+    finally:
+        engine.shutdown()
+
+def test_engine_rejects_when_queue_full():
+    """Requests beyond the queue depth are rejected with 503."""
+    engine = ChartEngine(workers=0, max_pending=1, timeout=5)
+
+    async def scenario():
+        first = asyncio.ensure_future(engine.run(time.sleep, 0.2))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as exc:
+            await engine.run(time.sleep, 0)
+        assert exc.value.status_code == 503
+        await first
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        engine.shutdown()
+
+def test_engine_timeout():
+    """Jobs exceeding the timeout answer 504."""
+    engine = ChartEngine(workers=0, max_pending=2, timeout=0.05)
+    try:
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(engine.run(time.sleep, 0.3))
+        assert exc.value.status_code == 504
+    finally:
+        engine.shutdown()
+
+def test_engine_maps_chart_errors():
+    """ChartError raised by a job becomes the matching HTTPException."""
+    engine = ChartEngine(workers=0, max_pending=2, timeout=5)
+    try:
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(engine.run(_fail))
+        assert exc.value.status_code == 500
+        assert exc.value.detail == "boom"
+    finally:
+        engine.shutdown()
+
+def _invert(x):
+    if x == 0:
+        raise ChartError(status_code=400, detail="zero")
+    return 1 / x
+
+def test_engine_map_keeps_order_and_item_errors():
+    """map() returns results in order with failures captured per item."""
+    engine = ChartEngine(workers=0, max_pending=2, timeout=5)
+    try:
+        results = asyncio.run(engine.map(_invert, [(1,), (0,), (4,)]))
+        assert results[0] == 1
+        assert isinstance(results[1], ChartError) and results[1].status_code == 400
+        assert results[2] == 0.25
+    finally:
+        engine.shutdown()
@@ -0,0 +1,60 @@
+"""Tests for the streaming /ephemeris endpoint."""
+from datetime import datetime, timezone
+import json
+import threading
+import pytest
+import swisseph
+from fastapi.testclient import TestClient
+
+from app import charts
+from app.ephemeris_table import julian_day, sample
+from app.main import app, EPHEMERIS_CHUNK_LINES
+
+client = TestClient(app)
+
+
+def test_streams_one_line_per_step():
+    """Every step is one NDJSON line with swisseph's positions."""
+    response = client.get("/ephemeris", params={
+        "start": "1990-01-01T00:00:00",
+        "end": "1990-03-01T00:00:00",
+        "step_hours": 4
+    })
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.iter_lines()]
+    assert len(lines) == 59 * 6 + 1
+    # Spans more than one chunk, so chunk boundaries are covered
+    assert len(lines) > EPHEMERIS_CHUNK_LINES
+    assert lines[-1]["time"] == "1990-03-01T00:00:00+00:00"
+
+    sample_time = datetime.fromisoformat(lines[21]["time"])
+    exact = sample(julian_day(sample_time))
+    for i, planet in enumerate(charts.CLASSICAL_PLANETS):
+        data = lines[21]["planets"][planet]
+        assert data["longitude"] == pytest.approx(exact[i, 0])
+        assert data["speed"] == pytest.approx(exact[i, 1])
+        assert data["sign"] == charts.SIGNS[int(exact[i, 0] / 30)]
+        assert data["retrograde"] == (exact[i, 1] < 0)
+
+def test_rejects_bad_ranges():
+    params = {"start": "1990-01-02T00:00:00", "end": "1990-01-01T00:00:00"}
+    assert client.get("/ephemeris", params=params).status_code == 400
+    params = {"start": "1900-01-01T00:00:00", "end": "2100-01-01T00:00:00", "step_hours": 0.1}
+    assert client.get("/ephemeris", params=params).status_code == 413
+    params = {"start": "1990-01-01T00:00:00", "end": "1990-01-02T00:00:00", "step_hours": 0}
+    assert client.get("/ephemeris", params=params).status_code == 422
+
+def test_other_threads_use_swiss_ephemeris():
+    """Positions computed off the main thread still come from the data files."""
+    flags = []
+
+    def run():
+        charts.ensure_ephemeris_path()
+        flags.append(swisseph.calc_ut(julian_day(datetime(1990, 1, 1, tzinfo=timezone.utc)), 0)[1])
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    assert flags[0] & swisseph.FLG_SWIEPH
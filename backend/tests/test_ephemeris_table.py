@@ -0,0 +1,77 @@
+"""Tests for the precomputed ephemeris table."""
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+
+from app import charts, ephemeris_table
+
+
+@pytest.fixture
+def table(tmp_path):
+    path = str(tmp_path / "ephemeris.npy")
+    ephemeris_table.build(
+        path,
+        datetime(1990, 1, 1, tzinfo=timezone.utc),
+        datetime(1990, 2, 1, tzinfo=timezone.utc)
+    )
+    return ephemeris_table.EphemerisTable.load(path)
+
+@pytest.fixture
+def use_table(table):
+    charts.use_ephemeris_table(table)
+    yield table
+    charts.use_ephemeris_table(None)
+
+
+def test_table_is_memory_mapped(table):
+    """Loaded tables map the file instead of copying it."""
+    assert table.data.base is not None
+    assert not table.data.flags.writeable
+    assert table.max_error < ephemeris_table.DEFAULT_TOLERANCE
+
+def test_lookup_matches_swisseph(table):
+    """Interpolated positions stay within the measured error."""
+    jd = ephemeris_table.julian_day(datetime(1990, 1, 15, 7, 23, tzinfo=timezone.utc))
+    lons, speeds = table.lookup(jd)
+    exact = ephemeris_table.sample(jd)
+    diff = abs(np.array(lons) - exact[:, 0])
+    assert max(min(d, 360 - d) for d in diff) <= ephemeris_table.DEFAULT_TOLERANCE
+    assert speeds == pytest.approx(exact[:, 1], abs=1e-3)
+
+def test_compute_chart_uses_table(use_table, monkeypatch):
+    """Covered dates skip flatlib and agree with it within tolerance."""
+    utc_dt = datetime(1990, 1, 10, 17, 0, tzinfo=timezone.utc)
+    charts.use_ephemeris_table(None)
+    exact = charts.compute_chart(utc_dt, 40.7128, -74.0060)
+    charts.use_ephemeris_table(use_table)
+
+    def fail(*args):
+        raise AssertionError("flatlib chart should not be built")
+
+    monkeypatch.setattr(charts, "build_chart", fail)
+    fast = charts.compute_chart(utc_dt, 40.7128, -74.0060)
+    for i in range(charts.POSITIONS_SIZE):
+        assert fast[i] == pytest.approx(exact[i], abs=ephemeris_table.DEFAULT_TOLERANCE)
+
+def test_uncovered_dates_fall_back(use_table):
+    """Dates outside the table are computed by swisseph as before."""
+    utc_dt = datetime(2000, 6, 1, 12, 0, tzinfo=timezone.utc)
+    charts.use_ephemeris_table(None)
+    exact = charts.compute_chart(utc_dt, 0, 0)
+    charts.use_ephemeris_table(use_table)
+    assert charts.compute_chart(utc_dt, 0, 0) == exact
+
+def test_lookup_stays_below_360_at_the_wrap():
+    """A result a hair below 0° Aries is 0.0, not 360.0 after rounding."""
+    rows = np.zeros((2, len(ephemeris_table.TABLE_BODIES), 2))
+    rows[1, :, 1] = 1e-3  # Slightly negative just after the first sample
+    table = ephemeris_table.EphemerisTable(rows, start_jd=0.0, step=1.0, max_error=0.0)
+    lons, _ = table.lookup(1e-6)
+    assert all(0.0 <= lon < 360.0 for lon in lons)
+    assert charts._sign(lons[0]) == "Aries"
+
+def test_inaccurate_table_is_ignored_with_a_warning(table, tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv("EPHEMERIS_TABLE", str(tmp_path / "ephemeris.npy"))
+    monkeypatch.setenv("EPHEMERIS_TOLERANCE", "0")
+    assert ephemeris_table.load_from_env() is None
+    assert "exceeds EPHEMERIS_TOLERANCE" in caplog.text
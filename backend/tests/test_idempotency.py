@@ -0,0 +1,144 @@
+"""Tests for Idempotency-Key handling on purchase and premium unlock."""
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+
+from app import main
+from app.idempotency import IdempotencyCache
+
+client = TestClient(main.app)
+
+CHART = {
+    "birth_date": "1992-03-04",
+    "birth_time": "06:45",
+    "latitude": 48.8566,
+    "longitude": 2.3522,
+    "timezone": "Europe/Paris"
+}
+
+
+def _user(balance):
+    user_id = client.post("/users", json={"username": f"idem_{uuid.uuid4().hex[:8]}"}).json()["id"]
+    client.post(f"/users/{user_id}/balance/add", params={"amount": balance, "source": "test"})
+    return user_id
+
+def _balance(user_id):
+    return client.get(f"/users/{user_id}").json()["balance"]
+
+def _count_engine_runs(monkeypatch, delay=0.0):
+    # Drop interpretations precomputed for the new charts, so unlocks compute
+    main.interpretation_cache.clear()
+    runs = []
+    original = main.chart_engine.run
+
+    async def counting_run(fn, *args):
+        runs.append(fn.__name__)
+        await asyncio.sleep(delay)
+        return await original(fn, *args)
+
+    monkeypatch.setattr(main.chart_engine, "run", counting_run)
+    return runs
+
+
+def test_retried_purchase_charges_once():
+    main.db["products"].setdefault("1", {
+        "id": "1", "name": "Deck", "description": "", "price": 99, "image": ""
+    })
+    user_id = _user(500)
+    body = {"user_id": user_id, "product_id": "1"}
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    first = client.post("/products/1/purchase", json=body, headers=headers)
+    retry = client.post("/products/1/purchase", json=body, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert _balance(user_id) == 401
+
+    # Without a key a second purchase is a new request (and fails: already owned)
+    assert client.post("/products/1/purchase", json=body).status_code == 400
+
+def test_retried_unlock_skips_interpretation(monkeypatch):
+    user_id = _user(5000)
+    chart_id = client.post("/charts/create", json=CHART).json()["id"]
+    runs = _count_engine_runs(monkeypatch)
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    first = client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id}, headers=headers)
+    retry = client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id}, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert runs == ["interpret_chart"]
+    assert _balance(user_id) == 3000
+
+def test_concurrent_duplicates_wait_for_the_first(monkeypatch):
+    user_id = _user(5000)
+    chart_id = client.post("/charts/create", json=CHART).json()["id"]
+    runs = _count_engine_runs(monkeypatch, delay=0.2)
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    waits = main.idempotency_cache.waits
+
+    def unlock(_):
+        return client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id}, headers=headers)
+
+    with ThreadPoolExecutor(4) as pool:
+        responses = list(pool.map(unlock, range(4)))
+    assert [r.status_code for r in responses] == [200] * 4
+    assert len({r.text for r in responses}) == 1
+    assert runs == ["interpret_chart"]
+    assert main.idempotency_cache.waits > waits
+    assert _balance(user_id) == 3000
+
+def test_key_reuse_and_kept_errors():
+    user_id = _user(100)
+    chart_id = client.post("/charts/create", json=CHART).json()["id"]
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    first = client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id}, headers=headers)
+    assert first.status_code == 402
+    # A 4xx outcome is kept too: the retry does not run the handler again
+    client.post(f"/users/{user_id}/balance/add", params={"amount": 5000, "source": "test"})
+    retry = client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id}, headers=headers)
+    assert retry.status_code == 402 and retry.headers["Idempotent-Replayed"] == "true"
+
+    # Same key, different request
+    other_chart = client.post("/charts/create", json=CHART).json()["id"]
+    reused = client.post(f"/charts/{other_chart}/unlock-premium", json={"user_id": user_id}, headers=headers)
+    assert reused.status_code == 422
+    too_long = client.post(
+        f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id},
+        headers={"Idempotency-Key": "k" * 256}
+    )
+    assert too_long.status_code == 400
+
+def test_keys_are_scoped_to_the_user():
+    chart_id = client.post("/charts/create", json=CHART).json()["id"]
+    users = [_user(5000), _user(5000)]
+    headers = {"Idempotency-Key": "same-key-for-everyone"}
+
+    for user_id in users:
+        unlock = client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id}, headers=headers)
+        assert unlock.status_code == 200
+        assert "Idempotent-Replayed" not in unlock.headers
+        assert _balance(user_id) == 3000
+
+def test_cache_is_bounded_and_expires():
+    cache = IdempotencyCache(max_entries=2)
+
+    async def handler():
+        return {"ok": True}
+
+    async def run(key):
+        return await cache.run("u1", key, "fp", handler)
+
+    for key in ("a", "b", "c"):
+        assert asyncio.run(run(key)) == ({"ok": True}, False)
+    assert cache.stats()["evictions"] == 1
+    assert asyncio.run(run("c"))[1] is True
+    assert asyncio.run(run("a"))[1] is False
+
+    expiring = IdempotencyCache(ttl=0)
+    asyncio.run(expiring.run("u1", "a", "fp", handler))
+    assert asyncio.run(expiring.run("u1", "a", "fp", handler))[1] is False
@@ -8,6 +8,7 @@ from flatlib.geopos import GeoPos
 from flatlib.chart import Chart
 
 from app.main import app, db
+from app.revenue import RevenueRollup
 
 client = TestClient(app)
 
@@ -16,10 +17,15 @@ def setup_test_db():
     """Setup test database before each test."""
     # Initialize collections
     db["users"] = {}
+    db["users_by_username"] = {}
     db["products"] = {}
     db["transactions"] = []
+    db["transactions_by_user"] = {}
     db["revenue"] = []
+    db["revenue_rollup"] = RevenueRollup()
     db["charts"] = {}
+    db["readings"] = {}
+    db["readings_by_user"] = {}
     
     yield
     
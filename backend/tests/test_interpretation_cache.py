@@ -0,0 +1,74 @@
+"""Tests for the shared premium interpretation cache."""
+import uuid
+from fastapi.testclient import TestClient
+
+from app import main
+from app.charts import premium_fingerprint
+
+client = TestClient(main.app)
+
+# Same UTC instant in two cities: same planets, different houses
+PARIS = {
+    "birth_date": "1988-11-02",
+    "birth_time": "14:20",
+    "latitude": 48.8566,
+    "longitude": 2.3522,
+    "timezone": "Europe/Paris"
+}
+TOKYO = dict(PARIS, birth_time="22:20", latitude=35.6762, longitude=139.6503, timezone="Asia/Tokyo")
+
+
+def _rich_user():
+    user_id = client.post("/users", json={"username": f"interp_{uuid.uuid4().hex[:8]}"}).json()["id"]
+    client.post(f"/users/{user_id}/balance/add", params={"amount": 5000, "source": "test"})
+    return user_id
+
+def _fail_engine(monkeypatch):
+    async def fail(*args):
+        raise AssertionError("chart engine should not be called")
+    monkeypatch.setattr(main.chart_engine, "run", fail)
+    monkeypatch.setattr(main.chart_engine, "map", fail)
+
+
+def test_fingerprint_covers_planets_only():
+    paris = main.db["charts"][client.post("/charts/create", json=PARIS).json()["id"]]
+    tokyo = main.db["charts"][client.post("/charts/create", json=TOKYO).json()["id"]]
+    later = main.db["charts"][client.post("/charts/create", json=dict(PARIS, birth_time="14:21")).json()["id"]]
+    assert paris.positions != tokyo.positions
+    assert premium_fingerprint(paris.positions) == premium_fingerprint(tokyo.positions)
+    assert premium_fingerprint(paris.positions) != premium_fingerprint(later.positions)
+
+def test_new_charts_are_precomputed(monkeypatch):
+    main.interpretation_cache.clear()
+    user_id = _rich_user()
+    chart_id = client.post("/charts/create", json=PARIS).json()["id"]
+    assert ("en", premium_fingerprint(main.db["charts"][chart_id].positions)) in main.interpretation_cache
+
+    _fail_engine(monkeypatch)
+    response = client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id})
+    assert response.status_code == 200
+    assert response.json()["premium_interpretation"].startswith("Sun in ")
+
+def test_charts_with_same_planets_share_one_result(monkeypatch):
+    user_id = _rich_user()
+    paris_id = client.post("/charts/create", json=PARIS).json()["id"]
+    tokyo_id = client.post("/charts/create", json=TOKYO).json()["id"]
+    main.interpretation_cache.clear()
+    runs = []
+    original = main.chart_engine.run
+
+    async def counting_run(fn, *args):
+        runs.append(fn.__name__)
+        return await original(fn, *args)
+
+    monkeypatch.setattr(main.chart_engine, "run", counting_run)
+    hits = main.interpretation_cache.hits
+    paris = client.post(f"/charts/{paris_id}/unlock-premium", json={"user_id": user_id}).json()
+    tokyo = client.post(f"/charts/{tokyo_id}/unlock-premium", json={"user_id": user_id}).json()
+    assert runs == ["interpret_chart"]
+    assert main.interpretation_cache.hits == hits + 1
+    assert paris["premium_interpretation"] == tokyo["premium_interpretation"]
+    assert paris["basic_interpretation"] != tokyo["basic_interpretation"]  # Ascendants differ
+
+    stats = client.get("/charts/interpretation-cache/stats").json()
+    assert stats["size"] == 1 and stats["hits"] >= 1
@@ -0,0 +1,78 @@
+"""Tests for the precompiled bilingual interpretation catalog."""
+from array import array
+import random
+import uuid
+from fastapi.testclient import TestClient
+
+from app import main
+from app.chart_cache import interpretation_cache
+from app.aspects import find_aspects
+from app.charts import (
+    CLASSICAL_PLANETS, POS_ASC, POS_LON, POS_SPEED, POSITIONS_SIZE, SIGNS, interpret_chart, premium_fingerprint
+)
+
+client = TestClient(main.app)
+
+CHART = {
+    "birth_date": "1990-06-15",
+    "birth_time": "08:30",
+    "latitude": 31.2304,
+    "longitude": 121.4737,
+    "timezone": "Asia/Shanghai"
+}
+
+
+def _user():
+    user_id = client.post("/users", json={"username": f"lang_{uuid.uuid4().hex[:8]}"}).json()["id"]
+    client.post(f"/users/{user_id}/balance/add", params={"amount": 5000, "source": "test"})
+    return user_id
+
+def test_english_matches_former_fstrings():
+    rng = random.Random(7)
+    for n in range(500):
+        positions = array("d", (rng.uniform(0, 360) for _ in range(POSITIONS_SIZE)))
+        if n < 360:
+            positions[POS_LON] = n + 0.95  # Rounds up to 30.0° within the sign
+        text = interpret_chart(positions, True)
+        lons = positions[POS_LON:POS_SPEED]
+        placements = [
+            f"{body} in {SIGNS[int(lon / 30)]} ({lon % 30:.1f}°)" for body, lon in zip(CLASSICAL_PLANETS, lons)
+        ]
+        aspects = [
+            f"{a.body1}-{a.body2}: {a.aspect} ({a.orb:.1f}°)"
+            for a in find_aspects(dict(zip(CLASSICAL_PLANETS, lons)))
+        ]
+        asc = positions[POS_ASC]
+        assert text["basic"] == "\n".join(
+            placements[:2] + [f"Ascendant in {SIGNS[int(asc / 30)]} ({asc % 30:.1f}°)"]
+        )
+        assert text["premium"] == "\n".join(placements + aspects)
+
+def test_chart_in_user_language():
+    english = client.post("/charts/create", json=CHART).json()
+    chinese = client.post("/charts/create", json=dict(CHART, language="zh")).json()
+    assert english["basic_interpretation"].startswith("Sun in Gemini (")
+    assert chinese["basic_interpretation"].startswith("太阳落在双子座（")
+    assert chinese["basic_interpretation"].count("\n") == 2
+    assert client.post("/charts/create", json=dict(CHART, language="fr")).status_code == 422
+
+    # The premium text is precomputed in the chart's language and unlocked
+    # in the paying user's
+    key = ("zh", premium_fingerprint(main.db["charts"][chinese["id"]].positions))
+    assert key in interpretation_cache
+    user_id = _user()
+    assert client.put(f"/users/{user_id}/language", params={"language": "zh"}).status_code == 200
+    unlocked = client.post(f"/charts/{chinese['id']}/unlock-premium", json={"user_id": user_id}).json()
+    assert unlocked["basic_interpretation"] == chinese["basic_interpretation"]
+    premium = unlocked["premium_interpretation"].split("\n")
+    assert premium[0].startswith("太阳落在双子座（") and premium[6].startswith("土星")
+    assert all(line.endswith("°）") for line in premium)
+    assert unlocked["premium_interpretation"] == interpretation_cache.get(key)
+
+def test_unlock_in_the_paying_users_language():
+    chinese = client.post("/charts/create", json=dict(CHART, language="zh")).json()
+    unlocked = client.post(f"/charts/{chinese['id']}/unlock-premium", json={"user_id": _user()}).json()
+    assert unlocked["basic_interpretation"].startswith("Sun in Gemini (")
+    assert unlocked["premium_interpretation"].startswith("Sun in Gemini (")
+    stored = client.get(f"/charts/{chinese['id']}", params={"language": "en"}).json()
+    assert stored["premium_interpretation"] == unlocked["premium_interpretation"]
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+import asyncio
+import os
+import uuid
+from fastapi.testclient import TestClient
+
+from app import main
+from app.revenue import DAY
+from app.storage import MemoryStorage
+from app.storage.ledger import encode_frame
+
+START = datetime(2024, 5, 1, 9, 30)
+
+
+async def _top_up(storage, user_id, i):
+    async with storage.update_user(user_id) as update:
+        update.user["balance"] += 10
+        update.add_transaction({
+            "id": f"t{i}", "user_id": user_id, "amount": 10, "type": "ad",
+            "description": "Added 10 coins from ad", "created_at": START + timedelta(minutes=i)
+        })
+        update.add_revenue({
+            "id": f"rev{i}", "source": "ad", "amount": 0.01, "created_at": START + timedelta(minutes=i)
+        })
+
+async def _fill(storage, n):
+    """A user with ``n`` concurrent top-ups and one reading; returns the user id."""
+    user_id = (await storage.create_user("Ledger_User"))["id"]
+    await asyncio.gather(*(_top_up(storage, user_id, i) for i in range(n)))
+    await storage.add_reading({
+        "id": "r1", "user_id": user_id, "spread_type": "three", "cards": [], "created_at": START
+    })
+    return user_id
+
+async def _state(storage, user_id):
+    user = await storage.get_user_by_username("ledger_user")
+    page = await storage.transactions_page(user_id)
+    readings = await storage.readings_page(user_id)
+    total, _ = await storage.revenue_summary(None, None, DAY)
+    return user, [t["id"] for t in page.values], [r["id"] for r in readings.values], total.count
+
+def _restart(directory, **kwargs):
+    storage = MemoryStorage(ledger_dir=directory, **kwargs)
+    asyncio.run(storage.open())
+    return storage
+
+
+def test_replay_after_crash(tmp_path):
+    directory = str(tmp_path)
+
+    async def before_crash():
+        storage = MemoryStorage(ledger_dir=directory)
+        await storage.open()
+        user_id = await _fill(storage, 50)
+        # Group commit: 50 concurrent top-ups share far fewer fsyncs
+        assert storage.ledger.fsyncs < 50
+        return user_id, await _state(storage, user_id)
+
+    # No close(): the process dies with only the log on disk
+    user_id, expected = asyncio.run(before_crash())
+    assert not [name for name in os.listdir(directory) if name.startswith("snapshot")]
+
+    storage = _restart(directory)
+    assert asyncio.run(_state(storage, user_id)) == expected
+    assert expected[0]["balance"] == 500 and expected[3] == 50
+
+def test_snapshot_and_tail(tmp_path):
+    directory = str(tmp_path)
+
+    async def run():
+        storage = MemoryStorage(ledger_dir=directory, snapshot_rows=40)
+        await storage.open()
+        user_id = await _fill(storage, 30)  # 30 * 3 records: a snapshot on the way
+        storage._snapshot_thread.join()
+        return user_id, await _state(storage, user_id)
+
+    user_id, expected = asyncio.run(run())
+    names = sorted(os.listdir(directory))
+    snapshots = [name for name in names if name.startswith("snapshot")]
+    assert len(snapshots) == 1
+    # Segments older than the snapshot are gone
+    assert all(name >= snapshots[0].replace("snapshot", "ledger").replace(".pickle", ".log")
+               for name in names if name.startswith("ledger"))
+
+    storage = _restart(directory)
+    assert asyncio.run(_state(storage, user_id)) == expected
+
+    # A clean shutdown leaves a snapshot with nothing left to replay
+    asyncio.run(storage.close())
+    storage = _restart(directory)
+    assert storage._logged == 0
+    assert asyncio.run(_state(storage, user_id)) == expected
+
+def test_torn_tail_is_dropped(tmp_path):
+    directory = str(tmp_path)
+
+    async def run():
+        storage = MemoryStorage(ledger_dir=directory)
+        await storage.open()
+        return await storage.create_user("Ledger_User")
+
+    user = asyncio.run(run())
+    segment = os.path.join(directory, f"ledger-{0:08d}.log")
+    size = os.path.getsize(segment)
+    with open(segment, "ab") as f:
+        f.write(encode_frame([("user", {**user, "balance": 99})])[:-3])
+
+    storage = _restart(directory)
+    assert asyncio.run(storage.get_user(user["id"])) == user
+    assert os.path.getsize(segment) == size
+
+def test_unlock_leaves_snapshotted_charts_alone():
+    client = TestClient(main.app)
+    chart_id = client.post("/charts/create", json={
+        "birth_date": "1985-11-20", "birth_time": "14:10", "latitude": 40.4168,
+        "longitude": -3.7038, "timezone": "Europe/Madrid"
+    }).json()["id"]
+    user_id = client.post("/users", json={"username": f"ledger_{uuid.uuid4().hex[:8]}"}).json()["id"]
+    client.post(f"/users/{user_id}/balance/add", params={"amount": 5000, "source": "test"})
+    stored = main.db["charts"][chart_id]
+    snapshot = dict(main.storage._snapshot_state()["charts"].items())
+
+    assert client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id}).status_code == 200
+    assert snapshot[chart_id] is stored
+    assert not stored.is_premium_unlocked and stored.premium_interpretation is None
+    assert main.db["charts"][chart_id].is_premium_unlocked
@@ -0,0 +1,22 @@
+"""Smoke test of the load benchmark's endpoint mix against the app in-process."""
+import asyncio
+import httpx
+
+from app import main
+from benchmarks.bench_load import OPERATIONS, run_load
+
+
+def test_mix_runs_every_operation_without_errors():
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load") as client:
+            # Weights that reach every operation, unlocks included, in a short run
+            mix = {name: 1 for name in OPERATIONS}
+            return await run_load(client, concurrency=4, duration=1.5, mix=mix, seed=1)
+
+    results = asyncio.run(run())
+    for name, row in results["endpoints"].items():
+        assert row["requests"] > 0, name
+        assert row["errors"] == 0, (name, row["statuses"])
+        assert row["p50_ms"] <= row["p95_ms"] <= row["p99_ms"] <= row["max_ms"]
+    assert results["total"]["requests"] == sum(row["requests"] for row in results["endpoints"].values())
@@ -0,0 +1,39 @@
+"""Tests for the striped per-key locks that serialize user updates."""
+import asyncio
+
+from app.locks import StripedLock
+
+
+def test_same_key_serializes_other_keys_do_not():
+    locks = StripedLock(64)
+    events = []
+
+    async def hold(key, tag):
+        async with locks.lock(key):
+            events.append(f"{tag} in")
+            await asyncio.sleep(0.01)
+            events.append(f"{tag} out")
+
+    async def main():
+        other = next(key for key in (f"user{n}" for n in range(1000))
+                     if locks.stripe(key) != locks.stripe("user_a"))
+        await asyncio.gather(hold("user_a", "a1"), hold("user_a", "a2"), hold(other, "b"))
+
+    asyncio.run(main())
+    assert events.index("a1 out") < events.index("a2 in")
+    assert events.index("b in") < events.index("a1 out")
+    assert locks.acquired == 3 and locks.contended == 1
+
+def test_stripes_work_from_a_new_event_loop():
+    locks = StripedLock(1)
+
+    async def contend():
+        async def hold():
+            async with locks.lock("user"):
+                await asyncio.sleep(0)
+        await asyncio.gather(hold(), hold())
+
+    # A lock that waited on one loop is unusable from another; each loop gets its own
+    asyncio.run(contend())
+    asyncio.run(contend())
+    assert locks.contended == 2
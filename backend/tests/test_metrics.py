@@ -0,0 +1,72 @@
+"""Tests for the Prometheus /metrics endpoint."""
+import re
+from fastapi.testclient import TestClient
+
+from app import main
+from app.metrics import Gauge, Metrics
+
+client = TestClient(main.app)
+
+CHART = {
+    "birth_date": "1979-09-09",
+    "birth_time": "09:09",
+    "latitude": 52.52,
+    "longitude": 13.405,
+    "timezone": "Europe/Berlin"
+}
+
+
+def _scrape():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+def _value(samples, name):
+    return samples.get(name, 0.0)
+
+
+def test_requests_are_counted_by_route():
+    chart_id = client.post("/charts/create", json=CHART).json()["id"]
+    before = _scrape()
+    client.get(f"/charts/{chart_id}")
+    client.get("/charts/missing")
+    client.post("/charts/create", json=CHART)
+    after = _scrape()
+
+    def delta(name):
+        return _value(after, name) - _value(before, name)
+
+    route = 'method="GET",route="/charts/{chart_id}"'
+    assert delta(f'http_responses_total{{{route},status="200"}}') == 1
+    assert delta(f'http_responses_total{{{route},status="404"}}') == 1
+    assert delta(f"http_request_duration_seconds_count{{{route}}}") == 2
+    # Buckets are cumulative and end at the total count
+    prefix = f"http_request_duration_seconds_bucket{{{route},"
+    buckets = [value for name, value in after.items() if name.startswith(prefix)]
+    assert buckets == sorted(buckets) and buckets[-1] == after[f"http_request_duration_seconds_count{{{route}}}"]
+    # The scrape itself is in flight while it renders
+    assert after["http_requests_in_flight"] >= 1
+
+    assert any(name.startswith('chart_engine_calls_total{fn="compute_chart"') for name in after)
+    # The basic interpretation of every chart response runs inline
+    assert delta('chart_inline_duration_seconds_count{fn="interpret_chart"}') == 2
+    assert after['db_rows{table="charts"}'] == len(main.db["charts"])
+    assert 'cache_hits{cache="chart"}' in after
+
+def test_render_format():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.observe_request("GET", '/a"b', 200, 0.05)
+    metrics.observe_request("GET", '/a"b', 200, 5.0)
+    metrics.observe_job("compute_chart", None, 3, "rejected")
+    text = metrics.render([Gauge("db_rows", "Rows", [({"table": "users"}, 7)])])
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/a\\"b",le="0.1"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/a\\"b",le="+Inf"} 2' in text
+    assert 'chart_engine_calls_total{fn="compute_chart",outcome="rejected"} 3' in text
+    assert "chart_engine_job_duration_seconds_count" not in text
+    assert re.search(r"^# TYPE db_rows gauge\ndb_rows\{table=\"users\"\} 7$", text, re.M)
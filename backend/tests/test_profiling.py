@@ -0,0 +1,142 @@
+"""Tests for opt-in request profiling and the /debug/profiles endpoints."""
+import pstats
+import re
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.profiling import Profiler, profiler
+
+client = TestClient(main.app)
+
+TOKEN = "s3cret"
+AUTH = {"X-Profile-Token": TOKEN}
+
+CHART = {
+    "birth_date": "1979-09-09",
+    "birth_time": "09:09",
+    "latitude": 52.52,
+    "longitude": 13.405,
+    "timezone": "Europe/Berlin"
+}
+
+
+@pytest.fixture
+def profiling(monkeypatch):
+    """The app's profiler with a token set; profiles are dropped afterwards."""
+    monkeypatch.setattr(profiler, "token", TOKEN)
+    monkeypatch.setattr(profiler, "sample_rate", 0.0)
+    monkeypatch.setattr(profiler, "mode", "cprofile")
+    profiler.clear()
+    yield profiler
+    profiler.clear()
+
+
+def _profiles(route=None):
+    params = {"route": route} if route else {}
+    response = client.get("/debug/profiles", params=params, headers=AUTH)
+    assert response.status_code == 200
+    return response.json()["profiles"]
+
+
+def test_endpoints_need_a_configured_token(monkeypatch):
+    monkeypatch.setattr(profiler, "token", None)
+    assert client.get("/debug/profiles", headers=AUTH).status_code == 404
+
+def test_wrong_token_is_rejected(profiling):
+    assert client.get("/debug/profiles").status_code == 403
+    assert client.get("/debug/profiles", headers={"X-Profile-Token": "nope"}).status_code == 403
+
+def test_only_marked_requests_are_profiled(profiling):
+    client.post("/charts/create", json=CHART)
+    client.post("/charts/create", json=CHART, headers={"X-Profile-Token": "nope"})
+    assert _profiles() == []
+
+    response = client.post("/charts/create", json=CHART, headers=AUTH)
+    assert response.status_code == 200
+    profile, = _profiles("/charts/create")
+    assert profile["method"] == "POST"
+    assert profile["status"] == 200
+    assert profile["mode"] == "cprofile"
+    assert profile["duration_ms"] > 0
+
+def test_cprofile_text_and_pstats_download(profiling, tmp_path):
+    client.post("/charts/create", json=CHART, headers=AUTH)
+    profile_id = _profiles()[0]["id"]
+
+    text = client.get(f"/debug/profiles/{profile_id}", headers=AUTH)
+    assert text.status_code == 200
+    assert "create_chart" in text.text
+
+    download = client.get(f"/debug/profiles/{profile_id}", params={"format": "pstats"}, headers=AUTH)
+    assert download.status_code == 200
+    assert download.headers["content-disposition"] == f'attachment; filename="profile-{profile_id}.prof"'
+    path = tmp_path / "profile.prof"
+    path.write_bytes(download.content)
+    functions = {name for _, _, name in pstats.Stats(str(path)).stats}
+    assert "create_chart" in functions
+
+    collapsed = client.get(f"/debug/profiles/{profile_id}", params={"format": "collapsed"}, headers=AUTH)
+    assert collapsed.status_code == 400
+    assert client.get("/debug/profiles/999999", headers=AUTH).status_code == 404
+
+def test_sample_mode_collapsed_stacks(profiling, monkeypatch):
+    monkeypatch.setattr(profiler, "mode", "sample")
+    monkeypatch.setattr(profiler, "sample_interval", 0.0005)
+    client.post("/charts/create", json=CHART, headers=AUTH)
+    profile = _profiles()[0]
+    assert profile["mode"] == "sample"
+
+    response = client.get(f"/debug/profiles/{profile['id']}", params={"format": "collapsed"}, headers=AUTH)
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == profile["samples"]
+    assert all(re.fullmatch(r"\S+(;\S+)* \d+", line) for line in lines)
+
+def test_sampled_requests_fill_a_bounded_ring_per_route(profiling, monkeypatch):
+    monkeypatch.setattr(profiler, "sample_rate", 1.0)
+    monkeypatch.setattr(profiler, "ring_size", 2)
+    chart_id = client.post("/charts/create", json=CHART).json()["id"]
+    for _ in range(3):
+        client.get(f"/charts/{chart_id}")
+
+    kept = _profiles("/charts/{chart_id}")
+    assert len(kept) == 2
+    assert kept[0]["id"] > kept[1]["id"]
+    assert len(_profiles("/charts/create")) == 1
+    # The profile endpoints themselves are never profiled
+    assert all(not p["route"].startswith("/debug/") for p in _profiles())
+
+
+def test_one_profile_at_a_time():
+    registry = Profiler(token=TOKEN)
+    capture = registry.begin("GET", "/")
+    assert registry.begin("GET", "/") is None
+    assert registry.skipped == 1
+    capture.finish("/", 200)
+    assert registry.begin("GET", "/") is not None
+
+def test_disabled_profiler_selects_nothing():
+    registry = Profiler()
+    assert not registry.enabled
+    assert not registry.selects(None)
+    assert not registry.selects(TOKEN)
+    with pytest.raises(ValueError):
+        Profiler(mode="perf")
+
+def test_sampling_needs_a_token(monkeypatch, caplog):
+    registry = Profiler(sample_rate=1.0)
+    assert not registry.enabled
+    assert not registry.selects(None)
+
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", "0.5")
+    monkeypatch.delenv("PROFILE_TOKEN", raising=False)
+    with caplog.at_level("WARNING", logger="app.profiling"):
+        assert not Profiler.from_env().enabled
+    assert "PROFILE_TOKEN" in caplog.text
+
+    caplog.clear()
+    monkeypatch.setenv("PROFILE_TOKEN", TOKEN)
+    with caplog.at_level("WARNING", logger="app.profiling"):
+        assert Profiler.from_env().enabled
+    assert caplog.text == ""
@@ -0,0 +1,58 @@
+"""Tests for pre-serialized, ETag-cached responses."""
+import asyncio
+import uuid
+from fastapi.testclient import TestClient
+
+from app import main
+from app.response_cache import ResponseCache, etag_matches
+
+client = TestClient(main.app)
+
+
+def test_products_are_served_from_cache(monkeypatch):
+    first = client.get("/products")
+    assert first.status_code == 200 and first.headers["ETag"]
+
+    async def fail():
+        raise AssertionError("products should be served from the cache")
+    monkeypatch.setattr(main.storage, "list_products", fail)
+    assert client.get("/products").content == first.content
+    not_modified = client.get("/products", headers={"If-None-Match": first.headers["ETag"]})
+    assert not_modified.status_code == 304 and not_modified.content == b""
+    assert not_modified.headers["ETag"] == first.headers["ETag"]
+
+def test_saving_a_product_invalidates():
+    before = client.get("/products")
+    product_id = f"p_{uuid.uuid4().hex[:8]}"
+    asyncio.run(main.storage.save_product({
+        "id": product_id, "name": "Moon Deck", "description": "", "price": 150, "image": "🌙"
+    }))
+    after = client.get("/products", headers={"If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200 and after.headers["ETag"] != before.headers["ETag"]
+    assert {"id": product_id, "name": "Moon Deck", "description": "", "price": 150.0, "image": "🌙"} in after.json()
+    del main.db["products"][product_id]
+
+def test_level_follows_experience():
+    user_id = client.post("/users", json={"username": f"level_{uuid.uuid4().hex[:8]}"}).json()["id"]
+    level = client.get(f"/users/{user_id}/level")
+    assert level.json() == {"experience": 0, "level_info": main.calculate_level(0)}
+    etag = level.headers["ETag"]
+    assert client.get(f"/users/{user_id}/level", headers={"If-None-Match": f'W/{etag}'}).status_code == 304
+
+    client.post(f"/users/{user_id}/experience", params={"xp_amount": 600})
+    level = client.get(f"/users/{user_id}/level", headers={"If-None-Match": etag})
+    assert level.status_code == 200 and level.json()["level_info"]["level"] == 2
+    assert client.get("/users/missing/level").status_code == 404
+
+def test_cache_versions_and_matching():
+    cache = ResponseCache(max_entries=1)
+    entry = cache.put("a", 1, {"x": "塔罗"})
+    assert entry.body == '{"x":"塔罗"}'.encode()
+    assert cache.lookup("a", 1) is entry
+    assert cache.lookup("a", 2) is None and cache.invalidations == 1
+    cache.put("b", 1, [])
+    assert cache.lookup("a", 1) is None and cache.evictions == 1
+
+    assert etag_matches(f'"x", {entry.etag}', entry.etag)
+    assert etag_matches("*", entry.etag)
+    assert not etag_matches('"x"', entry.etag)
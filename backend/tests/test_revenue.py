@@ -0,0 +1,87 @@
+"""Tests for the incremental revenue rollups."""
+from datetime import datetime, timedelta
+import random
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app, db
+from app.revenue import DAY, HOUR, RevenueRollup
+
+client = TestClient(app)
+
+START = datetime(2024, 3, 1)
+
+
+def _rows(n, seed=3):
+    rng = random.Random(seed)
+    rows = [
+        {
+            "id": str(i),
+            "source": rng.choice(["ad", "payment", "purchase"]),
+            "amount": rng.choice([0.01, 4.9, 10.0, 20.0]),
+            "created_at": START + timedelta(seconds=rng.randrange(10 * 86400))
+        }
+        for i in range(n)
+    ]
+    # Mostly in time order, with a few stragglers
+    rows.sort(key=lambda row: row["created_at"])
+    rows[10], rows[-10] = rows[-10], rows[10]
+    return rows
+
+def _scan(rows, start, end):
+    selected = [
+        r for r in rows
+        if (start is None or r["created_at"] >= start) and (end is None or r["created_at"] <= end)
+    ]
+    return {
+        source: sum(r["amount"] for r in selected if r["source"] == source)
+        for source in ("ad", "payment", "purchase")
+    }, len(selected)
+
+
+def test_ranges_match_a_full_scan():
+    rows = _rows(3000)
+    rollup = RevenueRollup(rows)
+    rng = random.Random(5)
+    bounds = [None, START + DAY, START + 3 * DAY + 2 * HOUR]  # bucket-aligned
+    bounds += [START + timedelta(seconds=rng.randrange(10 * 86400)) for _ in range(20)]
+    for _ in range(200):
+        start, end = rng.choice(bounds), rng.choice(bounds)
+        amounts, count = _scan(rows, start, end)
+        total = rollup.total(start, end)
+        assert total.count == count
+        for source, amount in amounts.items():
+            assert total.amount(source) == pytest.approx(amount)
+
+def test_buckets_partition_the_range():
+    rows = _rows(2000)
+    rollup = RevenueRollup(rows)
+    start = START + timedelta(days=2, hours=5, minutes=17)
+    end = START + timedelta(days=6, hours=1, minutes=3)
+    for unit in (HOUR, DAY):
+        buckets = list(rollup.buckets(unit, start, end))
+        keys = [key for key, _ in buckets]
+        assert keys == sorted(keys)
+        assert sum(b.count for _, b in buckets) == _scan(rows, start, end)[1]
+        for key, bucket in buckets:
+            amounts, count = _scan(rows, max(start, key), min(end, key + unit - timedelta(microseconds=1)))
+            assert bucket.count == count
+            assert bucket.amount("ad") == pytest.approx(amounts["ad"])
+
+def test_summary_endpoint_breakdown():
+    db["revenue"] = []
+    db["revenue_rollup"] = RevenueRollup()
+    user_id = client.post("/users", json={"username": "revenue_user"}).json()["id"]
+    client.post(f"/users/{user_id}/balance/add", params={"amount": 100, "source": "payment"})
+    client.post(f"/users/{user_id}/balance/add", params={"amount": 5, "source": "ad"})
+
+    summary = client.get("/revenue/summary", params={"bucket": "hour"}).json()
+    assert summary["total_revenue"] == pytest.approx(10.01)
+    assert summary["transaction_count"] == 2
+    assert len(summary["buckets"]) in (1, 2)  # the two rows may straddle an hour
+    assert sum(b["payment_revenue"] for b in summary["buckets"]) == pytest.approx(10.0)
+
+    future = (datetime.now() + timedelta(days=1)).isoformat()
+    empty = client.get("/revenue/summary", params={"start_date": future}).json()
+    assert empty["transaction_count"] == 0
+    assert empty["buckets"] == []
@@ -0,0 +1,65 @@
+"""Tests for the vectorized solar-time engine."""
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import charts, solar_time
+from app.ephemeris_table import julian_day, sample
+from app.main import app
+
+client = TestClient(app)
+
+
+def _instants(n):
+    rng = np.random.default_rng(7)
+    timestamps = rng.uniform(
+        datetime(1900, 1, 1, tzinfo=timezone.utc).timestamp(),
+        datetime(2100, 1, 1, tzinfo=timezone.utc).timestamp(),
+        n
+    )
+    return timestamps, rng.uniform(-180, 180, n)
+
+
+def test_matches_swisseph_sun():
+    """The low-precision Sun gives solar time within a second of swisseph."""
+    timestamps, longitudes = _instants(200)
+    offsets, _ = solar_time.solar_offsets(timestamps, longitudes)
+    for ts, lon, offset in zip(timestamps, longitudes, offsets):
+        jd = julian_day(datetime.fromtimestamp(ts, tz=timezone.utc))
+        expected, _ = charts.true_solar_offset(lon, sample(jd)[0, 0])
+        assert offset == pytest.approx(expected, abs=1.0)
+
+def test_day_table_close_to_exact():
+    """The day-of-year table stays within two seconds from 1900 to 2100."""
+    timestamps, longitudes = _instants(100000)
+    exact, _ = solar_time.solar_offsets(timestamps, longitudes)
+    table, _ = solar_time.solar_offsets_from_table(timestamps, longitudes)
+    assert np.max(np.abs(table - exact)) < 2.0
+
+def test_solar_time_endpoint_matches_chart():
+    """/solar-time agrees with the solar time reported for a chart."""
+    chart = client.post("/charts/create", json={
+        "birth_date": "1990-01-01",
+        "birth_time": "12:00",
+        "latitude": 40.7128,
+        "longitude": -74.0060,
+        "timezone": "America/New_York"
+    }).json()
+    for method in ("exact", "table"):
+        response = client.post("/solar-time", json={
+            "method": method,
+            "instants": [
+                {"utc_time": "1990-01-01T17:00:00Z", "longitude": -74.0060},
+                {"utc_time": "1990-07-01T00:00:00", "longitude": 120.0}
+            ]
+        })
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert len(results) == 2
+        solar = datetime.fromisoformat(results[0]["solar_time"])
+        expected = datetime.strptime(chart["solar_time"], "%H:%M:%S")
+        delta = (solar.hour * 3600 + solar.minute * 60 + solar.second) \
+            - (expected.hour * 3600 + expected.minute * 60 + expected.second)
+        assert abs(delta) <= 2
+        assert results[1]["utc_time"] == "1990-07-01T00:00:00+00:00"
@@ -0,0 +1,107 @@
+from array import array
+from datetime import datetime, timedelta
+import asyncio
+import pickle
+
+from app.records import ChartRecord
+from app.storage import MemoryStorage
+from app.storage.spill import SpillingDict
+
+START = datetime(2024, 5, 1, 9, 30)
+
+
+def _chart(i):
+    return ChartRecord(
+        id=f"c{i}", date="1990-01-01", time="12:00", latitude=1.5, longitude=-2.5,
+        house_time="standard", house_system="Placidus", positions=array("d", [float(i)] * 31)
+    )
+
+
+def test_spilling_dict_keeps_budget(tmp_path):
+    table = SpillingDict(str(tmp_path / "spill.sqlite"), budget=1000, sizeof=lambda value: 100)
+    for i in range(50):
+        table[f"k{i}"] = {"n": i}
+    stats = table.stats()
+    # Spills write out down to 90% of the budget, in batches
+    assert stats["resident_bytes"] <= 1000 and stats["resident"] + stats["spilled"] == 50
+    assert stats["spills"] == stats["spilled"] >= 40
+    assert len(table) == 50 and "k0" in table and "missing" not in table
+
+    # A spilled row faults back in and becomes the newest resident one
+    assert table["k0"] == {"n": 0}
+    assert table.faults == 1 and list(table._resident)[-1] == "k0"
+
+    table["k1"] = {"n": -1}
+    del table["k2"]
+    assert table["k1"] == {"n": -1} and "k2" not in table
+    assert table.copy() == {f"k{i}": {"n": -1 if i == 1 else i} for i in range(50) if i != 2}
+    table.close()
+
+def test_memory_storage_spills_charts_and_readings(tmp_path):
+    async def body():
+        storage = MemoryStorage(
+            ledger_dir=str(tmp_path), memory_budgets={"charts": 0.01, "readings": 0.01}
+        )
+        await storage.open()
+        user_id = (await storage.create_user("spill_user"))["id"]
+        await storage.save_charts([_chart(i) for i in range(200)])
+        for i in range(200):
+            await storage.add_reading({
+                "id": f"r{i}", "user_id": user_id, "spread_type": "three",
+                "cards": [{"name": "The Fool", "reversed": i % 2 == 0}],
+                "created_at": START + timedelta(minutes=i)
+            })
+        stats = storage.memory_stats()
+        assert stats["charts"]["spilled"] > 0 and stats["readings"]["spilled"] > 0
+        assert stats["charts"]["resident_bytes"] <= 0.01 * 1024 * 1024
+
+        assert (await storage.get_chart("c0")).positions[0] == 0.0
+        page = await storage.readings_page(user_id, limit=5)
+        assert [r["id"] for r in page.values] == ["r0", "r1", "r2", "r3", "r4"]
+        assert storage.memory_stats()["readings"]["faults"] >= 5
+        await storage.close()
+
+        # Restart from the snapshot, within the budget again
+        storage = MemoryStorage(
+            ledger_dir=str(tmp_path), memory_budgets={"charts": 0.01, "readings": 0.01}
+        )
+        await storage.open()
+        assert isinstance(storage.db["charts"], SpillingDict)
+        assert len(storage.db["charts"]) == 200 and storage.memory_stats()["charts"]["spilled"] > 0
+        assert (await storage.get_chart("c199")).positions[0] == 199.0
+        assert len((await storage.readings_page(user_id)).values) == 200
+        await storage.close()
+    asyncio.run(body())
+
+def test_snapshot_streams_spilled_rows(tmp_path):
+    table = SpillingDict(str(tmp_path / "spill.sqlite"), budget=1000, sizeof=lambda value: 100)
+    for i in range(50):
+        table[f"k{i}"] = {"n": i}
+    before = table.stats()
+    snapshot = table.snapshot()
+    assert len(snapshot.resident) == before["resident"] and len(snapshot.spilled) == before["spilled"]
+    # Pickles as a plain dict of every row, without faulting rows back in
+    restored = pickle.loads(pickle.dumps(snapshot))
+    assert type(restored) is dict and restored == {f"k{i}": {"n": i} for i in range(50)}
+    assert table.stats() == before
+    table.close()
+
+def test_ledger_snapshot_keeps_memory_budget(tmp_path):
+    budget_mb = 0.01
+    async def body():
+        storage = MemoryStorage(ledger_dir=str(tmp_path), snapshot_rows=150, memory_budgets={"charts": budget_mb})
+        await storage.open()
+        for i in range(0, 300, 10):
+            await storage.save_charts([_chart(n) for n in range(i, i + 10)])
+            assert storage.memory_stats()["charts"]["resident_bytes"] <= budget_mb * 1024 * 1024
+        storage._snapshot_thread.join()
+        stats = storage.memory_stats()["charts"]
+        assert stats["spilled"] > 0 and stats["faults"] == 0
+        await storage.close()
+
+        storage = MemoryStorage(ledger_dir=str(tmp_path), memory_budgets={"charts": budget_mb})
+        await storage.open()
+        assert len(storage.db["charts"]) == 300
+        assert (await storage.get_chart("c7")).positions[0] == 7.0
+        await storage.close()
+    asyncio.run(body())
@@ -0,0 +1,274 @@
+"""Contract tests run against every storage backend.
+
+Postgres runs only when ``TEST_POSTGRES_URL`` points at a scratch database
+(its tables are emptied) and psycopg is installed.
+"""
+from array import array
+from datetime import datetime, timedelta
+import asyncio
+import os
+import sqlite3
+import pytest
+
+from app.indexes import OrderedIndex
+from app.records import ChartRecord
+from app.revenue import DAY, HOUR
+from app.storage import MemoryStorage, create_storage
+
+BACKENDS = ["memory", "ledger", "sqlite", "postgres"]
+START = datetime(2024, 5, 1, 9, 30)
+
+
+@pytest.fixture(params=BACKENDS)
+def run(request, tmp_path):
+    """Run an ``async def body(storage)`` against a fresh backend."""
+    if request.param == "memory":
+        factory = MemoryStorage
+    elif request.param == "ledger":
+        factory = lambda: MemoryStorage(ledger_dir=str(tmp_path / "ledger"))
+    elif request.param == "sqlite":
+        factory = lambda: create_storage(f"sqlite:///{tmp_path / 'tarot.db'}")
+    else:
+        url = os.environ.get("TEST_POSTGRES_URL")
+        if not url:
+            pytest.skip("TEST_POSTGRES_URL not set")
+        pytest.importorskip("psycopg_pool")
+        factory = lambda: create_storage(url)
+
+    def runner(body):
+        async def main():
+            storage = factory()
+            await storage.open()
+            try:
+                if request.param == "postgres":
+                    async with storage._session() as session:
+                        await session.execute(
+                            "TRUNCATE users, charts, readings, transactions, revenue"
+                        )
+                return await body(storage)
+            finally:
+                await storage.close()
+        return asyncio.run(main())
+
+    return runner
+
+
+def test_users(run):
+    async def body(storage):
+        user = await storage.create_user("Storage_Anna")
+        assert user["balance"] == 0 and user["purchased_products"] == []
+        assert (await storage.create_user("storage_anna"))["id"] == user["id"]
+        assert (await storage.get_user_by_username("STORAGE_ANNA"))["id"] == user["id"]
+        assert await storage.get_user_by_username("nobody") is None
+        assert await storage.get_user(user["id"]) == user
+
+        # Racing signups for one name create one account
+        users = await asyncio.gather(*(storage.create_user("Storage_Ben") for _ in range(10)))
+        assert len({u["id"] for u in users}) == 1
+    run(body)
+
+def test_update_user_commits_or_rolls_back(run):
+    async def body(storage):
+        user_id = (await storage.create_user("storage_cleo"))["id"]
+        async with storage.update_user(user_id) as update:
+            update.user["balance"] += 500
+            update.user["purchased_products"].append("1")
+            update.add_transaction({
+                "id": "t1", "user_id": user_id, "amount": 500, "type": "payment",
+                "description": "top up", "created_at": START
+            })
+            update.add_revenue({"id": "r1", "source": "payment", "amount": 50.0, "created_at": START})
+
+        with pytest.raises(RuntimeError):
+            async with storage.update_user(user_id) as update:
+                update.user["balance"] -= 100
+                update.add_transaction({
+                    "id": "t2", "user_id": user_id, "amount": -100, "type": "purchase",
+                    "description": "rolled back", "created_at": START + HOUR
+                })
+                raise RuntimeError("abort")
+
+        user = await storage.get_user(user_id)
+        assert user["balance"] == 500
+        assert user["purchased_products"] == ["1"]
+        page = await storage.transactions_page(user_id)
+        assert [t["id"] for t in page.values] == ["t1"]
+        total, _ = await storage.revenue_summary(None, None, DAY)
+        assert total.amount("payment") == 50.0
+
+        async with storage.update_user("missing") as update:
+            assert update is None
+    run(body)
+
+def test_update_user_is_atomic_per_user(run):
+    async def body(storage):
+        user_ids = [(await storage.create_user(f"storage_race_{n}"))["id"] for n in range(4)]
+
+        async def top_up_or_spend(i):
+            user_id = user_ids[i % len(user_ids)]
+            amount = 7 if i % 3 else -10
+            async with storage.update_user(user_id) as update:
+                balance = update.user["balance"]
+                await asyncio.sleep(0)  # Let every other request in between check and change
+                if balance + amount < 0:
+                    return
+                update.user["balance"] = balance + amount
+                update.add_transaction({
+                    "id": f"race{i}", "user_id": user_id, "amount": amount,
+                    "type": "ad" if amount > 0 else "purchase",
+                    "description": "race", "created_at": START + timedelta(seconds=i)
+                })
+                if amount > 0:
+                    update.add_revenue({
+                        "id": f"race{i}", "source": "ad", "amount": 0.01,
+                        "created_at": START + timedelta(seconds=i)
+                    })
+
+        await asyncio.gather(*(top_up_or_spend(i) for i in range(600)))
+
+        top_ups = 0
+        for user_id in user_ids:
+            user = await storage.get_user(user_id)
+            amounts = [t["amount"] for t in (await storage.transactions_page(user_id)).values]
+            # No lost update and no double spend: the balance is its ledger
+            assert user["balance"] == sum(amounts) >= 0
+            assert any(amount < 0 for amount in amounts)
+            top_ups += sum(1 for amount in amounts if amount > 0)
+        total, _ = await storage.revenue_summary(None, None, DAY)
+        assert total.count == top_ups
+    run(body)
+
+def test_products_and_charts(run):
+    async def body(storage):
+        assert [p["id"] for p in await storage.list_products()] == ["1", "2"]
+        assert (await storage.get_product("1"))["price"] == 99
+        version = await storage.products_version()
+        await storage.save_product(dict(await storage.get_product("2"), price=59))
+        assert (await storage.get_product("2"))["price"] == 59
+        assert await storage.products_version() == version + 1
+
+        record = ChartRecord(
+            id="c1", date="1990-01-01", time="12:00", latitude=1.5, longitude=-2.5,
+            house_time="standard", house_system="Placidus",
+            positions=array('d', [float(i) for i in range(31)]), language="zh"
+        )
+        await storage.save_charts([record])
+        loaded = await storage.get_chart("c1")
+        assert loaded.to_response() == record.to_response() and loaded.language == "zh"
+
+        user_id = (await storage.create_user("storage_dora"))["id"]
+        async with storage.update_user(user_id) as update:
+            loaded.is_premium_unlocked = True
+            loaded.premium_interpretation = "premium"
+            update.save_chart(loaded)
+        loaded = await storage.get_chart("c1")
+        assert loaded.is_premium_unlocked and loaded.premium_interpretation == "premium"
+        assert loaded.language == "zh"
+        assert await storage.get_chart("missing") is None
+    run(body)
+
+def test_products_version_is_shared_by_workers(tmp_path):
+    async def body():
+        url = f"sqlite:///{tmp_path / 'tarot.db'}"
+        workers = [create_storage(url), create_storage(url)]
+        for storage in workers:
+            await storage.open()
+        version = await workers[1].products_version()
+        await workers[0].save_product(dict(await workers[0].get_product("1"), price=79))
+        assert await workers[1].products_version() == version + 1
+        for storage in workers:
+            await storage.close()
+    asyncio.run(body())
+
+def test_sqlite_adds_chart_language_to_older_databases(tmp_path):
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE charts (id TEXT PRIMARY KEY, date TEXT NOT NULL, time TEXT NOT NULL, "
+        "latitude REAL NOT NULL, longitude REAL NOT NULL, house_time TEXT NOT NULL, "
+        "house_system TEXT NOT NULL, positions BLOB NOT NULL, is_premium_unlocked BOOLEAN NOT NULL, "
+        "premium_interpretation TEXT)"
+    )
+    conn.execute(
+        "INSERT INTO charts VALUES ('old', '1990-01-01', '12:00', 1.5, -2.5, 'standard', 'Placidus', ?, 0, NULL)",
+        (array('d', [0.0] * 31).tobytes(),)
+    )
+    conn.commit()
+    conn.close()
+
+    async def body():
+        storage = create_storage(f"sqlite:///{path}")
+        await storage.open()
+        assert (await storage.get_chart("old")).language == "en"
+        await storage.close()
+    asyncio.run(body())
+
+def test_postgres_adds_chart_language_to_older_databases():
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL not set")
+    pytest.importorskip("psycopg_pool")
+
+    async def body():
+        storage = create_storage(url)
+        await storage.open()
+        async with storage._session() as session:
+            await session.execute("TRUNCATE charts")
+            await session.execute("ALTER TABLE charts DROP COLUMN language")
+            await session.execute(
+                "INSERT INTO charts (id, date, time, latitude, longitude, house_time, house_system, "
+                "positions, is_premium_unlocked) VALUES ('old', '1990-01-01', '12:00', 1.5, -2.5, "
+                "'standard', 'Placidus', %s, false)",
+                (array('d', [0.0] * 31).tobytes(),)
+            )
+        await storage.close()
+
+        storage = create_storage(url)
+        await storage.open()
+        assert (await storage.get_chart("old")).language == "en"
+        await storage.close()
+    asyncio.run(body())
+
+def test_pages_match_ordered_index(run):
+    async def body(storage):
+        user_id = (await storage.create_user("storage_emil"))["id"]
+        index = OrderedIndex()
+        # Same timestamps twice, so ids break ties
+        for i in range(24):
+            created_at = START + timedelta(minutes=i // 2)
+            reading = {
+                "id": f"r{i:02d}", "user_id": user_id, "spread_type": "three",
+                "cards": [{"n": i}], "created_at": created_at
+            }
+            await storage.add_reading(reading)
+            index.add((created_at, reading["id"]), reading)
+        keys = index.keys
+
+        for limit, before, after in [
+            (None, None, None), (5, None, None), (5, None, keys[4]), (5, keys[10], None),
+            (5, keys[12], keys[3]), (50, None, keys[20]), (None, keys[3], None), (5, None, keys[-1])
+        ]:
+            expected = index.page(limit, before, after)
+            page = await storage.readings_page(user_id, limit, before, after)
+            assert page == expected, (limit, before, after)
+    run(body)
+
+def test_revenue_summary(run):
+    async def body(storage):
+        user_id = (await storage.create_user("storage_fay"))["id"]
+        async with storage.update_user(user_id) as update:
+            for i in range(40):
+                update.add_revenue({
+                    "id": f"rev{i}", "source": ("ad", "payment", "purchase")[i % 3],
+                    "amount": 1.5, "created_at": START + timedelta(minutes=97 * i)
+                })
+        start, end = START + timedelta(minutes=200), START + timedelta(days=1, minutes=70)
+        total, buckets = await storage.revenue_summary(start, end, HOUR)
+        in_range = [i for i in range(40) if start <= START + timedelta(minutes=97 * i) <= end]
+        assert total.count == len(in_range)
+        assert total.amount("ad") == 1.5 * sum(1 for i in in_range if i % 3 == 0)
+        assert sum(b.count for _, b in buckets) == len(in_range)
+        assert [key for key, _ in buckets] == sorted(
+            {(START + timedelta(minutes=97 * i)).replace(minute=0) for i in in_range}
+        )
+    run(body)
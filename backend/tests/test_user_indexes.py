@@ -0,0 +1,129 @@
+"""Tests for the per-user and username indexes."""
+import asyncio
+import json
+from fastapi.testclient import TestClient
+
+from app.main import app, db, create_user, CreateUserRequest
+
+client = TestClient(app)
+
+
+def _user(name):
+    return client.post("/users", json={"username": name}).json()["id"]
+
+
+def test_readings_are_listed_per_user():
+    alice, bob = _user("index_alice"), _user("index_bob")
+    for i in range(3):
+        client.post(f"/readings/{alice}", json={"spread_type": f"spread{i}", "cards": []})
+    client.post(f"/readings/{bob}", json={"spread_type": "other", "cards": []})
+
+    readings = client.get(f"/readings/{alice}").json()
+    assert [r["spread_type"] for r in readings] == ["spread0", "spread1", "spread2"]
+    assert all(r["user_id"] == alice for r in readings)
+    assert len(client.get(f"/readings/{bob}").json()) == 1
+
+def test_every_write_path_indexes_transactions():
+    user_id, other = _user("index_carol"), _user("index_dave")
+    db["products"].setdefault("1", {
+        "id": "1", "name": "Deck", "description": "", "price": 99, "image": ""
+    })
+    client.post(f"/users/{other}/balance/add", params={"amount": 10, "source": "ad"})
+    client.post(f"/users/{user_id}/balance/add", params={"amount": 5000, "source": "payment"})
+    client.post(f"/users/{user_id}/balance/deduct", params={"amount": 100, "description": "tip"})
+    client.post("/products/1/purchase", json={"user_id": user_id, "product_id": "1"})
+    chart_id = client.post("/charts/create", json={
+        "birth_date": "1990-01-01",
+        "birth_time": "12:00",
+        "latitude": 40.7128,
+        "longitude": -74.0060,
+        "timezone": "America/New_York"
+    }).json()["id"]
+    client.post(f"/charts/{chart_id}/unlock-premium", json={"user_id": user_id})
+
+    transactions = client.get(f"/users/{user_id}/transactions").json()
+    assert [t["type"] for t in transactions] == ["payment", "purchase", "purchase", "premium_unlock"]
+    assert sum(t["amount"] for t in transactions) == client.get(f"/users/{user_id}").json()["balance"]
+    # The index returns exactly what a full scan would
+    assert len(transactions) == sum(1 for t in db["transactions"] if t["user_id"] == user_id)
+    assert len(client.get(f"/users/{other}/transactions").json()) == 1
+
+def test_usernames_are_unique_ignoring_case():
+    user = client.post("/users", json={"username": "Index_Erin"}).json()
+    assert client.post("/users", json={"username": "index_erin"}).json()["id"] == user["id"]
+    assert client.post("/users", json={"username": "ＩＮＤＥＸ_ＥＲＩＮ"}).json()["id"] == user["id"]
+    found = client.get("/users/by-username/INDEX_ERIN").json()
+    assert found["id"] == user["id"]
+    assert found["username"] == "Index_Erin"
+    assert client.get("/users/by-username/index_frank").status_code == 404
+
+def test_concurrent_signups_create_one_user():
+    """Signups racing on the same name all get the same user."""
+    async def signup_many():
+        return await asyncio.gather(*(
+            create_user(CreateUserRequest(username="Index_Grace")) for _ in range(20)
+        ))
+
+    users = asyncio.run(signup_many())
+    assert len({user["id"] for user in users}) == 1
+    assert sum(1 for u in db["users"].values() if u["username"] == "Index_Grace") == 1
+
+def _transactions(user_id, **params):
+    return client.get(f"/users/{user_id}/transactions", params=params)
+
+def test_cursor_pages_walk_the_history():
+    user_id = _user("index_heidi")
+    for amount in range(1, 26):
+        client.post(f"/users/{user_id}/balance/add", params={"amount": amount, "source": "ad"})
+
+    # Forwards with X-Next-Cursor
+    amounts, params = [], {"limit": 10}
+    while True:
+        response = _transactions(user_id, **params)
+        amounts += [t["amount"] for t in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 10, "after": response.headers["X-Next-Cursor"]}
+    assert amounts == list(range(1, 26))
+
+    # Backwards from the last page with X-Prev-Cursor
+    last = _transactions(user_id, limit=10, after=_transactions(user_id, limit=20).headers["X-Next-Cursor"])
+    assert [t["amount"] for t in last.json()] == list(range(21, 26))
+    previous = _transactions(user_id, limit=10, before=last.headers["X-Prev-Cursor"])
+    assert [t["amount"] for t in previous.json()] == list(range(11, 21))
+
+    assert len(_transactions(user_id).json()) == 25  # no limit: everything, as before
+    assert _transactions(user_id, after="not a cursor").status_code == 400
+    assert _transactions(user_id, limit=0).status_code == 422
+
+def test_ndjson_export():
+    user_id = _user("index_ivan")
+    for i in range(300):
+        client.post(f"/readings/{user_id}", json={"spread_type": f"spread{i}", "cards": [{"n": i}]})
+
+    response = client.get(f"/readings/{user_id}", params={"format": "ndjson"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.iter_lines()]
+    assert [r["spread_type"] for r in rows] == [f"spread{i}" for i in range(300)]
+    assert rows == client.get(f"/readings/{user_id}").json()
+
+    cursor = client.get(f"/readings/{user_id}", params={"limit": 250}).headers["X-Next-Cursor"]
+    rest = client.get(f"/readings/{user_id}", params={"format": "ndjson", "after": cursor})
+    assert len(list(rest.iter_lines())) == 50
+
+def test_ndjson_export_honours_limit_and_cursors():
+    user_id = _user("index_jana")
+    for i in range(600):
+        client.post(f"/readings/{user_id}", json={"spread_type": f"spread{i}", "cards": [{"n": i}]})
+    first = client.get(f"/readings/{user_id}", params={"limit": 100})
+    last = client.get(f"/readings/{user_id}", params={"limit": 100, "after": first.headers["X-Next-Cursor"]})
+    after, before = first.headers["X-Next-Cursor"], last.headers["X-Next-Cursor"]
+
+    for params in [
+        {"limit": 300}, {"limit": 300, "after": after}, {"after": after, "before": before},
+        {"limit": 50, "after": after, "before": before}, {"before": before}, {"limit": 30, "before": before}
+    ]:
+        export = client.get(f"/readings/{user_id}", params=dict(params, format="ndjson"))
+        rows = [json.loads(line) for line in export.iter_lines()]
+        assert rows == client.get(f"/readings/{user_id}", params=params).json(), params
+    assert client.get(f"/readings/{user_id}", params={"format": "ndjson", "limit": 0}).status_code == 422